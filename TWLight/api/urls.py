@@ -7,6 +7,10 @@ urlpatterns = [
         r"^(?P<version>(v0))/users/authorizations/partner/(?P<pk>\d+)/$",
         views.AuthorizedUsers.as_view(),
     ),
+    re_path(
+        r"^(?P<version>(v0))/users/eligibility/$",
+        views.BatchUserEligibility.as_view(),
+    ),
     re_path(
         r"^(?P<version>(v0))/users/eligibility/(?P<wp_username>[\w\s\S]+)/$",
         views.UserEligibility.as_view(),
@@ -38,7 +38,7 @@ from jsonschema import validate
 from jsonschema.exceptions import ValidationError as JSONSchemaValidationError
 
 from TWLight.resources.models import Partner
-from TWLight.users.groups import get_coordinators
+from TWLight.users.groups import get_user_groups
 from TWLight.users.models import Editor, Authorization
 
 from .helpers import (
@@ -254,7 +254,7 @@ class ApplicationAutocomplete(forms.ModelForm):
                 "company_name"
             )
 
-        elif get_coordinators() in user.groups.all():
+        elif get_user_groups(user).is_coordinator:
             self.fields["editor"].queryset = Editor.objects.filter(
                 applications__partner__coordinator__pk=user.pk
             ).order_by("wp_username")
@@ -1,10 +1,26 @@
+import csv
+import logging
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+
 from django import forms
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.timezone import localtime, now
 from django.utils.translation import gettext_lazy as _
+from reversion import revisions as reversion
 
-from TWLight.resources.models import Partner
+from TWLight.resources.models import AccessCode, Partner
+from TWLight.users.helpers.authorizations import bump_partner_authorizations_version
+from TWLight.users.models import Authorization
 
 from .models import Application
 
+logger = logging.getLogger(__name__)
+
 """
 Lists and characterizes the types of information that partners can require as
 part of access grants. See full comment at end of file and docs at
@@ -148,14 +164,229 @@ def get_output_for_application(app):
     return output
 
 
+# Rows fetched from the database per round trip while exporting send data.
+SEND_DATA_EXPORT_CHUNK_SIZE = 500
+
+
+class _Echo:
+    """A write-only file object that hands back what's written to it."""
+
+    def write(self, value):
+        return value
+
+
+# Spreadsheets read cells starting with these as formulas.
+SPREADSHEET_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _spreadsheet_safe(value):
+    """
+    Stops text that editors typed in from being run as a formula when
+    partners open the export in a spreadsheet, by prefixing it with '.
+    """
+    if isinstance(value, str) and value.startswith(SPREADSHEET_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_send_data_rows(applications, delimiter=","):
+    """
+    Generates delimited rows holding the same data as the send to partner
+    page, one application at a time, so large exports can be streamed. Text
+    that a spreadsheet would read as a formula is escaped.
+
+    Parameters
+    ----------
+    applications : QuerySet
+        The applications to export, all for the same partner. Select the
+        related editor, user and partner, or every row costs extra queries.
+    delimiter : str
+        "," for CSV, or "\t" for TSV.
+
+    Returns
+    -------
+    generator
+        Yields str rows, starting with a header row.
+    """
+    writer = csv.writer(_Echo(), delimiter=delimiter)
+    header = [
+        # Translators: This labels the column holding application IDs in the spreadsheet coordinators download with application data.
+        _("Application"),
+        # Translators: This labels the column holding Wikipedia usernames in the spreadsheet coordinators download with application data.
+        _("Username"),
+    ]
+    header_written = False
+    for app in applications.iterator(chunk_size=SEND_DATA_EXPORT_CHUNK_SIZE):
+        # Every application is to the same partner, so requires the same data.
+        output = get_output_for_application(app)
+        if not header_written:
+            header += [send_data["label"] for send_data in output.values()]
+            yield writer.writerow([str(label) for label in header])
+            header_written = True
+        yield writer.writerow(
+            [app.pk]
+            + [
+                _spreadsheet_safe(value)
+                for value in [app.editor.wp_username]
+                + [send_data["data"] for send_data in output.values()]
+            ]
+        )
+    if not header_written:
+        yield writer.writerow([str(label) for label in header])
+
+
+# The capacity snapshot is dropped whenever authorizations or applications
+# change (see applications/signals.py), so this timeout is only a backstop.
+PARTNER_CAPACITY_CACHE_TIMEOUT = 60 * 60
+
+
+def _partner_capacity_cache_key():
+    # Authorizations lapse at midnight without anything being saved.
+    return "partner_capacity_{today}".format(today=date.today().isoformat())
+
+
+def invalidate_partner_capacity():
+    cache.delete(_partner_capacity_cache_key())
+
+
+def _count_per_partner(queryset, partner_field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{partner_field: OuterRef("pk")})
+            .order_by()
+            .values(partner_field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def get_partner_capacity():
+    """
+    A snapshot of account capacity for every partner that limits the number
+    of accounts available, computed in a single query and cached until an
+    authorization or application changes. Waitlist transitions, approval
+    limits and the warnings shown on applications all read from this.
+
+    Returns
+    -------
+    dict
+        Maps partner pk to a dict with the partner's "status",
+        "authorization_method", "accounts_available", "valid_authorizations",
+        "pending_applications" and "available_for_distribution". Partners
+        that don't limit accounts aren't included.
+    """
+    cache_key = _partner_capacity_cache_key()
+    capacity = cache.get(cache_key)
+    if capacity is not None:
+        return capacity
+
+    today = date.today()
+    # This filter *must* be kept in sync with Partner.get_valid_authorizations
+    # and the Authorization.is_valid property.
+    valid_authorizations = Authorization.objects.filter(
+        Q(date_expires__isnull=False, date_expires__gte=today)
+        | Q(date_expires__isnull=True),
+        authorizer__isnull=False,
+        user__isnull=False,
+        date_authorized__isnull=False,
+        date_authorized__lte=today,
+    )
+    pending_applications = Application.objects.filter(
+        status__in=[Application.PENDING, Application.QUESTION]
+    )
+    partners = (
+        Partner.even_not_available.filter(accounts_available__isnull=False)
+        .annotate(
+            valid_authorizations=_count_per_partner(valid_authorizations, "partners"),
+            pending_applications=_count_per_partner(pending_applications, "partner"),
+        )
+        .values(
+            "pk",
+            "status",
+            "authorization_method",
+            "accounts_available",
+            "valid_authorizations",
+            "pending_applications",
+        )
+    )
+    capacity = {}
+    for partner in partners:
+        partner["available_for_distribution"] = (
+            partner["accounts_available"] - partner["valid_authorizations"]
+        )
+        capacity[partner.pop("pk")] = partner
+
+    cache.set(cache_key, capacity, PARTNER_CAPACITY_CACHE_TIMEOUT)
+    return capacity
+
+
 def get_accounts_available(app):
     """
     Because we allow number of accounts available on the partner level,
     we base our calculations on the partner level.
     """
-    if app.partner.accounts_available is not None:
-        valid_authorizations = app.partner.get_valid_authorization_count
-        return app.partner.accounts_available - valid_authorizations
+    capacity = get_partner_capacity().get(app.partner_id)
+    if capacity is not None:
+        return capacity["available_for_distribution"]
+
+
+def get_accounts_available_by_partner(partner_pks):
+    """
+    Bulk version of get_accounts_available().
+
+    Parameters
+    ----------
+    partner_pks : list
+        Primary keys of the partners to check.
+
+    Returns
+    -------
+    dict
+        Maps partner pk to the number of accounts still available for
+        distribution, or None if the partner doesn't limit accounts.
+    """
+    capacity = get_partner_capacity()
+    return {
+        pk: capacity[pk]["available_for_distribution"] if pk in capacity else None
+        for pk in partner_pks
+    }
+
+
+def update_proxy_partner_waitlists():
+    """
+    Waitlist proxy partners that have no accounts left to distribute, and
+    take partners off the waitlist once accounts free up.
+
+    Returns
+    -------
+    None
+    """
+    capacity = get_partner_capacity()
+    for partner_pk, partner in capacity.items():
+        if partner["authorization_method"] != Partner.PROXY:
+            continue
+        available = partner["available_for_distribution"]
+        if partner["status"] == Partner.WAITLIST and available > 0:
+            new_status = Partner.AVAILABLE
+        elif partner["status"] == Partner.AVAILABLE and available <= 0:
+            new_status = Partner.WAITLIST
+        else:
+            continue
+        # Saving through the model keeps the partner save signals, which
+        # also notify waitlisted applicants.
+        each_partner = Partner.even_not_available.get(pk=partner_pk)
+        each_partner.status = new_status
+        each_partner.save()
+        logger.info(
+            "Partner {name} is {action}".format(
+                name=each_partner.company_name,
+                action=(
+                    "unwaitlisted" if new_status == Partner.AVAILABLE else "waitlisted"
+                ),
+            )
+        )
 
 
 def is_proxy_and_application_approved(status, app):
@@ -169,22 +400,445 @@ def is_proxy_and_application_approved(status, app):
 
 
 def more_applications_than_accounts_available(app):
-    total_accounts_available_for_distribution = get_accounts_available(app)
-    if total_accounts_available_for_distribution is not None and app.status in [
-        Application.PENDING,
-        Application.QUESTION,
-    ]:
-        total_pending_apps = Application.objects.filter(
-            partner=app.partner, status__in=[Application.PENDING, Application.QUESTION]
+    if app.status not in [Application.PENDING, Application.QUESTION]:
+        return False
+    # Read one snapshot, which may be rebuilt between calls.
+    capacity = get_partner_capacity().get(app.partner_id)
+    if capacity is None:
+        return False
+    total_accounts_available_for_distribution = capacity["available_for_distribution"]
+    total_pending_apps = capacity["pending_applications"]
+    return (
+        app.partner.status != Partner.WAITLIST
+        and total_accounts_available_for_distribution > 0
+        and total_accounts_available_for_distribution - total_pending_apps < 0
+    )
+
+
+def batch_update_application_status(application_pks, status, user):
+    """
+    Set the status of many applications at once, as done by coordinators from
+    the application list. Applications, partner capacity and the editors'
+    authorizations are loaded up front, and every change is written in bulk,
+    in a single transaction and revision.
+
+    This stands in for saving each application. What the save signals would
+    do happens here, for the whole batch: closing dates are set, instantly
+    finalized applications go straight to SENT, sent applications grant
+    authorizations through grant_authorization_for_sent_application(), and
+    the approval and rejection emails go out in one batch once the
+    transaction commits.
+
+    Approvals for proxy partners are refused if the partner is waitlisted,
+    or if approving all of them would hand out more accounts than the
+    partner has available.
+
+    Parameters
+    ----------
+    application_pks : list
+        Primary keys of the applications to update. Unknown keys are ignored.
+    status : int
+        The status to set.
+    user : User
+        The coordinator making the change.
+
+    Returns
+    -------
+    tuple
+        Lists of the updated application pks, the application pks that
+        couldn't be approved, and the pks of partners that have no accounts
+        left once these approvals go through.
+    """
+    # Imported here to avoid a circular import; the signals module imports
+    # this one.
+    from .signals import ApplicationStatus
+
+    applications = Application.objects.select_related(
+        "partner", "editor__user__userprofile"
+    ).in_bulk(application_pks)
+    # Keep the order in which applications were posted.
+    applications = [
+        applications[pk] for pk in dict.fromkeys(application_pks) if pk in applications
+    ]
+
+    # Count the applications to be approved for each proxy partner, so we can
+    # check them against the accounts each partner has available.
+    applications_per_partner = {}
+    for app in applications:
+        if is_proxy_and_application_approved(status, app):
+            applications_per_partner[app.partner_id] = (
+                applications_per_partner.get(app.partner_id, 0) + 1
+            )
+
+    accounts_available = get_accounts_available_by_partner(
+        list(applications_per_partner)
+    )
+    partners_distribution_flag = {}
+    # Partners that'll run out of accounts once we approve all the applications.
+    waitlist_partner_pks = []
+    for partner_pk, app_count in applications_per_partner.items():
+        available = accounts_available.get(partner_pk)
+        partners_distribution_flag[partner_pk] = (
+            available is None or app_count <= available
+        )
+        if available is not None and app_count == available:
+            waitlist_partner_pks.append(partner_pk)
+
+    batch_update_success = []
+    batch_update_failed = []
+    with transaction.atomic(), reversion.create_revision():
+        reversion.set_user(user)
+        today = localtime(now()).date()
+        updated_applications = []
+        sent_applications = []
+        approved_applications = []
+        rejected_applications = []
+        for app in applications:
+            if is_proxy_and_application_approved(status, app):
+                if (
+                    app.partner.status == Partner.WAITLIST
+                    or not partners_distribution_flag[app.partner_id]
+                ):
+                    batch_update_failed.append(app.pk)
+                    continue
+                app.sent_by = user
+            elif (
+                status == Application.APPROVED and app.is_instantly_finalized()
+            ) or status == Application.SENT:
+                app.sent_by = user
+
+            if app.status != status:
+                if status == Application.APPROVED:
+                    approved_applications.append(app)
+                elif status == Application.NOT_APPROVED:
+                    rejected_applications.append(app)
+            if (
+                app.status not in Application.FINAL_STATUS_LIST
+                and status in Application.FINAL_STATUS_LIST
+                and not app.date_closed
+            ):
+                app.date_closed = today
+                app.days_open = (app.date_closed - app.date_created).days
+            app.status = status
+            if status == Application.APPROVED and app.is_instantly_finalized():
+                app.status = Application.SENT
+            # A rejected renewal no longer renews its parent.
+            if app.status == Application.NOT_APPROVED and app.parent_id:
+                app.parent = None
+            if app.status == Application.SENT:
+                sent_applications.append(app)
+            updated_applications.append(app)
+            batch_update_success.append(app.pk)
+
+        Application.objects.bulk_update(
+            updated_applications,
+            ["status", "sent_by", "date_closed", "days_open", "parent"],
+        )
+        for app in updated_applications:
+            reversion.add_to_revision(app)
+        _grant_authorizations_for_sent_applications(sent_applications)
+        # Bulk writes skip the signal that keeps this cache fresh.
+        invalidate_partner_capacity()
+
+        if approved_applications or rejected_applications:
+            transaction.on_commit(
+                lambda: ApplicationStatus.batch_updated.send(
+                    sender=batch_update_application_status,
+                    approved=approved_applications,
+                    rejected=rejected_applications,
+                )
+            )
+
+    return batch_update_success, batch_update_failed, waitlist_partner_pks
+
+
+def _grant_authorizations_for_sent_applications(applications):
+    """
+    Create or update the authorizations granted by a batch of sent
+    applications, as post_revision_commit does for each saved application.
+    """
+    if not applications:
+        return
+    authorizations = {}
+    for authorization_partner in Authorization.partners.through.objects.select_related(
+        "authorization"
+    ).filter(
+        authorization__user__in=[app.editor.user_id for app in applications],
+        partner__in=[app.partner_id for app in applications],
+    ):
+        authorizations.setdefault(
+            (
+                authorization_partner.authorization.user_id,
+                authorization_partner.partner_id,
+            ),
+            [],
+        ).append(authorization_partner.authorization)
+
+    new_authorizations = []
+    updated_authorizations = []
+    for app in applications:
+        key = (app.editor.user_id, app.partner_id)
+        existing_authorizations = authorizations.get(key, [])
+        if len(existing_authorizations) > 1:
+            logger.error(
+                "Found more than one authorization object for "
+                "{user} - {partner}".format(user=app.user, partner=app.partner)
+            )
+            continue
+        if existing_authorizations:
+            authorization = existing_authorizations[0]
+            updated_authorizations.append(authorization)
+        else:
+            authorization = Authorization()
+            new_authorizations.append((authorization, app.partner_id))
+            # Another application in the batch to the same partner updates
+            # this one.
+            authorizations[key] = [authorization]
+        grant_authorization_for_sent_application(authorization, app, app.sent_by)
+
+    Authorization.objects.bulk_update(
+        set(updated_authorizations),
+        ["user", "authorizer", "date_expires", "reminder_email_sent"],
+    )
+    # Not every MySQL version can hand back primary keys from a bulk insert,
+    # and we need them to link partners, so new authorizations are saved one
+    # at a time.
+    for authorization, _ in new_authorizations:
+        authorization.save()
+    Authorization.partners.through.objects.bulk_create(
+        [
+            Authorization.partners.through(
+                authorization_id=authorization.pk, partner_id=partner_pk
+            )
+            for authorization, partner_pk in new_authorizations
+        ]
+    )
+
+    # Bulk writes skip the signals that keep these caches fresh.
+    bump_partner_authorizations_version({app.partner_id for app in applications})
+    for app in applications:
+        app.editor.user.userprofile.delete_my_library_cache()
+
+
+def grant_authorization_for_sent_application(authorization, application, authorizer):
+    """
+    Fills in the authorization that sending an application grants: who it's
+    for, who authorized it and when it expires. Shared by post_revision_commit
+    and distribute_access_codes(), which save the authorization themselves.
+
+    Parameters
+    ----------
+    authorization : Authorization
+        The editor's existing authorization to the partner, or a new one.
+    application : Application
+        The application being sent.
+    authorizer : User
+        The coordinator sending the application.
+
+    Returns
+    -------
+    None
+    """
+    partner = application.partner
+    authorization.user = application.user
+    authorization.authorizer = authorizer
+
+    # If this is a proxy partner, and the requested_access_duration
+    # field is set to false, set (or reset) the expiry date
+    # to one year from now
+    if (
+        partner.authorization_method == Partner.PROXY
+        and application.requested_access_duration is None
+    ):
+        authorization.date_expires = date.today() + timedelta(days=365)
+    # If this is a proxy partner, and the requested_access_duration
+    # field is set to true, set (or reset) the expiry date
+    # to 1, 3, 6 or 12 months from today based on user input
+    elif (
+        partner.authorization_method == Partner.PROXY
+        and partner.requested_access_duration is True
+    ):
+        authorization.date_expires = date.today() + relativedelta(
+            months=application.requested_access_duration
+        )
+    # Alternatively, if this partner has a specified account_length,
+    # we'll use that to set the expiry.
+    elif partner.account_length:
+        # account_length should be a timedelta
+        authorization.date_expires = date.today() + partner.account_length
+
+    # If we just finalised a renewal, reset reminder_email_sent
+    # so that we can send further reminders.
+    if application.parent_id:
+        authorization.reminder_email_sent = False
+
+
+# Per-application outcomes reported by distribute_access_codes().
+ACCESS_CODE_SENT = "sent"
+ACCESS_CODE_INVALID_APPLICATION = "invalid_application"
+ACCESS_CODE_UNAVAILABLE = "code_unavailable"
+ACCESS_CODE_DUPLICATE = "duplicate"
+ACCESS_CODE_AUTHORIZATION_CONFLICT = "authorization_conflict"
+
+
+def distribute_access_codes(partner, assignments, user):
+    """
+    Send access codes to the editors of open applications, marking the
+    applications as sent. The selected applications, codes and existing
+    authorizations are locked and loaded up front, checked in memory, and
+    everything is written in one transaction, so either every valid
+    assignment goes through or none do.
+
+    This stands in for saving each application: the authorization that
+    post_revision_commit would create is created or updated here, through the
+    same grant_authorization_for_sent_application(), and the access code
+    emails are sent in one batch once the transaction commits.
+
+    Parameters
+    ----------
+    partner : Partner
+        The access code partner the applications were made to.
+    assignments : list
+        (application pk, access code) pairs, in the order the coordinator
+        submitted them.
+    user : User
+        The coordinator sending the codes.
+
+    Returns
+    -------
+    dict
+        Maps each application pk to one of the ACCESS_CODE_* outcomes.
+    """
+    # Imported here to avoid a circular import; the signals module imports
+    # this one.
+    from .signals import AccessCodes
+
+    outcomes = {}
+    with transaction.atomic(), reversion.create_revision():
+        reversion.set_user(user)
+        applications = (
+            Application.objects.select_for_update()
+            .select_related("editor__user__userprofile")
+            .filter(
+                partner=partner,
+                editor__isnull=False,
+                pk__in=[app_pk for app_pk, _ in assignments],
+            )
+            .exclude(status__in=[Application.NOT_APPROVED, Application.SENT])
+            .in_bulk()
         )
-        if (
-            app.partner.status != Partner.WAITLIST
-            and total_accounts_available_for_distribution > 0
-            and total_accounts_available_for_distribution - total_pending_apps.count()
-            < 0
+        access_codes = {}
+        for access_code in AccessCode.objects.select_for_update().filter(
+            partner=partner,
+            authorization__isnull=True,
+            code__in=[code for _, code in assignments],
+        ):
+            access_codes.setdefault(access_code.code, access_code)
+        authorizations = {}
+        for authorization in (
+            Authorization.objects.select_for_update()
+            .select_related("accesscodes")
+            .filter(
+                partners=partner,
+                user__in=[app.editor.user_id for app in applications.values()],
+            )
         ):
-            return True
-    return False
+            authorizations.setdefault(authorization.user_id, []).append(authorization)
+
+        today = localtime(now()).date()
+        sent_applications = []
+        new_authorizations = []
+        updated_authorizations = []
+        assigned_codes = []
+        replaced_code_pks = []
+        used_codes = set()
+        for app_pk, code in assignments:
+            app = applications.get(app_pk)
+            if app is None or app_pk in outcomes:
+                outcomes.setdefault(app_pk, ACCESS_CODE_INVALID_APPLICATION)
+                continue
+            if code in used_codes:
+                outcomes[app_pk] = ACCESS_CODE_DUPLICATE
+                continue
+            if code not in access_codes:
+                outcomes[app_pk] = ACCESS_CODE_UNAVAILABLE
+                continue
+            existing_authorizations = authorizations.get(app.editor.user_id, [])
+            if len(existing_authorizations) > 1:
+                logger.error(
+                    "Found more than one authorization object for "
+                    "{user} - {partner}".format(user=app.user, partner=partner)
+                )
+                outcomes[app_pk] = ACCESS_CODE_AUTHORIZATION_CONFLICT
+                continue
+            used_codes.add(code)
+
+            app.status = Application.SENT
+            app.sent_by = user
+            if not app.date_closed:
+                app.date_closed = today
+                app.days_open = (app.date_closed - app.date_created).days
+            sent_applications.append(app)
+
+            if existing_authorizations:
+                authorization = existing_authorizations[0]
+                # Renewals get a new code; the old one goes away.
+                if hasattr(authorization, "accesscodes"):
+                    replaced_code_pks.append(authorization.accesscodes.pk)
+                updated_authorizations.append(authorization)
+            else:
+                authorization = Authorization()
+                new_authorizations.append(authorization)
+            # Every application here is to this partner; saves a query each.
+            app.partner = partner
+            grant_authorization_for_sent_application(authorization, app, user)
+
+            access_code = access_codes[code]
+            access_code.partner = partner
+            access_code.authorization = authorization
+            assigned_codes.append(access_code)
+            outcomes[app_pk] = ACCESS_CODE_SENT
+
+        Application.objects.bulk_update(
+            sent_applications, ["status", "sent_by", "date_closed", "days_open"]
+        )
+        for app in sent_applications:
+            reversion.add_to_revision(app)
+        Authorization.objects.bulk_update(
+            updated_authorizations,
+            ["authorizer", "date_expires", "reminder_email_sent"],
+        )
+        # Not every MySQL version can hand back primary keys from a bulk
+        # insert, and we need them to link partners and codes, so new
+        # authorizations are saved one at a time.
+        for authorization in new_authorizations:
+            authorization.save()
+        Authorization.partners.through.objects.bulk_create(
+            [
+                Authorization.partners.through(
+                    authorization_id=authorization.pk, partner_id=partner.pk
+                )
+                for authorization in new_authorizations
+            ]
+        )
+        AccessCode.objects.filter(pk__in=replaced_code_pks).delete()
+        AccessCode.objects.bulk_update(assigned_codes, ["authorization"])
+
+        # Bulk writes skip the signals that keep these caches fresh.
+        bump_partner_authorizations_version([partner.pk])
+        invalidate_partner_capacity()
+        for app in sent_applications:
+            app.editor.user.userprofile.delete_my_library_cache()
+
+        # The emails go out once the codes are committed, so editors are
+        # never sent a code that was rolled back.
+        transaction.on_commit(
+            lambda: AccessCodes.assigned.send(
+                sender=distribute_access_codes, access_codes=assigned_codes
+            )
+        )
+
+    return outcomes
 
 
 def get_application_field_params_json_schema():
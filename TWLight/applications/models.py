@@ -8,6 +8,8 @@ from reversion.models import Version
 from django.contrib.auth.models import User
 from django.urls import reverse_lazy
 from django.db import models
+from django.db.models import CharField, Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce
 from django.forms.models import model_to_dict
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
@@ -18,7 +20,39 @@ from TWLight.users.models import Editor, Authorization
 logger = logging.getLogger(__name__)
 
 
-class ValidApplicationsManager(models.Manager):
+class ApplicationQuerySet(models.QuerySet):
+    def for_coordinator_list(self):
+        """
+        Annotate everything the application list templates show for each
+        application, so that rendering a page of them doesn't query
+        reversion and the renewal status once per row. The model methods
+        that display these use the annotations when they're present.
+        """
+        versions = Version.objects.get_for_model(Application).filter(
+            object_id=Cast(OuterRef("pk"), output_field=CharField())
+        )
+        latest_version = versions.order_by("-pk")
+        return self.select_related("partner", "editor__user__userprofile").annotate(
+            version_count=Coalesce(
+                Subquery(
+                    versions.order_by()
+                    .values("object_id")
+                    .annotate(count=Count("pk"))
+                    .values("count")
+                ),
+                0,
+            ),
+            latest_reviewer=Subquery(
+                latest_version.values("revision__user__editor__wp_username")[:1]
+            ),
+            latest_review_date=Subquery(
+                latest_version.values("revision__date_created")[:1]
+            ),
+            has_renewal=Exists(Application.objects.filter(parent=OuterRef("pk"))),
+        )
+
+
+class ValidApplicationsManager(models.Manager.from_queryset(ApplicationQuerySet)):
     """
     This custom model manager excludes applications marked 'invalid' from querysets by default.
     """
@@ -39,7 +73,7 @@ class Application(models.Model):
         ordering = ["-date_created", "editor", "partner"]
 
     # Managers defined here
-    include_invalid = models.Manager()
+    include_invalid = ApplicationQuerySet.as_manager()
     objects = ValidApplicationsManager()
 
     PENDING = 0
@@ -239,6 +273,8 @@ class Application(models.Model):
             return None
 
     def get_version_count(self):
+        if hasattr(self, "version_count"):
+            return self.version_count
         try:
             return len(Version.objects.get_for_object(self))
         except TypeError:
@@ -263,6 +299,8 @@ class Application(models.Model):
             return None
 
     def get_latest_reviewer(self):
+        if hasattr(self, "latest_reviewer"):
+            return self.latest_reviewer
         revision = self.get_latest_revision()
 
         if revision:
@@ -274,6 +312,8 @@ class Application(models.Model):
             return None
 
     def get_latest_review_date(self):
+        if hasattr(self, "latest_review_date"):
+            return self.latest_review_date
         revision = self.get_latest_revision()
 
         if revision:
@@ -371,9 +411,13 @@ class Application(models.Model):
         Apps are eligible for renewal if they are approved/sent and have not already
         been renewed.
         """
+        if hasattr(self, "has_renewal"):
+            has_renewal = self.has_renewal
+        else:
+            has_renewal = Application.objects.filter(parent=self).exists()
         return all(
             [
-                not bool(Application.objects.filter(parent=self)),
+                not has_renewal,
                 self.status in [self.APPROVED, self.SENT],
                 self.partner.renewals_available,
             ]
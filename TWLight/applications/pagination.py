@@ -0,0 +1,171 @@
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# The total count is cached for this long, so staleness only shows up as a
+# slightly-off page count. Pages themselves are always read fresh.
+KEYSET_CACHE_TIMEOUT = 5 * 60
+
+
+class KeysetPaginator(Paginator):
+    """
+    A Paginator that seeks to each page on its ordering keys, rather than
+    using OFFSET. The keys of the last row on a page are handed back as
+    page.next_after, for the link to the next page, and the keys of the
+    first row as page.previous_before, for the link to the previous page;
+    fetching a page after or before them is a range scan no matter how deep
+    the page is, and always starts right next to the rows the user saw,
+    whatever has changed since. The last page is read backwards from the
+    end. The total count is cached, so it isn't recomputed over the full
+    queryset on every page view.
+
+    Jumping straight to any other page without those keys costs one OFFSET
+    scan over the narrow key columns, so links to page numbers should stay
+    near the start of the list.
+
+    The keys must uniquely order the queryset (end them with "pk"), and must
+    not be nullable.
+    """
+
+    def __init__(self, object_list, per_page, keys, **kwargs):
+        self.keys = keys
+        self.key_fields = [key.lstrip("-") for key in keys]
+        self.reversed_keys = [
+            key[1:] if key.startswith("-") else "-" + key for key in keys
+        ]
+        super().__init__(object_list.order_by(*keys), per_page, **kwargs)
+
+    @cached_property
+    def count_cache_key(self):
+        try:
+            sql = str(self.object_list.query)
+        except EmptyResultSet:
+            sql = ""
+        return "keyset_paginator_{digest}:count".format(
+            digest=hashlib.md5(sql.encode("utf-8")).hexdigest()
+        )
+
+    @cached_property
+    def count(self):
+        return cache.get_or_set(
+            self.count_cache_key, self.object_list.count, KEYSET_CACHE_TIMEOUT
+        )
+
+    def encode_keys(self, boundary):
+        """Turns a row's keys into a string for use in a URL."""
+        return (
+            base64.urlsafe_b64encode(
+                json.dumps(list(boundary), cls=DjangoJSONEncoder).encode("utf-8")
+            )
+            .decode("ascii")
+            .rstrip("=")
+        )
+
+    def decode_keys(self, after):
+        """
+        Turns a string from encode_keys() back into keys, or None if it
+        isn't one.
+        """
+        try:
+            boundary = json.loads(
+                base64.urlsafe_b64decode(after + "=" * (-len(after) % 4))
+            )
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(boundary, list) or len(boundary) != len(self.keys):
+            return None
+        return tuple(boundary)
+
+    def _seek_filter(self, boundary, keys=None):
+        """
+        Build a filter for rows that sort after the boundary, e.g. for keys
+        (a, b, pk): a > x OR (a = x AND b > y) OR (a = x AND b = y AND pk > z).
+        Pass reversed_keys for the rows that sort before it.
+        """
+        after = Q()
+        equal = Q()
+        for key, field, value in zip(keys or self.keys, self.key_fields, boundary):
+            lookup = "{field}__{op}".format(
+                field=field, op="lt" if key.startswith("-") else "gt"
+            )
+            after |= equal & Q(**{lookup: value})
+            equal &= Q(**{field: value})
+        return after
+
+    def _key_values(self, obj):
+        values = []
+        for field in self.key_fields:
+            value = obj
+            for attr in field.split("__"):
+                value = getattr(value, attr)
+            values.append(value)
+        return tuple(values)
+
+    def _get_boundary(self, number):
+        """Returns the keys of the last row before page number."""
+        bottom = (number - 1) * self.per_page
+        keys = list(self.object_list.values_list(*self.key_fields)[bottom - 1 : bottom])
+        if not keys:
+            return None
+        return tuple(keys[0])
+
+    def page(self, number, after=None, before=None):
+        """
+        Returns a page. after is the next_after of the page before it, and
+        before is the previous_before of the page after it, if the user got
+        here from there.
+        """
+        number = self.validate_number(number)
+        object_list = self.object_list
+        after = self.decode_keys(after) if after else None
+        before = self.decode_keys(before) if before else None
+        try:
+            if number == 1:
+                object_list = list(object_list[: self.per_page])
+            elif after is not None:
+                object_list = list(
+                    object_list.filter(self._seek_filter(after))[: self.per_page]
+                )
+            elif before is not None:
+                object_list = self._read_backwards(
+                    object_list.filter(self._seek_filter(before, self.reversed_keys)),
+                    self.per_page,
+                )
+            elif number == self.num_pages:
+                object_list = self._read_backwards(
+                    object_list, self.count - (number - 1) * self.per_page
+                )
+            else:
+                boundary = self._get_boundary(number)
+                if boundary is None:
+                    # The cached count is ahead of the data; this page is empty.
+                    return self._finish_page([], number)
+                object_list = list(
+                    object_list.filter(self._seek_filter(boundary))[: self.per_page]
+                )
+        except (TypeError, ValueError, ValidationError):
+            # Keys that don't fit the fields, from a hand-edited URL.
+            return self.page(number)
+        return self._finish_page(object_list, number)
+
+    def _read_backwards(self, object_list, limit):
+        """Returns the last limit rows of object_list, in order."""
+        object_list = list(object_list.order_by(*self.reversed_keys)[:limit])
+        object_list.reverse()
+        return object_list
+
+    def _finish_page(self, object_list, number):
+        page = self._get_page(object_list, number, self)
+        if object_list:
+            page.next_after = self.encode_keys(self._key_values(object_list[-1]))
+            page.previous_before = self.encode_keys(self._key_values(object_list[0]))
+        else:
+            page.next_after = page.previous_before = ""
+        return page
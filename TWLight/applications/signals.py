@@ -1,17 +1,20 @@
-from datetime import date, datetime, timedelta
-from dateutil.relativedelta import relativedelta
+from datetime import datetime
 import logging
 
 from TWLight.helpers import site_id
 from django.dispatch import receiver, Signal
 from django.db import transaction
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import m2m_changed, post_delete, pre_save, post_save
 from django_comments.signals import comment_was_posted
 from django_comments.models import Comment
 from django.contrib.auth.models import User
 from django.utils.timezone import localtime, now
 from django.utils.translation import gettext as _
 from TWLight.resources.models import Partner
+from TWLight.applications.helpers import (
+    grant_authorization_for_sent_application,
+    invalidate_partner_capacity,
+)
 from TWLight.applications.models import Application
 from TWLight.users.models import Authorization
 
@@ -28,18 +31,44 @@ logger = logging.getLogger(__name__)
 """
 The providing_args argument was deprecated, so it will be in comment form
 for documentation purposes
-providing_args=[
-    "app_status",
-    "app_count",
+providing_args=["reminders"]
+Each reminder is a dict with the keys:
+    "app_status_and_count",
     "coordinator_wp_username",
     "coordinator_email",
     "coordinator_lang",
-]
 """
 
 
 class Reminder(object):
-    coordinator_reminder = Signal()
+    coordinator_reminders = Signal()
+
+
+"""
+The providing_args argument was deprecated, so it will be in comment form
+for documentation purposes
+providing_args=["access_codes"]
+Sent once the access codes handed out by distribute_access_codes() have been
+committed, with the list of AccessCode objects.
+"""
+
+
+class AccessCodes(object):
+    assigned = Signal()
+
+
+"""
+The providing_args argument was deprecated, so it will be in comment form
+for documentation purposes
+providing_args=["approved", "rejected"]
+Sent once the status changes made by batch_update_application_status() have
+been committed, with lists of the Application objects that were approved and
+rejected.
+"""
+
+
+class ApplicationStatus(object):
+    batch_updated = Signal()
 
 
 @receiver(comment_was_posted)
@@ -157,9 +186,6 @@ def post_revision_commit(sender, instance, **kwargs):
             user=instance.user, partners=instance.partner
         )
 
-        authorized_user = instance.user
-        authorizer = instance.sent_by
-
         # In the case that there is no existing authorization, create a new one
         if existing_authorization.count() == 0:
             authorization = Authorization()
@@ -176,43 +202,12 @@ def post_revision_commit(sender, instance, **kwargs):
             )
             return
 
-        authorization.user = authorized_user
-        authorization.authorizer = authorizer
-
-        # If this is a proxy partner, and the requested_access_duration
-        # field is set to false, set (or reset) the expiry date
-        # to one year from now
-        if (
-            instance.partner.authorization_method == Partner.PROXY
-            and instance.requested_access_duration is None
-        ):
-            one_year_from_now = date.today() + timedelta(days=365)
-            authorization.date_expires = one_year_from_now
-        # If this is a proxy partner, and the requested_access_duration
-        # field is set to true, set (or reset) the expiry date
-        # to 1, 3, 6 or 12 months from today based on user input
-        elif (
-            instance.partner.authorization_method == Partner.PROXY
-            and instance.partner.requested_access_duration is True
-        ):
-            custom_expiry_date = date.today() + relativedelta(
-                months=instance.requested_access_duration
-            )
-            authorization.date_expires = custom_expiry_date
-        # Alternatively, if this partner has a specified account_length,
-        # we'll use that to set the expiry.
-        elif instance.partner.account_length:
-            # account_length should be a timedelta
-            authorization.date_expires = date.today() + instance.partner.account_length
+        grant_authorization_for_sent_application(
+            authorization, instance, instance.sent_by
+        )
         authorization.save()
         authorization.partners.add(instance.partner)
 
-        # If we just finalised a renewal, reset reminder_email_sent
-        # so that we can send further reminders.
-        if instance.parent and authorization.reminder_email_sent:
-            authorization.reminder_email_sent = False
-            authorization.save()
-
 
 @receiver(post_save, sender=Partner)
 def invalidate_bundle_partner_applications(sender, instance, **kwargs):
@@ -251,3 +246,22 @@ def invalidate_bundle_partner_applications(sender, instance, **kwargs):
                 # Mark application invalid.
                 application.status = Application.INVALID
                 application.save()
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+@receiver(post_save, sender=Authorization)
+@receiver(post_delete, sender=Authorization)
+@receiver(post_save, sender=Partner)
+@receiver(post_delete, sender=Partner)
+def invalidate_capacity_on_change(sender, **kwargs):
+    # Pending applications and valid authorizations both count towards
+    # partner capacity, which also records each partner's accounts_available
+    # and status.
+    invalidate_partner_capacity()
+
+
+@receiver(m2m_changed, sender=Authorization.partners.through)
+def invalidate_capacity_on_partners_change(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_partner_capacity()
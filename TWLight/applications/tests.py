@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import csv
 import html
 from datetime import date, timedelta
 from dateutil.relativedelta import relativedelta
@@ -20,9 +21,10 @@ from django.contrib.sessions.middleware import SessionMiddleware
 from django.core import mail
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.management import call_command
-from django.db import models
+from django.db import connection, models
 from django.http import Http404
 from django.test import TestCase, Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.html import escape
 
@@ -37,6 +39,9 @@ from TWLight.users.models import Authorization, Editor
 
 from . import views
 from .helpers import (
+    ACCESS_CODE_INVALID_APPLICATION,
+    ACCESS_CODE_SENT,
+    ACCESS_CODE_UNAVAILABLE,
     USER_FORM_FIELDS,
     PARTNER_FORM_OPTIONAL_FIELDS,
     FIELD_TYPES,
@@ -46,7 +51,12 @@ from .helpers import (
     COUNTRY_OF_RESIDENCE,
     AFFILIATION,
     ACCOUNT_EMAIL,
+    batch_update_application_status,
+    distribute_access_codes,
+    get_accounts_available,
+    get_accounts_available_by_partner,
     get_output_for_application,
+    get_partner_capacity,
     more_applications_than_accounts_available,
 )
 from .factories import ApplicationFactory
@@ -632,6 +642,7 @@ class ListApplicationsTest(BaseApplicationViewTest):
         client.login(username=user.username, password="editor")
 
         submit = client.post(delete_url)
+        call_command("process_account_erasures")
 
     @classmethod
     def tearDownClass(cls):
@@ -681,6 +692,183 @@ class ListApplicationsTest(BaseApplicationViewTest):
 
         self.assertEqual(response.status_code, 200)
 
+    def test_list_rejected_keyset_pagination(self):
+        """
+        Following the next page links, or jumping straight to a page, should
+        give the same pages as slicing the full ordered list. A page reached
+        through a link starts right after the last row of the page before,
+        even if rows have been removed since.
+        """
+        partner = PartnerFactory(coordinator=self.coordinator)
+        for _ in range(45):
+            ApplicationFactory(status=Application.NOT_APPROVED, partner=partner)
+        url = reverse("applications:list_rejected")
+        view = views.ListRejectedApplicationsView
+        expected = list(
+            Application.include_invalid.filter(
+                status__in=[Application.NOT_APPROVED, Application.INVALID],
+                partner__coordinator=self.coordinator,
+                editor__isnull=False,
+            )
+            .order_by(*view.keyset_ordering)
+            .values_list("pk", flat=True)
+        )
+
+        def get_page(page, after=None):
+            data = {"page": page}
+            if after:
+                data["after"] = after
+            request = RequestFactory().get(url, data)
+            request.user = self.coordinator
+            response = view.as_view()(request)
+            return response.context_data["object_list"]
+
+        self.assertEqual([app.pk for app in get_page(3)], expected[40:])
+        after = None
+        for page in range(1, 4):
+            applications = get_page(page, after)
+            self.assertEqual(applications.paginator.num_pages, 3)
+            self.assertEqual(
+                [app.pk for app in applications],
+                expected[(page - 1) * 20 : page * 20],
+            )
+            after = applications.next_after
+
+        first_page = get_page(1)
+        Application.include_invalid.filter(pk=expected[0]).delete()
+        self.assertEqual(
+            [app.pk for app in get_page(2, first_page.next_after)], expected[20:40]
+        )
+        # A mangled link falls back to the page number.
+        self.assertEqual(
+            [app.pk for app in get_page(2, "bm90IGtleXM")],
+            expected[21:41],
+        )
+
+    def test_list_rejected_keyset_pagination_backwards(self):
+        """
+        The last page, and pages reached through the previous page links,
+        should be the same as slicing the full ordered list, without an
+        OFFSET scan over the pages before them.
+        """
+        partner = PartnerFactory(coordinator=self.coordinator)
+        for _ in range(45):
+            ApplicationFactory(status=Application.NOT_APPROVED, partner=partner)
+        url = reverse("applications:list_rejected")
+        view = views.ListRejectedApplicationsView
+        expected = list(
+            Application.include_invalid.filter(
+                status__in=[Application.NOT_APPROVED, Application.INVALID],
+                partner__coordinator=self.coordinator,
+                editor__isnull=False,
+            )
+            .order_by(*view.keyset_ordering)
+            .values_list("pk", flat=True)
+        )
+
+        def get_page(page, before=None):
+            data = {"page": page}
+            if before:
+                data["before"] = before
+            request = RequestFactory().get(url, data)
+            request.user = self.coordinator
+            with CaptureQueriesContext(connection) as queries:
+                response = view.as_view()(request)
+            self.assertFalse(any("OFFSET" in query["sql"].upper() for query in queries))
+            return response.context_data["object_list"]
+
+        before = None
+        for page in range(3, 0, -1):
+            applications = get_page(page, before)
+            self.assertEqual(
+                [app.pk for app in applications],
+                expected[(page - 1) * 20 : page * 20],
+            )
+            before = applications.previous_before
+
+        request = RequestFactory().get(url, {"page": 3})
+        request.user = self.coordinator
+        response = view.as_view()(request)
+        self.assertContains(
+            response,
+            "?page=2&before={}".format(
+                response.context_data["object_list"].previous_before
+            ),
+        )
+
+    def test_list_rendering_queries(self):
+        """
+        Rendering a page of the application list should cost the same number
+        of queries however many applications are on it, reviewed or not.
+        """
+        partner = PartnerFactory(coordinator=self.coordinator, renewals_available=True)
+        url = reverse("applications:list_rejected")
+
+        def render_list():
+            request = RequestFactory().get(url)
+            request.user = self.coordinator
+            response = views.ListRejectedApplicationsView.as_view()(request)
+            response.render()
+            return response
+
+        def add_applications(count):
+            for _ in range(count):
+                app = ApplicationFactory(status=Application.PENDING, partner=partner)
+                with reversion.create_revision():
+                    reversion.set_user(self.coordinator)
+                    app.status = Application.NOT_APPROVED
+                    app.save()
+
+        add_applications(1)
+        # Prime anything cached for the request, like the partner capacity.
+        render_list()
+        with CaptureQueriesContext(connection) as one_application:
+            render_list()
+
+        add_applications(5)
+        with self.assertNumQueries(len(one_application.captured_queries)):
+            response = render_list()
+        self.assertEqual(len(response.context_data["object_list"]), 6)
+
+    def test_for_coordinator_list_annotations(self):
+        """
+        The annotations added by for_coordinator_list() should agree with the
+        model methods computed without them.
+        """
+        partner = PartnerFactory(renewals_available=True)
+        parent = ApplicationFactory(status=Application.PENDING, partner=partner)
+        parent.status = Application.APPROVED
+        parent.save()
+        ApplicationFactory(status=Application.PENDING, partner=partner, parent=parent)
+        ApplicationFactory(status=Application.APPROVED, partner=partner)
+
+        applications = Application.objects.filter(partner=partner)
+        annotated = {app.pk: app for app in applications.for_coordinator_list()}
+        self.assertEqual(len(annotated), 3)
+        for app in applications:
+            self.assertEqual(
+                annotated[app.pk].get_version_count(), app.get_version_count()
+            )
+            self.assertEqual(
+                annotated[app.pk].get_latest_reviewer(), app.get_latest_reviewer()
+            )
+            self.assertEqual(
+                annotated[app.pk].get_latest_review_date(),
+                app.get_latest_review_date(),
+            )
+            self.assertEqual(annotated[app.pk].is_renewable, app.is_renewable)
+        self.assertFalse(annotated[parent.pk].is_renewable)
+
+        # Rendering a page shouldn't cost extra queries per application.
+        with self.assertNumQueries(0):
+            for app in annotated.values():
+                app.get_version_count()
+                app.get_latest_reviewer()
+                app.get_latest_review_date()
+                app.is_renewable
+                str(app)
+                app.editor.user.userprofile.terms_of_use
+
     def _base_test_object_visibility(self, url, view, queryset):
         factory = RequestFactory()
 
@@ -1890,6 +2078,7 @@ class ApplicationModelTest(TestCase):
         self.client.login(username=user.username, password="editor")
 
         submit = self.client.post(delete_url)
+        call_command("process_account_erasures")
         app.refresh_from_db()
 
         assert (
@@ -1923,6 +2112,7 @@ class ApplicationModelTest(TestCase):
 
         delete_url = reverse("users:delete_data", kwargs={"pk": coordinator.pk})
         submit = client.post(delete_url)
+        call_command("process_account_erasures")
 
         application.refresh_from_db()
         assert application.editor == editor
@@ -2271,6 +2461,7 @@ class EvaluateApplicationTest(TestCase):
         self.client.login(username=self.user.username, password="editor")
 
         submit = self.client.post(delete_url)
+        call_command("process_account_erasures")
         factory = RequestFactory()
 
         request = factory.get(self.url)
@@ -2577,6 +2768,29 @@ class EvaluateApplicationTest(TestCase):
         # but three applications pending.
         self.assertTrue(more_applications_than_accounts_available(app))
 
+    def test_more_applications_than_accounts_available_reads_one_snapshot(self):
+        """
+        The capacity snapshot is read once, so a partner dropping out of it
+        between reads can't raise a KeyError.
+        """
+        partner = PartnerFactory(authorization_method=Partner.PROXY)
+        partner.accounts_available = 1
+        partner.save()
+        ApplicationFactory(status=Application.PENDING, partner=partner)
+        app = ApplicationFactory(status=Application.PENDING, partner=partner)
+        snapshot = get_partner_capacity()
+        with patch(
+            "TWLight.applications.helpers.get_partner_capacity",
+            side_effect=[snapshot, {}],
+        ) as mock_capacity:
+            self.assertTrue(more_applications_than_accounts_available(app))
+        self.assertEqual(mock_capacity.call_count, 1)
+
+        with patch(
+            "TWLight.applications.helpers.get_partner_capacity", return_value={}
+        ):
+            self.assertFalse(more_applications_than_accounts_available(app))
+
 
 class SignalsUpdateApplicationsTest(BaseApplicationViewTest):
     @classmethod
@@ -2948,6 +3162,40 @@ class BatchEditTest(TestCase):
         self.partner.refresh_from_db()
         self.assertEqual(self.partner.status, Partner.WAITLIST)
 
+    def test_batch_approval_over_capacity_refused(self):
+        """
+        Approving more proxy applications than a partner has accounts for
+        should change none of them, and capacity should be counted the same
+        way as for a single application.
+        """
+        self.partner.authorization_method = Partner.PROXY
+        self.partner.status = Partner.AVAILABLE
+        self.partner.accounts_available = 1
+        self.partner.save()
+        EditorCraftRoom(self, Terms=True, Coordinator=True)
+
+        self.assertEqual(
+            get_accounts_available_by_partner([self.partner.pk]),
+            {self.partner.pk: get_accounts_available(self.application)},
+        )
+
+        response = self.client.post(
+            self.url,
+            data={
+                "applications": [self.application.pk, self.application1.pk],
+                "batch_status": Application.APPROVED,
+            },
+            follow=False,
+        )
+
+        self.assertEqual(response.status_code, 302)
+        self.application.refresh_from_db()
+        self.assertEqual(self.application.status, Application.PENDING)
+        self.application1.refresh_from_db()
+        self.assertEqual(self.application1.status, Application.PENDING)
+        self.partner.refresh_from_db()
+        self.assertEqual(self.partner.status, Partner.AVAILABLE)
+
     def test_sets_days_open(self):
         factory = RequestFactory()
 
@@ -3026,6 +3274,87 @@ class BatchEditTest(TestCase):
 
         self.assertTrue(authorization_exists)
 
+    def test_batch_edit_side_effects_batched(self):
+        """
+        Approving a batch records a revision for each application, grants
+        authorizations for the ones instantly finalized, and sends every
+        approval email in one batch once the transaction commits.
+        """
+        coordinator = EditorCraftRoom(self, Terms=True, Coordinator=True).user
+        self.partner1.authorization_method = Partner.LINK
+        self.partner1.save()
+        applications = [
+            self.application,
+            self.application1,
+            self.application2,
+            self.application3,
+        ]
+        version_counts = {
+            app.pk: reversion.models.Version.objects.get_for_object(app).count()
+            for app in applications
+        }
+        mail.outbox = []
+
+        with patch(
+            "TWLight.emails.tasks.get_connection", wraps=mail.get_connection
+        ) as mock_get_connection:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                success, failed, _ = batch_update_application_status(
+                    [app.pk for app in applications], Application.APPROVED, coordinator
+                )
+                self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(mock_get_connection.call_count, 1)
+
+        self.assertEqual(success, [app.pk for app in applications])
+        self.assertEqual(failed, [])
+        self.assertEqual(
+            sorted(email.to[0] for email in mail.outbox),
+            sorted(app.user.email for app in applications),
+        )
+        for app in applications:
+            app.refresh_from_db()
+            self.assertEqual(
+                reversion.models.Version.objects.get_for_object(app).count(),
+                version_counts[app.pk] + 1,
+            )
+            self.assertEqual(app.date_closed, date.today())
+        self.assertEqual(self.application.status, Application.APPROVED)
+        self.assertEqual(self.application2.status, Application.SENT)
+        self.assertEqual(self.application2.sent_by, coordinator)
+        self.assertEqual(
+            set(
+                Authorization.objects.filter(partners=self.partner1).values_list(
+                    "user", "authorizer"
+                )
+            ),
+            {(self.user.pk, coordinator.pk), (self.user1.pk, coordinator.pk)},
+        )
+        self.assertFalse(Authorization.objects.filter(partners=self.partner).exists())
+
+    def test_batch_rejection_queries(self):
+        """
+        Rejecting a batch costs the same number of queries however many
+        applications are in it.
+        """
+        coordinator = EditorCraftRoom(self, Terms=True, Coordinator=True).user
+        batches = [
+            [ApplicationFactory(status=Application.PENDING) for _ in range(count)]
+            for count in (1, 5)
+        ]
+        query_counts = []
+        for batch in batches:
+            with CaptureQueriesContext(connection) as queries:
+                with self.captureOnCommitCallbacks(execute=True):
+                    batch_update_application_status(
+                        [app.pk for app in batch], Application.NOT_APPROVED, coordinator
+                    )
+            query_counts.append(len(queries.captured_queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual(
+            Application.objects.filter(status=Application.NOT_APPROVED).count(), 6
+        )
+
 
 class ListReadyApplicationsTest(TestCase):
     def test_no_proxy_bundle_partners(self):
@@ -3334,14 +3663,184 @@ class MarkSentTest(TestCase):
         )
         request.user = self.user
 
-        response = views.SendReadyApplicationsView.as_view()(
-            request, pk=self.partner.pk
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = views.SendReadyApplicationsView.as_view()(
+                request, pk=self.partner.pk
+            )
 
         # Expected success condition: redirect back to the original page.
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, self.url)
 
+        self.app1.refresh_from_db()
+        self.assertEqual(self.app1.status, Application.SENT)
+        self.assertEqual(self.app1.sent_by, self.user)
+        self.access_code.refresh_from_db()
+        authorization = self.access_code.authorization
+        self.assertEqual(authorization.user, self.app1.user)
+        self.assertEqual(authorization.authorizer, self.user)
+        self.assertEqual(list(authorization.partners.all()), [self.partner])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.app1.user.email])
+
+    def test_distribute_access_codes_outcomes(self):
+        """
+        Each assignment is reported on separately, and renewals swap the
+        authorization's old code for the new one.
+        """
+        self.partner.authorization_method = Partner.CODES
+        self.partner.save()
+        old_code = AccessCode.objects.create(code="OLD", partner=self.partner)
+        authorization = Authorization.objects.create(
+            user=self.app1.user, authorizer=self.user
+        )
+        authorization.partners.add(self.partner)
+        old_code.authorization = authorization
+        old_code.save()
+        new_code = AccessCode.objects.create(code="NEW", partner=self.partner)
+        app3 = ApplicationFactory(
+            editor=self.user2.editor,
+            status=Application.APPROVED,
+            partner=self.partner,
+        )
+
+        mail.outbox = []
+        with self.captureOnCommitCallbacks() as callbacks:
+            outcomes = distribute_access_codes(
+                self.partner,
+                [
+                    (self.app1.pk, new_code.code),
+                    (app3.pk, "NOT-A-CODE"),
+                    (self.app2.pk, self.access_code.code),
+                ],
+                self.user,
+            )
+        # The code emails wait for the codes to be committed.
+        self.assertEqual(len(mail.outbox), 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual([email.to for email in mail.outbox], [[self.app1.user.email]])
+
+        self.assertEqual(
+            outcomes,
+            {
+                self.app1.pk: ACCESS_CODE_SENT,
+                app3.pk: ACCESS_CODE_UNAVAILABLE,
+                self.app2.pk: ACCESS_CODE_INVALID_APPLICATION,
+            },
+        )
+        new_code.refresh_from_db()
+        self.assertEqual(new_code.authorization, authorization)
+        self.assertFalse(AccessCode.objects.filter(pk=old_code.pk).exists())
+        app3.refresh_from_db()
+        self.assertEqual(app3.status, Application.APPROVED)
+
+    def test_access_codes_partly_sent(self):
+        """
+        When only some access codes can be sent, the coordinator is told how
+        many applications were sent, as well as that some weren't.
+        """
+        self.partner.authorization_method = Partner.CODES
+        self.partner.save()
+        app3 = ApplicationFactory(
+            editor=self.user2.editor,
+            status=Application.APPROVED,
+            partner=self.partner,
+        )
+
+        request = RequestFactory().post(
+            self.url,
+            data={
+                "accesscode": [
+                    "{app_pk}_{code}".format(
+                        app_pk=self.app1.pk, code=self.access_code.code
+                    ),
+                    "{app_pk}_NOT-A-CODE".format(app_pk=app3.pk),
+                ]
+            },
+        )
+        request.user = self.user
+        add_message = views.messages.add_message
+        add_message.reset_mock()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            views.SendReadyApplicationsView.as_view()(request, pk=self.partner.pk)
+
+        self.assertEqual(
+            [call.args[1:] for call in add_message.call_args_list],
+            [
+                (views.messages.SUCCESS, "1 application has been marked as sent."),
+                (
+                    views.messages.ERROR,
+                    "Some access codes could not be sent. Please check the "
+                    "remaining applications and try again.",
+                ),
+            ],
+        )
+        self.app1.refresh_from_db()
+        self.assertEqual(self.app1.status, Application.SENT)
+
+    def test_send_data_export(self):
+        """
+        Coordinators can download the send data as CSV or TSV.
+        """
+        self.partner.real_name = True
+        self.partner.save()
+        self.app1.editor.real_name = "Alice Example"
+        self.app1.editor.save()
+
+        for export_format, delimiter in [("csv", ","), ("tsv", "\t")]:
+            request = RequestFactory().get(self.url, {"format": export_format})
+            request.user = self.user
+            response = views.SendReadyApplicationsView.as_view()(
+                request, pk=self.partner.pk
+            )
+            self.assertEqual(response.status_code, 200)
+            rows = list(
+                csv.reader(
+                    b"".join(response.streaming_content).decode("utf-8").splitlines(),
+                    delimiter=delimiter,
+                )
+            )
+            self.assertEqual(rows[0], ["Application", "Username", "Email", "Real name"])
+            self.assertEqual(
+                rows[1:],
+                [
+                    [
+                        str(self.app1.pk),
+                        self.app1.editor.wp_username,
+                        self.app1.user.email,
+                        "Alice Example",
+                    ]
+                ],
+            )
+
+    def test_send_data_export_escapes_formulas(self):
+        """
+        Text an editor typed in that a spreadsheet would run as a formula is
+        escaped in the export.
+        """
+        self.partner.real_name = True
+        self.partner.affiliation = True
+        self.partner.save()
+        self.app1.editor.real_name = '=HYPERLINK("https://example.com","Alice")'
+        self.app1.editor.affiliation = "-Example University"
+        self.app1.editor.save()
+
+        request = RequestFactory().get(self.url, {"format": "csv"})
+        request.user = self.user
+        response = views.SendReadyApplicationsView.as_view()(
+            request, pk=self.partner.pk
+        )
+        rows = list(
+            csv.reader(
+                b"".join(response.streaming_content).decode("utf-8").splitlines()
+            )
+        )
+
+        self.assertIn('\'=HYPERLINK("https://example.com","Alice")', rows[1])
+        self.assertIn("'-Example University", rows[1])
+
     def test_too_many_access_codes_raise_http_bad_request(self):
         self.partner.authorization_method = Partner.CODES
         self.partner.save()
@@ -3401,3 +3900,43 @@ class MarkSentTest(TestCase):
         # Expected success condition: raise a 404 not found page
         with self.assertRaises(Http404):
             _ = views.SendReadyApplicationsView.as_view()(request, pk=self.partner.pk)
+
+
+class AutocompleteTest(BaseApplicationViewTest):
+    def _get_results(self, view_class, q=""):
+        view = view_class()
+        view.request = RequestFactory().get("/")
+        view.request.user = self.coordinator
+        view.q = q
+        return list(view.get_queryset())
+
+    def test_editor_autocomplete_for_coordinator(self):
+        """
+        Coordinators only get editors who applied to their partners, once
+        each, filtered by username prefix.
+        """
+        partner = PartnerFactory(coordinator=self.coordinator)
+        other_partner = PartnerFactory()
+        editor = self.editor.editor
+        editor2 = self.editor2.editor
+        ApplicationFactory(editor=editor, partner=partner)
+        ApplicationFactory(editor=editor, partner=partner)
+        ApplicationFactory(editor=editor2, partner=other_partner)
+
+        self.assertEqual(self._get_results(views.EditorAutocompleteView), [editor])
+        self.assertEqual(
+            self._get_results(views.EditorAutocompleteView, editor.wp_username[:3]),
+            [editor],
+        )
+        self.assertEqual(
+            self._get_results(views.EditorAutocompleteView, "no such prefix"), []
+        )
+
+    def test_partner_autocomplete_for_coordinator(self):
+        partner = PartnerFactory(coordinator=self.coordinator, company_name="Alpha")
+        PartnerFactory(coordinator=self.coordinator, company_name="Beta")
+        PartnerFactory(company_name="Another")
+
+        self.assertEqual(
+            self._get_results(views.PartnerAutocompleteView, "al"), [partner]
+        )
@@ -21,13 +21,18 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.core.paginator import EmptyPage, PageNotAnInteger
 from django.urls import reverse, reverse_lazy
 from django.db import IntegrityError
-from django.db.models import Q
-from django.http import HttpResponseRedirect, HttpResponseBadRequest, Http404
+from django.db.models import Count, Exists, OuterRef, Q
+from django.http import (
+    HttpResponseRedirect,
+    HttpResponseBadRequest,
+    Http404,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404
-from django.utils.translation import gettext as _
+from django.utils.translation import gettext as _, ngettext
 from django.views.generic.base import View
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import FormView, UpdateView
@@ -38,8 +43,8 @@ from reversion.models import Version
 from TWLight.users.helpers.editor_data import editor_bundle_eligible
 from TWLight.applications.signals import no_more_accounts
 from TWLight.resources.models import Partner, AccessCode
-from TWLight.users.groups import get_coordinators
-from TWLight.users.models import Authorization, Editor
+from TWLight.users.groups import get_user_groups
+from TWLight.users.models import Editor
 from TWLight.view_mixins import (
     PartnerCoordinatorOrSelf,
     CoordinatorsOnly,
@@ -53,15 +58,20 @@ from TWLight.view_mixins import (
 )
 from .forms import BaseApplicationForm, ApplicationAutocomplete, RenewalForm
 from .helpers import (
+    ACCESS_CODE_SENT,
     USER_FORM_FIELDS,
     PARTNER_FORM_OPTIONAL_FIELDS,
     PARTNER_FORM_BASE_FIELDS,
+    batch_update_application_status,
+    distribute_access_codes,
     get_output_for_application,
     get_accounts_available,
+    iter_send_data_rows,
     is_proxy_and_application_approved,
     more_applications_than_accounts_available,
 )
 from .models import Application
+from .pagination import KeysetPaginator
 
 logger = logging.getLogger(__name__)
 
@@ -72,50 +82,42 @@ class EditorAutocompleteView(autocomplete.Select2QuerySetView):
     def get_queryset(self):
         # Make sure that we aren't leaking info via our form choices.
         if self.request.user.is_superuser:
-            editor_qs = Editor.objects.all().order_by("wp_username")
-            # Query by wikimedia username
-            if self.q:
-                editor_qs = editor_qs.filter(wp_username__istartswith=self.q).order_by(
-                    "wp_username"
-                )
-        elif get_coordinators() in self.request.user.groups.all():
+            editor_qs = Editor.objects.all()
+        elif get_user_groups(self.request.user).is_coordinator:
+            # Filtering through an Exists subquery rather than joining on
+            # applications avoids duplicate editors, and lets the database
+            # walk the wp_username index in order.
             editor_qs = Editor.objects.filter(
-                applications__partner__coordinator__pk=self.request.user.pk
-            ).order_by("wp_username")
-            # Query by wikimedia username
-            if self.q:
-                editor_qs = editor_qs.filter(wp_username__istartswith=self.q).order_by(
-                    "wp_username"
+                Exists(
+                    Application.include_invalid.filter(
+                        editor=OuterRef("pk"),
+                        partner__coordinator__pk=self.request.user.pk,
+                    )
                 )
+            )
         else:
-            editor_qs = Editor.objects.none()
-        return editor_qs
+            return Editor.objects.none()
+        # Query by wikimedia username
+        if self.q:
+            editor_qs = editor_qs.filter(wp_username__istartswith=self.q)
+        # Results are rendered with just the username.
+        return editor_qs.only("pk", "wp_username").order_by("wp_username")
 
 
 class PartnerAutocompleteView(autocomplete.Select2QuerySetView):
     def get_queryset(self):
         # Make sure that we aren't leaking info via our form choices.
         if self.request.user.is_superuser:
-            partner_qs = Partner.objects.filter(
-                ~Q(authorization_method=Partner.BUNDLE)
-            ).order_by("company_name")
-            # Query by partner name
-            if self.q:
-                partner_qs = partner_qs.filter(
-                    company_name__istartswith=self.q
-                ).order_by("company_name")
-        elif get_coordinators() in self.request.user.groups.all():
-            partner_qs = Partner.objects.filter(
-                coordinator__pk=self.request.user.pk
-            ).order_by("company_name")
-            # Query by partner name
-            if self.q:
-                partner_qs = partner_qs.filter(
-                    company_name__istartswith=self.q
-                ).order_by("company_name")
+            partner_qs = Partner.objects.filter(~Q(authorization_method=Partner.BUNDLE))
+        elif get_user_groups(self.request.user).is_coordinator:
+            partner_qs = Partner.objects.filter(coordinator__pk=self.request.user.pk)
         else:
-            partner_qs = Partner.objects.none()
-        return partner_qs
+            return Partner.objects.none()
+        # Query by partner name
+        if self.q:
+            partner_qs = partner_qs.filter(company_name__istartswith=self.q)
+        # Results are rendered with just the company name.
+        return partner_qs.only("pk", "company_name").order_by("company_name")
 
 
 class SubmitSingleApplicationView(
@@ -397,6 +399,9 @@ class _BaseListApplicationView(CoordinatorsOnly, ToURequired, ListView):
     """
 
     model = Application
+    # Pages are fetched by seeking on these keys, so they must uniquely order
+    # the applications. See KeysetPaginator.
+    keyset_ordering = ("status", "partner__company_name", "date_created", "pk")
 
     def _filter_queryset(self, base_qs, editor, partner):
         """
@@ -481,10 +486,16 @@ class _BaseListApplicationView(CoordinatorsOnly, ToURequired, ListView):
 
         context["object_list"] = self.object_list
         # Set up pagination.
-        paginator = Paginator(self.object_list, 20)
+        paginator = KeysetPaginator(
+            self.object_list.for_coordinator_list(), 20, keys=self.keyset_ordering
+        )
         page = self.request.GET.get("page")
         try:
-            applications = paginator.page(page)
+            applications = paginator.page(
+                page,
+                after=self.request.GET.get("after"),
+                before=self.request.GET.get("before"),
+            )
         except PageNotAnInteger:
             # If page is not an integer, deliver first page.
             applications = paginator.page(1)
@@ -569,7 +580,7 @@ class ListApplicationsView(_BaseListApplicationView):
                     editor__isnull=False,
                 )
                 .exclude(editor__user__groups__name="restricted")
-                .order_by("status", "partner", "date_created")
+                .order_by(*self.keyset_ordering)
             )
 
         else:
@@ -582,7 +593,7 @@ class ListApplicationsView(_BaseListApplicationView):
                     editor__isnull=False,
                 )
                 .exclude(editor__user__groups__name="restricted")
-                .order_by("status", "partner", "date_created")
+                .order_by(*self.keyset_ordering)
             )
 
         return base_qs
@@ -614,7 +625,7 @@ class ListApprovedApplicationsView(_BaseListApplicationView):
                     editor__isnull=False,
                 )
                 .exclude(editor__user__groups__name="restricted")
-                .order_by("status", "partner", "date_created")
+                .order_by(*self.keyset_ordering)
             )
         else:
             return (
@@ -625,7 +636,7 @@ class ListApprovedApplicationsView(_BaseListApplicationView):
                     editor__isnull=False,
                 )
                 .exclude(editor__user__groups__name="restricted")
-                .order_by("status", "partner", "date_created")
+                .order_by(*self.keyset_ordering)
             )
 
     def get_context_data(self, **kwargs):
@@ -645,14 +656,14 @@ class ListRejectedApplicationsView(_BaseListApplicationView):
                 ~Q(partner__authorization_method=Partner.BUNDLE),
                 status__in=[Application.NOT_APPROVED, Application.INVALID],
                 editor__isnull=False,
-            ).order_by("date_closed", "partner")
+            ).order_by(*self.keyset_ordering)
         else:
             return Application.include_invalid.filter(
                 ~Q(partner__authorization_method=Partner.BUNDLE),
                 status__in=[Application.NOT_APPROVED, Application.INVALID],
                 partner__coordinator__pk=self.request.user.pk,
                 editor__isnull=False,
-            ).order_by("date_closed", "partner")
+            ).order_by(*self.keyset_ordering)
 
     def get_context_data(self, **kwargs):
         context = super(ListRejectedApplicationsView, self).get_context_data(**kwargs)
@@ -670,6 +681,8 @@ class ListRenewalApplicationsView(_BaseListApplicationView):
     for.
     """
 
+    keyset_ordering = ("-date_created", "-pk")
+
     def get_queryset(self):
         if self.request.user.is_superuser:
             return Application.objects.filter(
@@ -677,7 +690,7 @@ class ListRenewalApplicationsView(_BaseListApplicationView):
                 status__in=[Application.PENDING, Application.QUESTION],
                 parent__isnull=False,
                 editor__isnull=False,
-            ).order_by("-date_created")
+            ).order_by(*self.keyset_ordering)
         else:
             return Application.objects.filter(
                 ~Q(partner__authorization_method=Partner.BUNDLE),
@@ -685,7 +698,7 @@ class ListRenewalApplicationsView(_BaseListApplicationView):
                 partner__coordinator__pk=self.request.user.pk,
                 parent__isnull=False,
                 editor__isnull=False,
-            ).order_by("-date_created")
+            ).order_by(*self.keyset_ordering)
 
     def get_context_data(self, **kwargs):
         context = super(ListRenewalApplicationsView, self).get_context_data(**kwargs)
@@ -705,14 +718,14 @@ class ListSentApplicationsView(_BaseListApplicationView):
                 ~Q(partner__authorization_method=Partner.BUNDLE),
                 status=Application.SENT,
                 editor__isnull=False,
-            ).order_by("date_closed", "partner")
+            ).order_by(*self.keyset_ordering)
         else:
             return Application.objects.filter(
                 ~Q(partner__authorization_method=Partner.BUNDLE),
                 status=Application.SENT,
                 partner__coordinator__pk=self.request.user.pk,
                 editor__isnull=False,
-            ).order_by("date_closed", "partner")
+            ).order_by(*self.keyset_ordering)
 
     def get_context_data(self, **kwargs):
         context = super(ListSentApplicationsView, self).get_context_data(**kwargs)
@@ -940,99 +953,29 @@ class BatchEditView(CoordinatorsOnly, ToURequired, View):
             )
             return HttpResponseRedirect(reverse("applications:list"))
 
-        # IMPORTANT! It would be tempting to just do QuerySet.update() here,
-        # but that does NOT send the pre_save signal, which is doing some
-        # important work for Applications. This includes handling the closing
-        # dates for applications and sending email notifications to editors
-        # about their applications.
-
-        # This might seem a tad complicated/overkill, but we need this in order to
-        # stop batch approvals of applications for proxy partners when accounts for
-        # approval are greater than the number of accounts available.
-        batch_update_failed = []
-        batch_update_success = []
-        partners_distribution_flag = {}
-
-        applications_per_partner = {}
-        waitlist_dict = {}
-        all_apps = request.POST.getlist("applications")
-        if len(all_apps) > Application.objects.all().count():
-            logger.exception("Too many applications")
-            return HttpResponseBadRequest()
-        for each_app_pk in all_apps:
+        # The application pks arrive as strings; skip any that aren't pks at
+        # all, just as we skip pks of applications that don't exist.
+        application_pks = []
+        for each_app_pk in request.POST.getlist("applications"):
             try:
-                each_app = Application.objects.get(pk=each_app_pk)
-            except Application.DoesNotExist:
+                application_pks.append(int(each_app_pk))
+            except ValueError:
                 logger.exception(
                     "Could not find app with posted pk {pk}; "
                     "continuing through remaining apps".format(pk=each_app_pk)
                 )
-                continue
-            # We loop through the list of applications (only proxy) counting the number of applications that
-            # are to be approved for a particular partner or collection. The counts are then updated in
-            # applications_per_partner dictionary depending on the application type.
-            if is_proxy_and_application_approved(status, app=each_app):
-                app_count = applications_per_partner.get(each_app.partner.pk)
-                if app_count is None:
-                    applications_per_partner[each_app.partner.pk] = 1
-                else:
-                    applications_per_partner[each_app.partner.pk] += 1
-
-        # For applications that are for partners, we get the number of accounts available based
-        # on their valid authorizations to ensure we have enough accounts available and set the
-        # boolean value for the corresponding partner_pk in the partners_distribution_flag dictionary.
-        for partner_pk, app_count in applications_per_partner.items():
-            this_partner = Partner.objects.get(pk=partner_pk)
-            total_accounts_available = this_partner.accounts_available
-            if total_accounts_available is not None:
-                valid_authorizations = this_partner.get_valid_authorization_count
-                total_accounts_available_for_distribution = (
-                    total_accounts_available - valid_authorizations
-                )
-                if app_count > total_accounts_available_for_distribution:
-                    partners_distribution_flag[partner_pk] = False
-                elif app_count == total_accounts_available_for_distribution:
-                    # The waitlist_dict keeps track of partners that'll
-                    # run out of accounts once we approve all the applications.
-                    waitlist_dict[partner_pk] = True
-                    partners_distribution_flag[partner_pk] = True
-                else:
-                    partners_distribution_flag[partner_pk] = True
-            else:
-                partners_distribution_flag[partner_pk] = True
 
-        for app_pk in all_apps:
-            try:
-                app = Application.objects.get(pk=app_pk)
-            except Application.DoesNotExist:
-                continue
-
-            # Based on the distribution flags, we either mark applications as approved and update the batch_update_success
-            # list with the application id or do nothing and update the batch_update_failed list.
-            if is_proxy_and_application_approved(status, app):
-                if app.partner.status != Partner.WAITLIST:
-                    if partners_distribution_flag[app.partner.pk] is True:
-                        batch_update_success.append(app_pk)
-                        app.status = status
-                        app.sent_by = request.user
-                        app.save()
-                    else:
-                        batch_update_failed.append(app_pk)
-                else:
-                    batch_update_failed.append(app_pk)
-            else:
-                batch_update_success.append(app_pk)
-                app.status = status
-                if (
-                    app.is_instantly_finalized() and app.status == Application.APPROVED
-                ) or app.status == Application.SENT:
-                    app.sent_by = request.user
-                app.save()
-
-        # We manually send the signals to waitlist the partners with corresponding 'True' values.
-        # This could be tweaked in the future to also waitlist partners with collections. We don't do that
-        # now since it's possible we have accounts left for distribution on other collections.
-        for partner_pk in waitlist_dict:
+        (
+            batch_update_success,
+            batch_update_failed,
+            waitlist_partner_pks,
+        ) = batch_update_application_status(application_pks, status, request.user)
+
+        # We manually send the signals to waitlist the partners that have run
+        # out of accounts. This could be tweaked in the future to also waitlist
+        # partners with collections. We don't do that now since it's possible
+        # we have accounts left for distribution on other collections.
+        for partner_pk in waitlist_partner_pks:
             no_more_accounts.send(sender=self.__class__, partner_pk=partner_pk)
 
         if batch_update_success:
@@ -1085,6 +1028,7 @@ class ListReadyApplicationsView(CoordinatorsOnly, ListView):
 class SendReadyApplicationsView(PartnerCoordinatorOnly, DetailView):
     model = Partner
     template_name = "applications/send_partner.html"
+    export_delimiters = {"csv": ",", "tsv": "\t"}
 
     def dispatch(self, request, *args, **kwargs):
         partner = self.get_object()
@@ -1096,41 +1040,65 @@ class SendReadyApplicationsView(PartnerCoordinatorOnly, DetailView):
         else:
             raise Http404("Applications for this Partner are sent automatically")
 
-    def get_context_data(self, **kwargs):
-        context = super(SendReadyApplicationsView, self).get_context_data(**kwargs)
-        partner = self.get_object()
-        apps = partner.applications.filter(
-            status=Application.APPROVED, editor__isnull=False
-        ).exclude(editor__user__groups__name="restricted")
-        app_outputs = {}
+    def get_ready_applications(self):
+        return (
+            self.object.applications.filter(
+                status=Application.APPROVED, editor__isnull=False
+            )
+            .exclude(editor__user__groups__name="restricted")
+            .select_related("editor__user", "partner", "parent")
+            .order_by("pk")
+        )
 
-        for app in apps:
-            app_outputs[app] = get_output_for_application(app)
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get("format")
+        if export_format not in self.export_delimiters:
+            return super(SendReadyApplicationsView, self).get(request, *args, **kwargs)
+
+        # Large partners can have thousands of applications waiting, so the
+        # export is written out as it's read instead of built up in memory.
+        self.object = self.get_object()
+        response = StreamingHttpResponse(
+            iter_send_data_rows(
+                self.get_ready_applications(),
+                delimiter=self.export_delimiters[export_format],
+            ),
+            content_type="text/{format}".format(
+                format="tab-separated-values" if export_format == "tsv" else "csv"
+            ),
+        )
+        response["Content-Disposition"] = (
+            "attachment; filename=applications_{pk}.{format}".format(
+                pk=self.object.pk, format=export_format
+            )
+        )
+        return response
 
-        context["app_outputs"] = app_outputs
+    def get_context_data(self, **kwargs):
+        context = super(SendReadyApplicationsView, self).get_context_data(**kwargs)
+        partner = self.object
+        context["app_outputs"] = {
+            app: get_output_for_application(app)
+            for app in self.get_ready_applications()
+        }
 
         # Supports send_partner template with total approved/sent applications.
-        total_apps_approved = Application.objects.filter(
-            partner=partner, status=Application.APPROVED
-        ).count()
-
-        total_apps_sent = Application.objects.filter(
-            partner=partner, status=Application.SENT
-        ).count()
-
-        total_apps_approved_or_sent = total_apps_approved + total_apps_sent
-
         # Provide context to template only if accounts_available field is set
         if partner.accounts_available is not None:
-            context["total_apps_approved_or_sent"] = total_apps_approved_or_sent
-
+            totals = Application.objects.filter(partner=partner).aggregate(
+                approved=Count("pk", filter=Q(status=Application.APPROVED)),
+                sent=Count("pk", filter=Q(status=Application.SENT)),
+            )
+            context["total_apps_approved_or_sent"] = totals["approved"] + totals["sent"]
         else:
             context["total_apps_approved_or_sent"] = None
 
-        available_access_codes = AccessCode.objects.filter(
-            partner=partner, authorization__isnull=True
-        )
-        context["available_access_codes"] = available_access_codes
+        # Each application gets its own code, so there's no point offering
+        # more codes than there are applications to send.
+        if partner.authorization_method == Partner.CODES:
+            context["available_access_codes"] = AccessCode.objects.filter(
+                partner=partner, authorization__isnull=True
+            ).values_list("code", flat=True)[: len(context["app_outputs"])]
 
         return context
 
@@ -1206,43 +1174,46 @@ class SendReadyApplicationsView(PartnerCoordinatorOnly, DetailView):
                     )
                 )
 
-            for send_output in send_outputs:
-                app_pk = send_output[0]
-                app_code = send_output[1]
+            try:
+                send_outputs = [
+                    (int(app_pk), app_code) for app_pk, app_code in send_outputs
+                ]
+            except ValueError:
+                logger.exception("Invalid value posted")
+                return HttpResponseBadRequest()
 
-                application = Application.objects.get(pk=app_pk)
-                code_object = AccessCode.objects.get(
-                    code=app_code, partner=application.partner
+            outcomes = distribute_access_codes(
+                self.get_object(), send_outputs, request.user
+            )
+            sent_count = sum(
+                1 for outcome in outcomes.values() if outcome == ACCESS_CODE_SENT
+            )
+            if sent_count < len(outcomes):
+                if sent_count:
+                    messages.add_message(
+                        self.request,
+                        messages.SUCCESS,
+                        # Translators: After a coordinator has assigned access codes, and only some of them could be sent, this message says how many applications were marked as sent. Don't translate %(count)d.
+                        ngettext(
+                            "%(count)d application has been marked as sent.",
+                            "%(count)d applications have been marked as sent.",
+                            sent_count,
+                        )
+                        % {"count": sent_count},
+                    )
+                messages.add_message(
+                    self.request,
+                    messages.ERROR,
+                    # Translators: This message is shown to coordinators when some of the access codes they assigned could not be sent.
+                    _(
+                        "Some access codes could not be sent. Please check the remaining applications and try again."
+                    ),
                 )
-
-                application.status = Application.SENT
-                application.sent_by = request.user
-                application.save()
-
-                # Access code object needs to be updated after the application
-                # to ensure that the authorization object has been created.
-                # This filtering should only ever find one object. There will
-                # always be a user and partner
-                auth = Authorization.objects.get(
-                    user=application.user, partners=application.partner
+                return HttpResponseRedirect(
+                    reverse(
+                        "applications:send_partner", kwargs={"pk": self.get_object().pk}
+                    )
                 )
-                if hasattr(auth, "accesscodes"):
-                    if auth.accesscodes:
-                        logger.info(
-                            "Authorization already has an access code, reassigning it...."
-                        )
-                        # Get old access code and delete it
-                        old_access_code = AccessCode.objects.get(pk=auth.accesscodes.pk)
-                        old_access_code.delete()
-                        auth.accesscodes = code_object
-                        auth.save()
-                        code_object.authorization = auth
-                    else:
-                        code_object.authorization = auth
-                else:
-                    code_object.authorization = auth
-
-                code_object.save()
 
         messages.add_message(
             self.request,
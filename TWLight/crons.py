@@ -7,6 +7,7 @@ from sentry_sdk import capture_exception
 WEEKLY = 10080
 DAILY = 1440
 SEMI_DAILY = 720
+FREQUENTLY = 5
 
 
 class SendCoordinatorRemindersCronJob(CronJobBase):
@@ -47,6 +48,50 @@ class UserRenewalNoticeCronJob(CronJobBase):
             capture_exception(e)
 
 
+class AccountErasureCronJob(CronJobBase):
+    schedule = Schedule(run_every_mins=FREQUENTLY)
+    code = "users.process_account_erasures"
+
+    def do(self):
+        try:
+            management.call_command("process_account_erasures")
+        except Exception as e:
+            capture_exception(e)
+
+
+class AccessCodeImportCronJob(CronJobBase):
+    schedule = Schedule(run_every_mins=FREQUENTLY)
+    code = "resources.process_access_code_imports"
+
+    def do(self):
+        try:
+            management.call_command("process_access_code_imports")
+        except Exception as e:
+            capture_exception(e)
+
+
+class SendQueuedEmailsCronJob(CronJobBase):
+    schedule = Schedule(run_every_mins=FREQUENTLY)
+    code = "emails.send_queued_emails"
+
+    def do(self):
+        try:
+            management.call_command("send_queued_emails")
+        except Exception as e:
+            capture_exception(e)
+
+
+class CommentDigestCronJob(CronJobBase):
+    schedule = Schedule(run_every_mins=FREQUENTLY)
+    code = "emails.send_comment_digests"
+
+    def do(self):
+        try:
+            management.call_command("send_comment_digests")
+        except Exception as e:
+            capture_exception(e)
+
+
 class ProxyWaitlistDisableCronJob(CronJobBase):
     schedule = Schedule(run_every_mins=DAILY)
     code = "resources.proxy_waitlist_disable"
@@ -0,0 +1,35 @@
+from django.contrib import admin
+
+from .models import EmailCampaign
+
+
+class EmailCampaignAdmin(admin.ModelAdmin):
+    list_display = (
+        "campaign",
+        "date_created",
+        "status",
+        "recipients_sent",
+        "recipients_failed",
+        "recipients_total",
+        "throughput",
+    )
+    list_filter = ("campaign", "status")
+    readonly_fields = (
+        "campaign",
+        "options",
+        "status",
+        "recipients_total",
+        "recipients_sent",
+        "recipients_failed",
+        "throughput",
+        "date_created",
+        "date_started",
+        "date_completed",
+    )
+
+    # Campaigns are created by their management commands.
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(EmailCampaign, EmailCampaignAdmin)
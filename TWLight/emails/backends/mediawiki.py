@@ -4,17 +4,20 @@ see: https://www.mediawiki.org/wiki/API:Emailuser
 """
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from json import dumps
-from requests import Session
 from requests.exceptions import ConnectionError
 from requests.structures import CaseInsensitiveDict
-from time import sleep
+from threading import Lock
+from time import monotonic, sleep
 
 from django.conf import settings
 from django.core.mail.backends.base import BaseEmailBackend
 
 from TWLight.users.models import Editor
 
+from .transports import HTTPTransport, ReplayMissError
+
 logger = logging.getLogger(__name__)
 
 
@@ -52,7 +55,60 @@ def retry_conn():
     return wrapper
 
 
+class RateLimiter:
+    """
+    A token bucket shared by every thread sending through one backend. Each
+    API request takes a token, and tokens come back at one per interval, up
+    to burst. pause() holds every thread back, for when the API tells us
+    to slow down. Time spent waiting is totalled across threads, separately
+    for pauses and for the rate limit.
+    """
+
+    def __init__(self, interval, burst=1):
+        self.interval = interval
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+        self.resume_at = 0
+        self.lock = Lock()
+        self.paused_time = 0.0
+        self.throttled_time = 0.0
+
+    def pause(self, seconds):
+        with self.lock:
+            self.resume_at = max(self.resume_at, monotonic() + seconds)
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                wait = self.resume_at - now
+                paused = wait > 0
+                if not paused:
+                    if self.interval:
+                        self.tokens = min(
+                            self.burst,
+                            self.tokens + (now - self.updated) / self.interval,
+                        )
+                    else:
+                        self.tokens = self.burst
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) * self.interval
+            sleep(wait)
+            with self.lock:
+                if paused:
+                    self.paused_time += wait
+                else:
+                    self.throttled_time += wait
+
+
 class EmailBackend(BaseEmailBackend):
+    # The most users list=users will take at once, without apihighlimits.
+    usernames_per_request = 50
+
     def __init__(
         self,
         url=None,
@@ -62,6 +118,8 @@ class EmailBackend(BaseEmailBackend):
         maxlag=None,
         username=None,
         password=None,
+        workers=None,
+        transport=None,
         fail_silently=False,
         **kwargs,
     ):
@@ -70,19 +128,32 @@ class EmailBackend(BaseEmailBackend):
         self.headers = CaseInsensitiveDict()
         self.headers["User-Agent"] = "{}/0.0.1".format(__name__)
         self.url = settings.MW_API_URL if url is None else url
-        self.timeout = settings.MW_API_REQUEST_TIMEOUT if timeout is None else timeout
-        self.delay = settings.MW_API_REQUEST_DELAY if delay is None else delay
+        self.timeout = float(
+            settings.MW_API_REQUEST_TIMEOUT if timeout is None else timeout
+        )
+        self.delay = float(settings.MW_API_REQUEST_DELAY if delay is None else delay)
         self.retry_delay = (
             settings.MW_API_REQUEST_RETRY_DELAY if retry_delay is None else retry_delay
         )
         self.maxlag = settings.MW_API_MAXLAG if maxlag is None else maxlag
         self.username = settings.MW_API_EMAIL_USER if username is None else username
         self.password = settings.MW_API_EMAIL_PASSWORD if password is None else password
+        # Messages are sent by this many threads, sharing one session.
+        self.workers = int(
+            settings.MW_API_EMAIL_WORKERS if workers is None else workers
+        )
+        self.rate_limiter = RateLimiter(self.delay, burst=self.workers)
+        # (message, error) for each message in the last send_messages() call.
+        # error is None for messages that were sent.
+        self.outcomes = []
+        # A Transport to use instead of HTTP requests to self.url, see
+        # TWLight.emails.backends.transports.
+        self.configured_transport = transport
+        self.transport = None
         self.email_token = None
-        self.session = None
         logger.info("Email connection constructed.")
 
-    def _handle_request(self, response, try_count=0):
+    def _handle_request(self, response, method, params, try_count=0):
         """
         A helper method that handles MW API responses
         including maxlag retries.
@@ -104,7 +175,6 @@ class EmailBackend(BaseEmailBackend):
 
         # handle retries with max lag
         lag = error.get("lag")
-        request = response.request
         retry_after = float(response.headers.get("Retry-After", 5))
         retry_on_lag_error = 50
         no_retry = 0 <= retry_on_lag_error < try_count
@@ -127,9 +197,31 @@ class EmailBackend(BaseEmailBackend):
         if no_retry:
             raise Exception(message)
 
-        sleep(retry_after)
+        # Hold back every thread, not just this one, until the servers have
+        # caught up.
+        database_lag = float(response.headers.get("X-Database-Lag", 0))
+        self.rate_limiter.pause(max(retry_after, database_lag))
+        self.rate_limiter.acquire()
         try_count += 1
-        return self._handle_request(self.session.send(request), try_count)
+        return self._handle_request(
+            self.transport.request(method, params), method, params, try_count
+        )
+
+    def _request(self, method, params):
+        """A helper method that makes an API request and handles the response."""
+        return self._handle_request(
+            self.transport.request(method, params), method, params
+        )
+
+    def _post(self, data):
+        """A helper method that POSTs to the API within the rate limit."""
+        self.rate_limiter.acquire()
+        return self._request("POST", data)
+
+    def _make_transport(self):
+        if self.configured_transport is not None:
+            return self.configured_transport
+        return HTTPTransport(self.url, headers=self.headers, timeout=self.timeout)
 
     @retry_conn()
     def open(self):
@@ -138,13 +230,12 @@ class EmailBackend(BaseEmailBackend):
         new session was required (True or False) or None if an exception
         passed silently.
         """
-        if self.session:
+        if self.transport:
             # Nothing to do if the session exists
             return False
 
         try:
-            self.session = Session()
-            self.session.headers = self.headers
+            self.transport = self._make_transport()
             logger.info("Session created, getting login token...")
 
             # GET request to fetch login token
@@ -155,12 +246,10 @@ class EmailBackend(BaseEmailBackend):
                 "maxlag": self.maxlag,
                 "format": "json",
             }
-            login_token_response = self._handle_request(
-                self.session.get(url=self.url, params=login_token_params)
-            )
+            login_token_response = self._request("GET", login_token_params)
             login_token = login_token_response["query"]["tokens"]["logintoken"]
             if not login_token:
-                self.session = None
+                self.transport = None
                 raise Exception(dumps(login_token_response))
 
             # POST request to log in. Use of main account for login is not
@@ -175,93 +264,147 @@ class EmailBackend(BaseEmailBackend):
                 "format": "json",
             }
             logger.info("Signing in...")
-            login_response = self._handle_request(
-                self.session.post(url=self.url, data=login_params)
-            )
+            login_response = self._request("POST", login_params)
 
             # GET request to fetch Email token
             # see: https://www.mediawiki.org/wiki/API:Emailuser#Token
             email_token_params = {"action": "query", "meta": "tokens", "format": "json"}
 
             logger.info("Getting email token...")
-            email_token_response = self._handle_request(
-                self.session.get(url=self.url, params=email_token_params)
-            )
+            email_token_response = self._request("GET", email_token_params)
             email_token = email_token_response["query"]["tokens"]["csrftoken"]
             if not email_token:
-                self.session = None
+                self.transport = None
                 raise Exception(dumps(email_token_response))
 
             # Assign the email token
             self.email_token = email_token
             logger.info("Email API session ready.")
             return True
+        except ReplayMissError:
+            raise
         except Exception as e:
             if not self.fail_silently:
                 raise e
 
     def close(self):
         """Unset the session."""
+        # Transports handed to us are closed by whoever made them.
+        if self.transport and self.transport is not self.configured_transport:
+            self.transport.close()
         self.email_token = None
-        self.session = None
+        self.transport = None
         logger.info("Session destroyed.")
 
     def send_messages(self, email_messages):
         """
         Send one or more EmailMessage objects and return the number of email
-        messages sent.
+        messages sent. Recipients are looked up and checked for emailability
+        up front, in batches, before anything is sent. With more than one
+        worker, messages are sent concurrently, within the rate limit.
+        What happened to each message is left in self.outcomes.
+        ReplayMissError is always raised, since it means a recording is
+        incomplete rather than that the API failed.
         """
         if not email_messages:
             return 0
         new_session_created = self.open()
-        if not self.session or new_session_created is None:
+        if not self.transport or new_session_created is None:
             # We failed silently on open().
             # Trying to send would be pointless.
             return 0
-        num_sent = 0
-        for message in email_messages:
-            sent = self._send(message)
-            if sent:
-                num_sent += 1
+        self.outcomes = []
+        try:
+            targets = self._get_targets(email_messages)
+            emailable = self._get_emailable(
+                {usernames[0] for usernames in targets.values() if len(usernames) == 1}
+            )
+        except ReplayMissError:
+            raise
+        except Exception as e:
+            if not self.fail_silently:
+                raise e
+        else:
+
+            def send(message):
+                return message, self._send(message, targets, emailable)
+
+            if self.workers > 1:
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    self.outcomes = list(executor.map(send, email_messages))
+            else:
+                self.outcomes = [send(message) for message in email_messages]
         if new_session_created:
             self.close()
-        return num_sent
+        return sum(1 for _, error in self.outcomes if error is None)
+
+    def _get_targets(self, email_messages):
+        """
+        A helper method that looks up the editors for every recipient in a
+        single query. Returns a dict mapping lowercased email addresses to
+        the wp_usernames registered with them.
+        """
+        recipients = {
+            recipient
+            for message in email_messages
+            for recipient in message.recipients()
+        }
+        targets = {}
+        for email, wp_username in Editor.objects.filter(
+            user__email__in=recipients
+        ).values_list("user__email", "wp_username"):
+            targets.setdefault(email.lower(), []).append(wp_username)
+        return targets
 
     @retry_conn()
-    def _send(self, email_message):
-        """A helper method that does the actual sending."""
+    def _get_emailable(self, usernames):
+        """
+        A helper method that checks which users can be emailed, asking the
+        API about as many users at once as it allows. Returns a set of
+        emailable usernames.
+        """
+        usernames = sorted(usernames)
+        emailable = set()
+        for i in range(0, len(usernames), self.usernames_per_request):
+            # GET request to check if users are emailable
+            emailable_params = {
+                "action": "query",
+                "list": "users",
+                "ususers": "|".join(usernames[i : i + self.usernames_per_request]),
+                "usprop": "emailable",
+                "maxlag": self.maxlag,
+                "format": "json",
+            }
+            emailable_response = self._post(emailable_params)
+            emailable.update(
+                user["name"]
+                for user in emailable_response["query"]["users"]
+                if "emailable" in user
+            )
+        return emailable
+
+    @retry_conn()
+    def _send(self, email_message, targets, emailable):
+        """
+        A helper method that does the actual sending. Returns None if the
+        message was sent, or why it wasn't.
+        """
         if not email_message.recipients():
-            return False
+            return "no recipients"
 
         try:
             for recipient in email_message.recipients():
                 # lookup the target editor from the email address
-                target_qs = Editor.objects.filter(user__email=recipient).values_list(
-                    "wp_username", flat=True
-                )
-                target_qs_count = target_qs.count()
-                if target_qs_count > 1:
+                target_usernames = targets.get(recipient.lower(), [])
+                if len(target_usernames) > 1:
                     raise Exception(
-                        "skip shared email address: {}".format(list(target_qs))
+                        "skip shared email address: {}".format(target_usernames)
                     )
+                if not target_usernames:
+                    raise Exception("skip unknown email address")
 
-                target = target_qs.first()
-
-                # GET request to check if user is emailable
-                emailable_params = {
-                    "action": "query",
-                    "list": "users",
-                    "ususers": target,
-                    "usprop": "emailable",
-                    "maxlag": self.maxlag,
-                    "format": "json",
-                }
-
-                emailable_response = self._handle_request(
-                    self.session.post(url=self.url, data=emailable_params)
-                )
-                emailable = "emailable" in emailable_response["query"]["users"][0]
-                if not emailable:
+                target = target_usernames[0]
+                if target not in emailable:
                     raise Exception("skip not emailable: {}".format(target))
 
                 # POST request to send an email
@@ -276,16 +419,17 @@ class EmailBackend(BaseEmailBackend):
                 }
 
                 logger.info("Sending email...")
-                emailuser_response = self._handle_request(
-                    self.session.post(url=self.url, data=email_params)
-                )
+                emailuser_response = self._post(email_params)
                 result = emailuser_response.get("emailuser", {}).get("result")
                 if result != "Success":
                     raise Exception(dumps(emailuser_response))
 
                 logger.info("Email sent.")
+        except ReplayMissError:
+            raise
         except Exception as e:
             if not self.fail_silently:
                 raise e
-            return False
-        return True
+            logger.warning("Email not sent: {}".format(e))
+            return str(e)
+        return None
@@ -0,0 +1,20 @@
+"""
+Email backend that queues messages for the send_queued_emails worker, so
+that requests and signal handlers never wait on the real backend.
+"""
+
+from django.core.mail.backends.base import BaseEmailBackend
+
+from TWLight.emails.queue import enqueue_email_messages
+
+
+class EmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        """
+        Queue one or more EmailMessage objects and return the number of
+        email messages queued.
+        """
+        if not email_messages:
+            return 0
+        enqueue_email_messages(email_messages)
+        return len(email_messages)
@@ -0,0 +1,260 @@
+"""
+Transports carry MediaWiki API requests for the mediawiki email backend.
+
+HTTPTransport talks to a real API server, which can be a local stand-in by
+pointing it at another URL. StandInTransport answers requests in-process,
+RecordingTransport saves another transport's responses to a file and
+ReplayTransport plays them back, so the backend can be exercised and
+measured without mocking its internals.
+"""
+
+import json
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from threading import Lock
+from time import sleep
+
+from requests import Session
+
+# Request parameters that are never written to recordings.
+REDACTED_PARAMS = {"lgname", "lgpassword", "lgtoken", "token", "subject", "text"}
+
+
+class ReplayMissError(LookupError):
+    """
+    Raised when a ReplayTransport is asked for a kind of request that isn't
+    in its recording. This is a problem with the recording, not with the
+    API, so the backend never treats it as a failed send.
+    """
+
+
+class TransportResponse:
+    """The parts of a requests.Response that the backend uses."""
+
+    def __init__(self, status_code=200, data=None, headers=None):
+        self.status_code = status_code
+        self.data = {} if data is None else data
+        self.headers = {} if headers is None else headers
+
+    def json(self):
+        return self.data
+
+
+def _request_key(method, params):
+    """Identifies the kind of API request, for matching up replies."""
+    return "{method} {action} {kind}".format(
+        method=method,
+        action=params.get("action", ""),
+        kind=params.get("meta") or params.get("list") or "",
+    )
+
+
+class Transport(ABC):
+    """
+    Base class for transports. Subclasses implement _request(), returning
+    an object with status_code, headers and json(), like requests.Response.
+    """
+
+    def __init__(self):
+        # The number of API requests made, including retries.
+        self.calls = 0
+        self.calls_lock = Lock()
+
+    def request(self, method, params):
+        """
+        Makes an API request.
+
+        Parameters
+        ----------
+        method : str
+            "GET" or "POST".
+        params : dict
+            The API parameters.
+
+        Returns
+        -------
+        requests.Response or TransportResponse
+        """
+        with self.calls_lock:
+            self.calls += 1
+        return self._request(method, params)
+
+    @abstractmethod
+    def _request(self, method, params):
+        pass
+
+    def close(self):
+        pass
+
+
+class HTTPTransport(Transport):
+    """Sends requests to a MediaWiki API server over HTTP."""
+
+    def __init__(self, url, headers=None, timeout=None):
+        super().__init__()
+        self.url = url
+        self.timeout = timeout
+        self.session = Session()
+        if headers is not None:
+            self.session.headers = headers
+
+    def _request(self, method, params):
+        if method == "GET":
+            return self.session.get(url=self.url, params=params, timeout=self.timeout)
+        return self.session.post(url=self.url, data=params, timeout=self.timeout)
+
+    def close(self):
+        self.session.close()
+
+
+class StandInTransport(Transport):
+    """
+    Answers API requests in-process, the way MediaWiki would if everything
+    went well. Every request is kept in self.requests, as (method, params).
+
+    Parameters
+    ----------
+    emailable : set
+        The usernames that can be emailed. None means everyone.
+    latency : float
+        Seconds to wait before answering each request.
+    maxlag_every : int
+        Answer every nth request with a maxlag error. 0 never does.
+    retry_after : float
+        The Retry-After header sent with maxlag errors.
+    """
+
+    def __init__(self, emailable=None, latency=0, maxlag_every=0, retry_after=0):
+        super().__init__()
+        self.emailable = emailable
+        self.latency = latency
+        self.maxlag_every = maxlag_every
+        self.retry_after = retry_after
+        self.requests = []
+
+    def _request(self, method, params):
+        with self.calls_lock:
+            self.requests.append((method, params))
+            calls = self.calls
+        if self.latency:
+            sleep(self.latency)
+
+        if self.maxlag_every and calls % self.maxlag_every == 0:
+            return TransportResponse(
+                data={"error": {"code": "maxlag", "lag": 1}},
+                headers={"Retry-After": str(self.retry_after)},
+            )
+
+        action = params.get("action")
+        if action == "login":
+            return TransportResponse(data={"login": {"result": "Success"}})
+        if action == "emailuser":
+            return TransportResponse(data={"emailuser": {"result": "Success"}})
+        if params.get("list") == "users":
+            return TransportResponse(
+                data={
+                    "query": {
+                        "users": [
+                            dict(
+                                name=name,
+                                **(
+                                    {"emailable": ""}
+                                    if self.emailable is None or name in self.emailable
+                                    else {}
+                                )
+                            )
+                            for name in params["ususers"].split("|")
+                        ]
+                    }
+                }
+            )
+        if params.get("meta") == "tokens":
+            token_name = "logintoken" if params.get("type") == "login" else "csrftoken"
+            return TransportResponse(data={"query": {"tokens": {token_name: "+\\"}}})
+        return TransportResponse(
+            data={"error": {"code": "badvalue", "info": "Unrecognized request."}}
+        )
+
+
+class RecordingTransport(Transport):
+    """
+    Passes requests on to another transport, writing each response to a
+    JSON lines file that ReplayTransport can play back. Credentials, tokens
+    and message contents are left out.
+    """
+
+    def __init__(self, transport, path):
+        super().__init__()
+        self.transport = transport
+        self.file = open(path, "a")
+        self.file_lock = Lock()
+
+    def _request(self, method, params):
+        response = self.transport.request(method, params)
+        record = {
+            "key": _request_key(method, params),
+            "params": {
+                key: value
+                for key, value in params.items()
+                if key not in REDACTED_PARAMS
+            },
+            "status_code": response.status_code,
+            "headers": dict(response.headers),
+            "data": response.json(),
+        }
+        with self.file_lock:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+        return response
+
+    def close(self):
+        self.transport.close()
+        self.file.close()
+
+
+class ReplayTransport(Transport):
+    """
+    Answers requests with responses saved by RecordingTransport. Responses
+    are played back in the order they were recorded, for each kind of
+    request; the last one is repeated once the others have been used, so a
+    short recording can stand in for a long run. Replies to user lookups are
+    rewritten for the usernames asked about, keeping the recorded users'
+    properties in turn.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.responses = defaultdict(list)
+        with open(path) as recording:
+            for line in recording:
+                if line.strip():
+                    record = json.loads(line)
+                    self.responses[record["key"]].append(record)
+        self.responses_lock = Lock()
+
+    def _request(self, method, params):
+        key = _request_key(method, params)
+        with self.responses_lock:
+            responses = self.responses.get(key)
+            if not responses:
+                raise ReplayMissError("No recorded response for {}".format(key))
+            record = responses.pop(0) if len(responses) > 1 else responses[0]
+        data = record["data"]
+        recorded_users = data.get("query", {}).get("users")
+        if params.get("list") == "users" and recorded_users:
+            data = {
+                "query": {
+                    "users": [
+                        dict(
+                            recorded_users[i % len(recorded_users)],
+                            name=name,
+                        )
+                        for i, name in enumerate(params["ususers"].split("|"))
+                    ]
+                }
+            }
+        return TransportResponse(
+            status_code=record["status_code"],
+            data=data,
+            headers=record["headers"],
+        )
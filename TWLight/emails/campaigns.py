@@ -0,0 +1,245 @@
+"""
+Chunked, resumable email campaigns.
+
+The users a campaign should reach are snapshotted once, when the campaign is
+created. run_campaign() then works through them a chunk at a time. A chunk's
+rows stay locked while it's being sent, and its outcomes are committed
+together, so an interrupted run only repeats the chunk it was in the middle
+of. Workers, whether threads or separate processes, skip each other's chunks.
+"""
+
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.db import connection as db_connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from TWLight.emails.models import (
+    EmailCampaign,
+    EmailCampaignRecipient,
+    EmailLedger,
+    Message,
+)
+from TWLight.emails.sending import send_email_messages
+
+logger = logging.getLogger(__name__)
+
+# Recipients claimed by a worker per transaction.
+CAMPAIGN_CHUNK_SIZE = 100
+# Recipients inserted per query while taking the snapshot.
+CAMPAIGN_SNAPSHOT_BATCH_SIZE = 1000
+
+
+def create_campaign(campaign: str, users, options=None, limit=None):
+    """
+    Creates a campaign, snapshotting the users it will be sent to.
+
+    Parameters
+    ----------
+    campaign : str
+        The EmailLedger key for the campaign.
+    users : QuerySet
+        The users to send to, in the order they should be sent to.
+    options : dict
+        Campaign specific settings, stored with the campaign.
+    limit : int
+        The most users to send to.
+
+    Returns
+    -------
+    EmailCampaign
+        The new campaign.
+    """
+    user_pks = users.values_list("pk", flat=True)
+    if limit is not None:
+        user_pks = user_pks[:limit]
+
+    with transaction.atomic():
+        email_campaign = EmailCampaign.objects.create(
+            campaign=campaign, options=options or {}
+        )
+        recipients = []
+        total = 0
+        for pk in user_pks.iterator(chunk_size=CAMPAIGN_SNAPSHOT_BATCH_SIZE):
+            recipients.append(
+                EmailCampaignRecipient(campaign=email_campaign, user_id=pk)
+            )
+            if len(recipients) >= CAMPAIGN_SNAPSHOT_BATCH_SIZE:
+                EmailCampaignRecipient.objects.bulk_create(recipients)
+                total += len(recipients)
+                recipients = []
+        EmailCampaignRecipient.objects.bulk_create(recipients)
+        total += len(recipients)
+
+        email_campaign.recipients_total = total
+        email_campaign.save(update_fields=["recipients_total"])
+    return email_campaign
+
+
+def _send_chunk(email_campaign, make_email, connection, chunk_size):
+    """
+    Claim a chunk of pending recipients and send to them, handing the
+    chunk's emails to the connection together.
+
+    Returns the number of recipients claimed.
+    """
+    with transaction.atomic():
+        recipients = list(
+            EmailCampaignRecipient.objects.select_for_update(skip_locked=True)
+            .filter(campaign=email_campaign, status=EmailCampaignRecipient.PENDING)
+            .order_by("pk")[:chunk_size]
+        )
+        if not recipients:
+            return 0
+        users = User.objects.select_related("userprofile").in_bulk(
+            [recipient.user_id for recipient in recipients]
+        )
+
+        to_send = []
+        for recipient in recipients:
+            try:
+                to_send.append((recipient, make_email(users[recipient.user_id])))
+            except Exception:
+                logger.exception(
+                    "Building {campaign} for user {pk} failed.".format(
+                        campaign=email_campaign.campaign, pk=recipient.user_id
+                    )
+                )
+                recipient.status = EmailCampaignRecipient.FAILED
+
+        errors = send_email_messages(
+            connection, [email_message for _, email_message in to_send]
+        )
+        messages = []
+        now = timezone.now()
+        for (recipient, email_message), error in zip(to_send, errors):
+            message = Message.from_email_message(email_message)
+            # bulk_create skips djmail's pre_save signal, which sets the uuid.
+            message.uuid = str(uuid.uuid1())
+            if error is None:
+                recipient.status = EmailCampaignRecipient.SENT
+                message.status = Message.STATUS_SENT
+                message.sent_at = now
+            else:
+                recipient.status = EmailCampaignRecipient.FAILED
+                message.status = Message.STATUS_FAILED
+                message.exception = error
+            messages.append(message)
+        Message.objects.bulk_create(messages)
+
+        EmailCampaignRecipient.objects.bulk_update(recipients, ["status"])
+        sent_pks = [
+            recipient.user_id
+            for recipient in recipients
+            if recipient.status == EmailCampaignRecipient.SENT
+        ]
+        failed_pks = [
+            recipient.user_id
+            for recipient in recipients
+            if recipient.status == EmailCampaignRecipient.FAILED
+        ]
+        EmailLedger.objects.record(email_campaign.campaign, sent_pks, EmailLedger.SENT)
+        EmailLedger.objects.record(
+            email_campaign.campaign, failed_pks, EmailLedger.FAILED
+        )
+        EmailCampaign.objects.filter(pk=email_campaign.pk).update(
+            recipients_sent=F("recipients_sent") + len(sent_pks),
+            recipients_failed=F("recipients_failed") + len(failed_pks),
+        )
+    return len(recipients)
+
+
+def _log_progress(email_campaign):
+    email_campaign.refresh_from_db(
+        fields=["recipients_total", "recipients_sent", "recipients_failed"]
+    )
+    logger.info(
+        "Campaign {pk}: {processed}/{total} processed, {failed} failed, "
+        "{rate:.1f} per second.".format(
+            pk=email_campaign.pk,
+            processed=email_campaign.recipients_processed,
+            total=email_campaign.recipients_total,
+            failed=email_campaign.recipients_failed,
+            rate=email_campaign.throughput,
+        )
+    )
+
+
+def _run_worker(email_campaign, make_email, get_connection, chunk_size):
+    connection = get_connection()
+    connection.open()
+    try:
+        while _send_chunk(email_campaign, make_email, connection, chunk_size):
+            _log_progress(email_campaign)
+    finally:
+        connection.close()
+
+
+def _run_worker_in_thread(email_campaign, make_email, get_connection, chunk_size):
+    try:
+        _run_worker(email_campaign, make_email, get_connection, chunk_size)
+    finally:
+        # Each thread gets its own database connection, which would
+        # otherwise be left open.
+        db_connection.close()
+
+
+def run_campaign(
+    email_campaign: EmailCampaign,
+    make_email,
+    get_connection,
+    workers: int = 1,
+    chunk_size: int = CAMPAIGN_CHUNK_SIZE,
+):
+    """
+    Sends, or resumes sending, a campaign to its pending recipients.
+
+    Parameters
+    ----------
+    email_campaign : EmailCampaign
+        The campaign to run.
+    make_email : callable
+        Called with a User. Returns the EmailMessage to send them.
+    get_connection : callable
+        Returns a new email connection. Each worker opens its own.
+    workers : int
+        The number of chunks to send at once.
+    chunk_size : int
+        The number of recipients each worker claims at a time.
+
+    Returns
+    -------
+    EmailCampaign
+        The campaign, with its progress refreshed.
+    """
+    EmailCampaign.objects.filter(
+        pk=email_campaign.pk, date_started__isnull=True
+    ).update(date_started=timezone.now())
+    EmailCampaign.objects.filter(pk=email_campaign.pk).update(
+        status=EmailCampaign.IN_PROGRESS
+    )
+    email_campaign.refresh_from_db()
+
+    args = (email_campaign, make_email, get_connection, chunk_size)
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [
+                executor.submit(_run_worker_in_thread, *args) for _ in range(workers)
+            ]:
+                future.result()
+    else:
+        _run_worker(*args)
+
+    # Workers in other processes may still be finishing their chunks, in which
+    # case the last of them to finish completes the campaign.
+    if not email_campaign.recipients.filter(
+        status=EmailCampaignRecipient.PENDING
+    ).exists():
+        EmailCampaign.objects.filter(pk=email_campaign.pk).update(
+            status=EmailCampaign.COMPLETE, date_completed=timezone.now()
+        )
+    email_campaign.refresh_from_db()
+    return email_campaign
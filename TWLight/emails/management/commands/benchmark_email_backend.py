@@ -0,0 +1,170 @@
+import logging
+from time import monotonic
+
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from TWLight.emails.backends.mediawiki import EmailBackend
+from TWLight.emails.backends.transports import (
+    HTTPTransport,
+    ReplayMissError,
+    ReplayTransport,
+    StandInTransport,
+)
+from TWLight.users.models import Editor
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Pushes synthetic messages through the MediaWiki email backend and "
+        "reports its throughput. The synthetic editors the messages are "
+        "addressed to are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--messages", type=int, default=100, help="Number of messages to send."
+        )
+        parser.add_argument(
+            "--workers", type=int, default=1, help="Number of sending threads."
+        )
+        parser.add_argument(
+            "--delay",
+            type=float,
+            default=0,
+            help="Seconds between API requests, as MW_API_REQUEST_DELAY.",
+        )
+        parser.add_argument(
+            "--transport",
+            choices=["stand-in", "replay", "http"],
+            default="stand-in",
+            help="Answer requests in-process, from a recording, or over HTTP.",
+        )
+        parser.add_argument(
+            "--replay-file", help="Recording to play back with --transport=replay."
+        )
+        parser.add_argument(
+            "--url",
+            help="API URL for --transport=http, such as a local stand-in server.",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0,
+            help="Seconds the stand-in transport takes to answer each request.",
+        )
+        parser.add_argument(
+            "--maxlag-every",
+            type=int,
+            default=0,
+            help="Have the stand-in transport answer every nth request with maxlag.",
+        )
+        parser.add_argument(
+            "--retry-after",
+            type=float,
+            default=1,
+            help="Retry-After seconds the stand-in transport sends with maxlag.",
+        )
+
+    def get_transport(self, options):
+        if options["transport"] == "replay":
+            if not options["replay_file"]:
+                raise CommandError("--transport=replay needs --replay-file.")
+            return ReplayTransport(options["replay_file"])
+        if options["transport"] == "http":
+            if not options["url"]:
+                raise CommandError("--transport=http needs --url.")
+            return HTTPTransport(options["url"], timeout=60)
+        return StandInTransport(
+            latency=options["latency"],
+            maxlag_every=options["maxlag_every"],
+            retry_after=options["retry_after"],
+        )
+
+    def create_editors(self, count):
+        users = User.objects.bulk_create(
+            [
+                User(
+                    username="benchmark-{}".format(i),
+                    email="benchmark-{}@example.com".format(i),
+                )
+                for i in range(count)
+            ]
+        )
+        # bulk_create doesn't hand back primary keys on every database.
+        users = User.objects.filter(
+            username__in=[user.username for user in users]
+        ).order_by("pk")
+        Editor.objects.bulk_create(
+            [
+                Editor(
+                    user=user,
+                    wp_username="Benchmark {}".format(i),
+                    wp_sub=-(i + 1),
+                    wp_registered=timezone.now().date(),
+                )
+                for i, user in enumerate(users)
+            ]
+        )
+        return [user.email for user in users]
+
+    def handle(self, *args, **options):
+        transport = self.get_transport(options)
+        backend = EmailBackend(
+            delay=options["delay"],
+            workers=options["workers"],
+            username="benchmark",
+            password="benchmark",
+            transport=transport,
+            fail_silently=True,
+        )
+
+        with transaction.atomic():
+            messages = [
+                EmailMessage("Benchmark", "Benchmark message", to=[email])
+                for email in self.create_editors(options["messages"])
+            ]
+            try:
+                backend.open()
+                # Don't count logging in.
+                setup_calls = transport.calls
+
+                start = monotonic()
+                sent = backend.send_messages(messages)
+                elapsed = monotonic() - start
+            except ReplayMissError as e:
+                raise CommandError(
+                    "{error}; record a run that covers it first.".format(error=e)
+                )
+
+            backend.close()
+            transport.close()
+            transaction.set_rollback(True)
+
+        calls = transport.calls - setup_calls
+        paused = backend.rate_limiter.paused_time
+        throttled = backend.rate_limiter.throttled_time
+        # Sleeping is counted per thread, so working time is too.
+        working = max(0, elapsed * options["workers"] - paused - throttled)
+        self.stdout.write(
+            "Sent {sent} of {total} messages in {elapsed:.2f}s\n"
+            "Messages per second: {rate:.2f}\n"
+            "API calls per message: {calls_per_message:.2f}\n"
+            "Thread time sleeping for maxlag: {paused:.2f}s\n"
+            "Thread time sleeping for the rate limit: {throttled:.2f}s\n"
+            "Thread time working: {working:.2f}s".format(
+                sent=sent,
+                total=len(messages),
+                elapsed=elapsed,
+                rate=sent / elapsed if elapsed else 0,
+                calls_per_message=calls / len(messages) if messages else 0,
+                paused=paused,
+                throttled=throttled,
+                working=working,
+            )
+        )
@@ -0,0 +1,16 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from TWLight.emails.tasks import send_comment_notification_digests
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Sends comment notification digests that have waited long enough."
+
+    def handle(self, *args, **options):
+        sent = send_comment_notification_digests()
+        if sent:
+            logger.info("Sent {sent} comment digests.".format(sent=sent))
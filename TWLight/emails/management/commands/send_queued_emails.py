@@ -0,0 +1,40 @@
+import logging
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from TWLight.emails.queue import send_queued_messages
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Sends queued emails through the real email backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of batches to send at once.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running, checking the queue every --interval seconds.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=10,
+            help="Seconds to wait between queue checks with --loop.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent = send_queued_messages(workers=options["workers"])
+            if sent:
+                logger.info("Sent {sent} queued emails.".format(sent=sent))
+            if not options["loop"]:
+                return
+            sleep(options["interval"])
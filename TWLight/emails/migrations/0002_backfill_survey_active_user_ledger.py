@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.db import migrations
+from django.utils.translation import gettext, override
+
+
+def backfill_survey_active_user_ledger(apps, schema_editor):
+    """
+    Adds ledger entries for users who were already sent a survey invitation,
+    found the way the survey command used to: by localized subject line.
+    """
+    message_model = apps.get_model("djmail", "Message")
+    user_model = apps.get_model("auth", "User")
+    ledger_model = apps.get_model("emails", "EmailLedger")
+
+    subjects = set()
+    for lang_code, _lang_name in settings.LANGUAGES:
+        try:
+            with override(lang_code):
+                subjects.add(gettext("The Wikipedia Library needs your help!"))
+        except ValueError:
+            pass
+
+    previous_recipients = message_model.objects.filter(
+        subject__in=subjects
+    ).values_list("to_email", flat=True)
+    user_pks = user_model.objects.filter(email__in=previous_recipients).values_list(
+        "pk", flat=True
+    )
+    ledger_model.objects.bulk_create(
+        (
+            ledger_model(campaign="survey_active_user", user_id=pk, status=0)
+            for pk in user_pks.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("djmail", "0002_auto_20161118_1347"),
+        ("emails", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_survey_active_user_ledger, migrations.RunPython.noop
+        )
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 5.2.15 on 2026-10-19 11:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("emails", "0002_backfill_survey_active_user_ledger"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmailCampaign",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "campaign",
+                    models.CharField(
+                        help_text="The EmailLedger key for this campaign.",
+                        max_length=100,
+                    ),
+                ),
+                (
+                    "options",
+                    models.JSONField(
+                        blank=True,
+                        default=dict,
+                        help_text="Campaign specific settings, such as a survey's ID.",
+                    ),
+                ),
+                (
+                    "status",
+                    models.IntegerField(
+                        choices=[(0, "Pending"), (1, "In progress"), (2, "Complete")],
+                        default=0,
+                    ),
+                ),
+                ("recipients_total", models.PositiveIntegerField(default=0)),
+                ("recipients_sent", models.PositiveIntegerField(default=0)),
+                ("recipients_failed", models.PositiveIntegerField(default=0)),
+                ("date_created", models.DateTimeField(auto_now_add=True)),
+                ("date_started", models.DateTimeField(blank=True, null=True)),
+                ("date_completed", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "email campaign",
+                "verbose_name_plural": "email campaigns",
+            },
+        ),
+        migrations.CreateModel(
+            name="EmailCampaignRecipient",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.IntegerField(
+                        choices=[(0, "Pending"), (1, "Sent"), (2, "Failed")], default=0
+                    ),
+                ),
+                (
+                    "campaign",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recipients",
+                        to="emails.emailcampaign",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["campaign", "status"],
+                        name="emails_emai_campaig_a16cea_idx",
+                    )
+                ],
+            },
+        ),
+    ]
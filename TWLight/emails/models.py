@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
+from datetime import timedelta
+
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
-from django.utils.translation import gettext as _, override
+from django.db import models, transaction
+from django.utils import timezone
 
+from django_comments.models import Comment
 from djmail.models import Message
 
 from TWLight.users.models import UserProfile
@@ -13,6 +16,28 @@ class MessageQuerySet(models.QuerySet):
     def unsent(self):
         return self.exclude(status=Message.STATUS_SENT)
 
+    def due(self, now=None):
+        """
+        Queued messages that are ready to be sent. Failed messages wait
+        EMAIL_QUEUE_RETRY_BACKOFF seconds, doubling with every attempt, counted
+        from their last attempt. The queue worker records that in sent_at;
+        failures without it count from when they were queued.
+        """
+        now = timezone.now() if now is None else now
+        backoff = settings.EMAIL_QUEUE_RETRY_BACKOFF
+        max_retries = getattr(settings, "DJMAIL_MAX_RETRY_NUMBER", 3)
+        retry_due = models.Q()
+        for retry_count in range(1, max_retries + 1):
+            retry_after = now - timedelta(seconds=backoff * 2**retry_count)
+            retry_due |= models.Q(retry_count=retry_count) & (
+                models.Q(sent_at__lte=retry_after)
+                | models.Q(sent_at__isnull=True, created_at__lte=retry_after)
+            )
+        return self.filter(
+            models.Q(status=Message.STATUS_PENDING)
+            | models.Q(retry_due, status=Message.STATUS_FAILED)
+        )
+
     def users_with_unsent(self):
         email_addresses = self.unsent().values_list("to_email", flat=True)
         return User.objects.filter(email__in=email_addresses)
@@ -23,28 +48,6 @@ class MessageQuerySet(models.QuerySet):
             user__email__in=email_addresses
         )
 
-    def user_pks_with_subject_list(self, subject, users):
-        if users is None:
-            return []
-
-        subjects = []
-        # Get the localized subject for each available language
-        for lang_code, _lang_name in settings.LANGUAGES:
-            try:
-                with override(lang_code):
-                    # Translators: do not translate
-                    subjects.append(_(subject))
-            except ValueError:
-                pass
-
-        # Search for repients of existing messages with the one of the localized email subjects.
-        previous_recipients = self.filter(
-            subject__in=subjects,
-        ).values_list("to_email", flat=True)
-
-        # return a list of pks for users with matching email addresses
-        return users.filter(email__in=previous_recipients).values_list("pk", flat=True)
-
 
 class MessageManager(models.Manager):
     def get_queryset(self):
@@ -53,14 +56,193 @@ class MessageManager(models.Manager):
     def unsent(self):
         return self.get_queryset().unsent()
 
+    def due(self, now=None):
+        return self.get_queryset().due(now)
+
     def userprofiles_with_unsent(self):
         return self.get_queryset().userprofiles_with_unsent()
 
-    def user_pks_with_subject_list(self, subject, users):
-        return self.get_queryset().user_pks_with_subject_list(
-            subject=subject, users=users
-        )
-
 
 # add "twl" manager to Message
 Message.add_to_class("twl", MessageManager())
+
+
+class EmailLedgerQuerySet(models.QuerySet):
+    def contacted(self, campaign):
+        return self.filter(campaign=campaign)
+
+    def exclude_contacted(self, campaign, users):
+        """
+        Filters out users who already have an entry for the campaign, whether
+        or not their email went through.
+        """
+        return users.exclude(
+            models.Exists(self.filter(campaign=campaign, user=models.OuterRef("pk")))
+        )
+
+    def record(self, campaign, user_pks, status):
+        """
+        Records the outcome of a campaign's emails to a group of users.
+        """
+        user_pks = list(user_pks)
+        now = timezone.now()
+        # Replacing entries keeps this portable; MariaDB can't name the
+        # conflicting fields in an upsert.
+        with transaction.atomic(using=self.db):
+            self.filter(campaign=campaign, user_id__in=user_pks).delete()
+            self.bulk_create(
+                [
+                    EmailLedger(
+                        campaign=campaign, user_id=pk, status=status, sent_at=now
+                    )
+                    for pk in user_pks
+                ]
+            )
+
+
+class EmailLedger(models.Model):
+    """
+    Records which users each email campaign has contacted. Campaigns check
+    here, rather than searching the Message table by subject, to skip users
+    they've already emailed.
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["campaign", "user"], name="unique_campaign_user"
+            )
+        ]
+
+    SENT = 0
+    FAILED = 1
+
+    STATUS_CHOICES = (
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    )
+
+    campaign = models.CharField(
+        max_length=100, help_text="A key naming the email campaign."
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    sent_at = models.DateTimeField(default=timezone.now)
+    status = models.IntegerField(choices=STATUS_CHOICES, default=SENT)
+
+    objects = EmailLedgerQuerySet.as_manager()
+
+    def __str__(self):
+        return "{campaign}: {user}".format(campaign=self.campaign, user=self.user_id)
+
+
+class EmailCampaign(models.Model):
+    """
+    A run of an email campaign over a fixed list of recipients. The eligible
+    users are snapshotted once, as EmailCampaignRecipients, and then sent to
+    in chunks (see TWLight.emails.campaigns), so an interrupted run picks up
+    where it left off.
+    """
+
+    class Meta:
+        verbose_name = "email campaign"
+        verbose_name_plural = "email campaigns"
+
+    PENDING = 0
+    IN_PROGRESS = 1
+    COMPLETE = 2
+
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (IN_PROGRESS, "In progress"),
+        (COMPLETE, "Complete"),
+    )
+
+    campaign = models.CharField(
+        max_length=100, help_text="The EmailLedger key for this campaign."
+    )
+    options = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Campaign specific settings, such as a survey's ID.",
+    )
+    status = models.IntegerField(choices=STATUS_CHOICES, default=PENDING)
+    recipients_total = models.PositiveIntegerField(default=0)
+    recipients_sent = models.PositiveIntegerField(default=0)
+    recipients_failed = models.PositiveIntegerField(default=0)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_started = models.DateTimeField(blank=True, null=True)
+    date_completed = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return "{campaign} {date} - {status}".format(
+            campaign=self.campaign,
+            date=self.date_created,
+            status=self.get_status_display(),
+        )
+
+    @property
+    def recipients_processed(self):
+        return self.recipients_sent + self.recipients_failed
+
+    @property
+    def throughput(self):
+        """
+        Recipients processed per second since the campaign started.
+        """
+        if not self.date_started:
+            return 0.0
+        end = self.date_completed or timezone.now()
+        seconds = (end - self.date_started).total_seconds()
+        return self.recipients_processed / seconds if seconds > 0 else 0.0
+
+
+class EmailCampaignRecipient(models.Model):
+    class Meta:
+        indexes = [models.Index(fields=["campaign", "status"])]
+
+    PENDING = 0
+    SENT = 1
+    FAILED = 2
+
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    )
+
+    campaign = models.ForeignKey(
+        EmailCampaign, on_delete=models.CASCADE, related_name="recipients"
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    status = models.IntegerField(choices=STATUS_CHOICES, default=PENDING)
+
+    def __str__(self):
+        return "{campaign}: {user}".format(campaign=self.campaign_id, user=self.user_id)
+
+
+class PendingCommentNotification(models.Model):
+    """
+    A comment someone should hear about in their next comment digest. Only
+    used when COMMENT_NOTIFICATION_DIGEST_WINDOW is set; see
+    TWLight.emails.tasks.send_comment_notification_digests.
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "comment"], name="unique_pending_comment_notification"
+            )
+        ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name="+")
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "{user}: {comment}".format(user=self.user_id, comment=self.comment_id)
@@ -0,0 +1,140 @@
+"""
+A durable outbound email queue on djmail's Message table.
+
+The queued email backend (TWLight.emails.backends.queued) only inserts rows,
+once the surrounding transaction commits. The send_queued_emails management
+command drains the queue through settings.DJMAIL_REAL_BACKEND, retrying
+failures with exponential backoff and discarding messages that keep failing.
+"""
+
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
+
+from TWLight.emails.models import Message
+from TWLight.emails.sending import send_email_messages
+
+# Messages claimed by a worker per transaction.
+EMAIL_QUEUE_BATCH_SIZE = 50
+
+
+def enqueue_email_messages(email_messages):
+    """
+    Queue EmailMessages to be sent by the queue worker. Rows are inserted
+    once the current transaction commits, so emails about changes that get
+    rolled back are never sent.
+
+    Parameters
+    ----------
+    email_messages : list
+        The EmailMessage objects to queue.
+
+    Returns
+    -------
+    None
+    """
+    messages = []
+    for email_message in email_messages:
+        message = Message.from_email_message(email_message)
+        # bulk_create skips djmail's pre_save signal, which sets the uuid.
+        message.uuid = str(uuid.uuid1())
+        message.status = Message.STATUS_PENDING
+        message.retry_count = 0
+        messages.append(message)
+    transaction.on_commit(lambda: Message.objects.bulk_create(messages))
+
+
+def _record_outcome(message, error):
+    """
+    Record what happened to a queued message. sent_at is when it was last
+    tried, which failed messages back off from. Messages that have failed
+    more than DJMAIL_MAX_RETRY_NUMBER times are discarded.
+    """
+    message.sent_at = timezone.now()
+    if error is None:
+        message.status = Message.STATUS_SENT
+        return
+    message.exception = error
+    message.retry_count += 1
+    if message.retry_count > getattr(settings, "DJMAIL_MAX_RETRY_NUMBER", 3):
+        message.status = Message.STATUS_DISCARDED
+    else:
+        message.status = Message.STATUS_FAILED
+
+
+def _send_batch(now):
+    """
+    Claim a batch of messages that were due at now and send them, handing
+    the whole batch to the connection at once. Claimed rows stay locked
+    until the batch is done, and other workers skip over them.
+
+    Returns the number of messages claimed and sent.
+    """
+    with transaction.atomic():
+        messages = list(
+            Message.twl.due(now)
+            .select_for_update(skip_locked=True)
+            .order_by("-priority", "created_at")[:EMAIL_QUEUE_BATCH_SIZE]
+        )
+        if not messages:
+            return 0, 0
+        connection = get_connection(
+            backend=settings.DJMAIL_REAL_BACKEND, fail_silently=False
+        )
+        connection.open()
+        try:
+            errors = send_email_messages(
+                connection, [message.get_email_message() for message in messages]
+            )
+        finally:
+            connection.close()
+        for message, error in zip(messages, errors):
+            _record_outcome(message, error)
+        Message.objects.bulk_update(
+            messages, ["status", "sent_at", "retry_count", "exception"]
+        )
+        return len(messages), errors.count(None)
+
+
+def _send_batch_in_thread(now):
+    try:
+        return _send_batch(now)
+    finally:
+        # Each thread gets its own database connection, which would
+        # otherwise be left open.
+        db_connection.close()
+
+
+def send_queued_messages(workers=1):
+    """
+    Send every message that's due in the queue. Messages that fail are left
+    for a later run, once they've backed off, rather than retried straight
+    away.
+
+    Parameters
+    ----------
+    workers : int
+        The number of batches to send at once.
+
+    Returns
+    -------
+    int
+        The number of messages sent.
+    """
+    # Only messages due when the run started are sent, so failures made
+    # during the run aren't claimed again by its later batches.
+    now = timezone.now()
+    total_sent = 0
+    while True:
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_send_batch_in_thread, [now] * workers))
+        else:
+            results = [_send_batch(now)]
+        total_sent += sum(sent for _, sent in results)
+        if not any(claimed for claimed, _ in results):
+            return total_sent
@@ -0,0 +1,106 @@
+"""
+Compiled template cache for djmail TemplateMail classes.
+
+djmail looks its templates up through render_to_string() for every message it
+builds. CachedTemplateMail holds on to the compiled templates instead, so that
+building a batch of emails only costs rendering each context.
+"""
+
+import logging
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist, loader
+from djmail import exceptions as exc
+from djmail import template_mail
+
+logger = logging.getLogger(__name__)
+
+# Compiled templates keyed by template name. Translations are resolved when a
+# template is rendered, so one compiled template serves every language.
+_compiled_templates = {}
+# Stands in for templates that don't exist, so we don't keep looking for them.
+_MISSING = object()
+
+
+def get_compiled_template(template_name: str):
+    """
+    Returns a compiled template, loading it on first use. Nothing is cached
+    while DEBUG is on, so template edits show up straight away.
+
+    Parameters
+    ----------
+    template_name : str
+        The name of the template to load.
+
+    Returns
+    -------
+    django.template.backends.django.Template or None
+        None if the template doesn't exist.
+    """
+    template = _compiled_templates.get(template_name)
+    if template is None:
+        try:
+            template = loader.get_template(template_name)
+        except TemplateDoesNotExist:
+            template = _MISSING
+        if not settings.DEBUG:
+            _compiled_templates[template_name] = template
+    return None if template is _MISSING else template
+
+
+def clear_template_cache():
+    """
+    Forgets every compiled template, so they're loaded again on next use.
+
+    Returns
+    -------
+    None
+    """
+    _compiled_templates.clear()
+
+
+class CachedTemplateMail(template_mail.TemplateMail):
+    """
+    A TemplateMail that renders from cached compiled templates and can build
+    a batch of emails in one call.
+    """
+
+    def _render_message_body(self, context, t):
+        template_name = self._get_template_name(t)
+        template = get_compiled_template(template_name)
+        if template is None:
+            logger.warning("Template '{0}' does not exist.".format(template_name))
+            return None
+        return template.render(context)
+
+    def _render_message_subject(self, context):
+        template_name = self._subject_template_name.format(
+            ext=template_mail._get_template_extension(), name=self.name
+        )
+        template = get_compiled_template(template_name)
+        if template is None:
+            raise exc.TemplateNotFound(
+                "Template '{0}' does not exist.".format(template_name)
+            )
+        return " ".join(template.render(context).strip().split())
+
+    def make_email_objects(self, recipients, **kwargs):
+        """
+        Builds one email per recipient, each in its recipient's language.
+        The templates are compiled once and reused for every email.
+
+        Parameters
+        ----------
+        recipients : iterable
+            (to, context) pairs, as taken by make_email_object().
+        **kwargs
+            Passed on to every email object.
+
+        Returns
+        -------
+        list
+            The email objects, in the same order as recipients.
+        """
+        return [
+            self.make_email_object(to, context, **kwargs) for to, context in recipients
+        ]
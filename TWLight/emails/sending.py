@@ -0,0 +1,64 @@
+"""
+Sends a batch of emails through one connection, finding out what happened
+to each of them.
+"""
+
+import io
+import logging
+import traceback
+
+logger = logging.getLogger(__name__)
+
+
+def _format_exception():
+    with io.StringIO() as f:
+        traceback.print_exc(file=f)
+        return f.getvalue()
+
+
+def send_email_messages(connection, email_messages):
+    """
+    Sends EmailMessages through an open connection. Backends that report on
+    each message, through an outcomes list like the MediaWiki backend's, are
+    handed the whole batch in one send_messages() call, so they can work
+    through it concurrently. Other backends only say how many messages were
+    sent, so they're handed one message at a time.
+
+    Parameters
+    ----------
+    connection : BaseEmailBackend
+        The connection to send through.
+    email_messages : list
+        The EmailMessage objects to send.
+
+    Returns
+    -------
+    list
+        For each message, in order, None if it was sent, or why it wasn't.
+    """
+    if not email_messages:
+        return []
+
+    if hasattr(connection, "outcomes"):
+        try:
+            connection.send_messages(email_messages)
+        except Exception:
+            error = _format_exception()
+            logger.error(error)
+            return [error] * len(email_messages)
+        # Outcomes are matched up by identity; a connection that failed
+        # silently may still hold the outcomes of an earlier batch.
+        outcomes = {id(message): error for message, error in connection.outcomes}
+        return [outcomes.get(id(message), "not sent") for message in email_messages]
+
+    errors = []
+    for email_message in email_messages:
+        try:
+            sent = connection.send_messages([email_message])
+        except Exception:
+            error = _format_exception()
+            logger.error(error)
+            errors.append(error)
+        else:
+            errors.append(None if sent else "not sent")
+    return errors
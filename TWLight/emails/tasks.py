@@ -7,7 +7,9 @@ Any view that wishes to send an email should do so using a task defined here.
 Templates for these emails are available in emails/templates/emails. djmail
 will look for files named {{ name }}-body-html.html, {{ name }}-body-text.html,
 and {{ name }}-subject.html, where {{ name }} is the name attribute of the
-TemplateMail subclass.
+TemplateMail subclass. Subclass CachedTemplateMail, which keeps those templates
+compiled between emails, and use its make_email_objects() when building emails
+in bulk.
 
 Email templates are normal Django templates. This means two important things:
 1) They can be rendered with context;
@@ -22,25 +24,30 @@ whether to send synchronously or asynchronously based on the value of
 settings.DJMAIL_REAL_BACKEND.
 """
 
-from djmail import template_mail
-from djmail.template_mail import MagicMailBuilder, InlineCSSTemplateMail
+from djmail.template_mail import InlineCSSTemplateMail
 import logging
 import os
+from datetime import timedelta
 from uuid import uuid4
 from reversion.models import Version
 
 from django_comments.models import Comment
 from django_comments.signals import comment_was_posted
+from django.contrib.auth.models import User
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.mail import get_connection
 from django.urls import reverse_lazy
 from django.utils import timezone
+from django.db import transaction
+from django.db.models import Min
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
 from django.shortcuts import get_object_or_404
 
 from TWLight.applications.models import Application
-from TWLight.applications.signals import Reminder
+from TWLight.applications.signals import AccessCodes, ApplicationStatus, Reminder
+from TWLight.emails.models import PendingCommentNotification
+from TWLight.emails.rendering import CachedTemplateMail
 from TWLight.resources.models import AccessCode, Partner
 from TWLight.users.groups import get_restricted
 from TWLight.users.signals import Notice, UserLoginRetrieval
@@ -60,64 +67,66 @@ def email_connection(backend=None, connection=None):
     return get_connection(backend=backend) if connection is None else connection
 
 
-class CommentNotificationEmailEditors(template_mail.TemplateMail):
+class CommentNotificationEmailEditors(CachedTemplateMail):
     name = "comment_notification_editors"
 
 
-class CommentNotificationCoordinators(template_mail.TemplateMail):
+class CommentNotificationCoordinators(CachedTemplateMail):
     name = "comment_notification_coordinator"
 
 
-class CommentNotificationEmailOthers(template_mail.TemplateMail):
+class CommentNotificationEmailOthers(CachedTemplateMail):
     name = "comment_notification_others"
 
 
-class ApprovalNotification(template_mail.TemplateMail):
+class CommentNotificationDigest(CachedTemplateMail):
+    name = "comment_notification_digest"
+
+
+class ApprovalNotification(CachedTemplateMail):
     name = "approval_notification"
 
 
-class WaitlistNotification(template_mail.TemplateMail):
+class WaitlistNotification(CachedTemplateMail):
     name = "waitlist_notification"
 
 
-class RejectionNotification(template_mail.TemplateMail):
+class RejectionNotification(CachedTemplateMail):
     name = "rejection_notification"
 
 
-class SurveyActiveUser(template_mail.TemplateMail):
+class SurveyActiveUser(CachedTemplateMail):
     name = "survey_active_user"
 
 
-class Test(template_mail.TemplateMail):
+class Test(CachedTemplateMail):
     name = "test"
 
 
-class CoordinatorReminderNotification(template_mail.TemplateMail):
+class CoordinatorReminderNotification(CachedTemplateMail):
     name = "coordinator_reminder_notification"
 
 
-class UserRenewalNotice(template_mail.TemplateMail):
+class UserRenewalNotice(CachedTemplateMail):
     name = "user_renewal_notice"
 
 
-class UserRetrieveMonthlyLogins(template_mail.TemplateMail):
+class UserRetrieveMonthlyLogins(CachedTemplateMail):
     name = "user_retrieve_monthly_logins"
 
 
-@receiver(Reminder.coordinator_reminder)
-def send_coordinator_reminder_emails(sender, **kwargs):
-    """
-    Any time the related management command is run, this sends email to the
-    to designated coordinators, reminding them to login
-    to the site if there are pending applications.
-    """
-    app_status_and_count = kwargs["app_status_and_count"]
+class AccessCodeEmail(CachedTemplateMail):
+    name = "access_code_email"
+
+
+def _coordinator_reminder_recipient(reminder, link):
+    app_status_and_count = reminder["app_status_and_count"]
     pending_count = None
     question_count = None
     approved_count = None
     total_apps = 0
     # We unwrap app_status_and_count and take stock of the data
-    # in a way that's convenient for us to use in email.send
+    # in a way that's convenient for us to use in the email.
     for status, count in app_status_and_count.items():
         if count != 0 and status == Application.PENDING:
             pending_count = count
@@ -129,26 +138,11 @@ def send_coordinator_reminder_emails(sender, **kwargs):
             approved_count = count
             total_apps += count
 
-    coordinator_wp_username = kwargs["coordinator_wp_username"]
-    coordinator_email = kwargs["coordinator_email"]
-    coordinator_lang = kwargs["coordinator_lang"]
-    base_url = get_current_site(None).domain
-    path = reverse_lazy("applications:list")
-    link = "https://{base}{path}".format(base=base_url, path=path)
-
-    logger.info(
-        "Received coordinator reminder signal for {coordinator_wp_username}; "
-        "preparing to send reminder email.".format(
-            coordinator_wp_username=coordinator_wp_username
-        )
-    )
-    email = CoordinatorReminderNotification()
-    logger.info("Email constructed.")
-    email.send(
-        coordinator_email,
+    return (
+        reminder["coordinator_email"],
         {
-            "user": coordinator_wp_username,
-            "lang": coordinator_lang,
+            "user": reminder["coordinator_wp_username"],
+            "lang": reminder["coordinator_lang"],
             "pending_count": pending_count,
             "question_count": question_count,
             "approved_count": approved_count,
@@ -156,47 +150,72 @@ def send_coordinator_reminder_emails(sender, **kwargs):
             "link": link,
         },
     )
-    logger.info("Email queued.")
 
 
-@receiver(Notice.user_renewal_notice)
+@receiver(Reminder.coordinator_reminders)
+def send_coordinator_reminder_emails(sender, **kwargs):
+    """
+    Any time the related management command is run, this sends email to the
+    to designated coordinators, reminding them to login
+    to the site if there are pending applications. All of the reminders are
+    handed to the email backend in one batch.
+    """
+    reminders = kwargs["reminders"]
+    base_url = get_current_site(None).domain
+    path = reverse_lazy("applications:list")
+    link = "https://{base}{path}".format(base=base_url, path=path)
+
+    logger.info(
+        "Received coordinator reminder signal for {count} coordinators; "
+        "preparing to send reminder emails.".format(count=len(reminders))
+    )
+    emails = CoordinatorReminderNotification().make_email_objects(
+        _coordinator_reminder_recipient(reminder, link) for reminder in reminders
+    )
+    logger.info("Emails constructed.")
+    get_connection().send_messages(emails)
+    logger.info("Emails queued.")
+
+
+@receiver(Notice.user_renewal_notices)
 def send_user_renewal_notice_emails(sender, **kwargs):
     """
     Any time the related managment command is run, this sends email to
-    users who have authorizations that are soon to expire.
+    users who have authorizations that are soon to expire. Each batch of
+    notices is handed to the email backend in one go.
     """
-    user_wp_username = kwargs["user_wp_username"]
-    user_email = kwargs["user_email"]
-    user_lang = kwargs["user_lang"]
-    partner_name = kwargs["partner_name"]
-    path = kwargs["partner_link"]
-
     base_url = get_current_site(None).domain
-    partner_link = "https://{base}{path}".format(base=base_url, path=path)
+    recipients = []
+    for notice in kwargs["notices"]:
+        partner_link = "https://{base}{path}".format(
+            base=base_url, path=notice["partner_link"]
+        )
+        recipients.append(
+            (
+                notice["user_email"],
+                {
+                    "user": notice["user_wp_username"],
+                    "lang": notice["user_lang"],
+                    "partner_name": notice["partner_name"],
+                    "partner_link": partner_link,
+                },
+            )
+        )
+    emails = UserRenewalNotice().make_email_objects(recipients)
+    get_connection().send_messages(emails)
 
-    email = UserRenewalNotice()
 
-    email.send(
-        user_email,
-        {
-            "user": user_wp_username,
-            "lang": user_lang,
-            "partner_name": partner_name,
-            "partner_link": partner_link,
-        },
-    )
+# EmailLedger campaign key for survey invitations.
+SURVEY_ACTIVE_USER_CAMPAIGN = "survey_active_user"
 
 
-def send_survey_active_user_email(connection=email_connection(), **kwargs):
+def make_survey_active_user_email(user_email, user_lang, survey_id, survey_langs):
     """
-    Any time the related managment command is run, this sends a survey
-    invitation to qualifying editors.
+    Any time the related managment command is run, this builds the survey
+    invitation for a qualifying editor. The campaign sends the invitations
+    and records the outcomes in the email ledger, so later runs skip the
+    editor.
     """
-    user_email = kwargs["user_email"]
-    user_lang = kwargs["user_lang"]
-    survey_id = kwargs["survey_id"]
-    survey_langs = kwargs["survey_langs"]
-
     # Default survey language is english
     survey_lang = "en"
 
@@ -211,15 +230,13 @@ def send_survey_active_user_email(connection=email_connection(), **kwargs):
 
     template_email = SurveyActiveUser()
 
-    email = template_email.make_email_object(
+    return template_email.make_email_object(
         user_email,
         {
             "lang": user_lang,
             "link": link,
         },
     )
-    message = Message.from_email_message(email)
-    _safe_send_message(message, connection=connection)
 
 
 def send_test(connection=email_connection(), **kwargs):
@@ -230,21 +247,105 @@ def send_test(connection=email_connection(), **kwargs):
     _safe_send_message(message, connection=connection)
 
 
+def _username(user):
+    # Allow emails to be sent to system users with no editor object.
+    if hasattr(user, "editor"):
+        return user.editor.wp_username
+    return user.username
+
+
+def _comment_notification_recipients(comment, app):
+    """
+    Works out who should hear about a new comment on an application, as a
+    list of (TemplateMail class, User) pairs. The application's editor, its
+    most recent reviewer and everyone else who has commented on it are loaded
+    in a fixed number of queries, however long the discussion is.
+    """
+    recipients = []
+
+    # If the editor who owns this application was not the comment poster, notify
+    # them of the new comment.
+    if comment.user_id != app.editor.user_id and app.editor.user.email:
+        recipients.append((CommentNotificationEmailEditors, app.editor.user))
+
+    # Send emails to the last coordinator to make a status change to this
+    # application, as long as they aren't the ones leaving the comment.
+    # 'First' app version is the most recent
+    latest_version = (
+        Version.objects.get_for_object(app)
+        .select_related("revision__user__editor", "revision__user__userprofile")
+        .first()
+    )
+    recent_app_coordinator = latest_version.revision.user if latest_version else None
+    if recent_app_coordinator and recent_app_coordinator.pk != comment.user_id:
+        if recent_app_coordinator != app.partner.coordinator and not (
+            recent_app_coordinator.is_staff
+        ):
+            recent_app_coordinator = app.partner.coordinator
+        if recent_app_coordinator:
+            recipients.append((CommentNotificationCoordinators, recent_app_coordinator))
+
+    # Send to any previous commenters on the thread, other than the editor,
+    # the person who left the comment just now, and the last coordinator.
+    excluded_pks = [comment.user_id, app.editor.user_id]
+    if recent_app_coordinator:
+        excluded_pks.append(recent_app_coordinator.pk)
+    commenters = (
+        User.objects.select_related("editor", "userprofile")
+        .filter(
+            pk__in=Comment.objects.filter(
+                object_pk=app.pk,
+                content_type__model="application",
+                content_type__app_label="applications",
+            ).values("user_id")
+        )
+        .exclude(pk__in=excluded_pks)
+        .exclude(email="")
+    )
+    recipients += [(CommentNotificationEmailOthers, user) for user in commenters]
+    return recipients
+
+
 @receiver(comment_was_posted)
 def send_comment_notification_emails(sender, **kwargs):
     """
     Any time a comment is posted on an application, this sends email to the
-    application owner and anyone else who previously commented.
+    application owner and anyone else who previously commented. If
+    COMMENT_NOTIFICATION_DIGEST_WINDOW is set, the comment is saved for each
+    recipient's next digest instead.
     """
     current_comment = kwargs["comment"]
-    app = current_comment.content_object
-    assert isinstance(app, Application)
+    assert current_comment.content_type.model_class() is Application
+    app = Application.include_invalid.select_related(
+        "editor__user__userprofile",
+        "partner__coordinator__editor",
+        "partner__coordinator__userprofile",
+    ).get(pk=current_comment.object_pk)
 
     logger.info(
         "Received comment signal on app number {app.pk}; preparing "
         "to send notification emails".format(app=app)
     )
 
+    recipients = _comment_notification_recipients(current_comment, app)
+    if not recipients:
+        return
+
+    if settings.COMMENT_NOTIFICATION_DIGEST_WINDOW:
+        PendingCommentNotification.objects.bulk_create(
+            [
+                PendingCommentNotification(user=user, comment=current_comment)
+                for _template_mail_class, user in recipients
+            ],
+            ignore_conflicts=True,
+        )
+        logger.info(
+            "Saved comment on app #{app.pk} for {count} digests".format(
+                app=app, count=len(recipients)
+            )
+        )
+        return
+
     if "request" in kwargs:
         # This is the expected case; the comment_was_posted signal should send
         # this.
@@ -255,146 +356,178 @@ def send_comment_notification_emails(sender, **kwargs):
         request = None
 
     base_url = get_current_site(request).domain
-    logger.info("Site base_url is {base_url}".format(base_url=base_url))
     app_url = "https://{base}{path}".format(base=base_url, path=app.get_absolute_url())
-    logger.info("app_url is {app_url}".format(app_url=app_url))
+    commenter = _username(
+        User.objects.select_related("editor").get(pk=current_comment.user_id)
+    )
 
-    # If the editor who owns this application was not the comment poster, notify
-    # them of the new comment.
-    if current_comment.user != app.editor.user:
-        if app.editor.user.email:
-            logger.info("we should notify the editor")
-            email = CommentNotificationEmailEditors()
-            logger.info("email constructed")
-            email.send(
-                app.editor.user.email,
+    emails = []
+    for template_mail_class in (
+        CommentNotificationEmailEditors,
+        CommentNotificationCoordinators,
+        CommentNotificationEmailOthers,
+    ):
+        emails += template_mail_class().make_email_objects(
+            (
+                user.email,
                 {
-                    "user": app.editor.wp_username,
-                    "lang": app.editor.user.userprofile.lang,
+                    "user": _username(user),
+                    "lang": user.userprofile.lang,
                     "app": app,
                     "app_url": app_url,
                     "partner": app.partner,
                     "submit_date": current_comment.submit_date,
-                    "commenter": current_comment.user.editor.wp_username,
+                    "commenter": commenter,
                     "comment": current_comment.comment,
                 },
             )
-            logger.info(
-                "Email queued for {app.editor.user.email} about "
-                "app #{app.pk}".format(app=app)
-            )
+            for recipient_class, user in recipients
+            if recipient_class is template_mail_class
+        )
+    get_connection().send_messages(emails)
+    logger.info(
+        "{count} emails queued about app #{app.pk}".format(count=len(emails), app=app)
+    )
 
-    # Send emails to the last coordinator to make a status change to this
-    # application, as long as they aren't the ones leaving the comment.
-    app_versions = Version.objects.get_for_object(app)
 
-    # 'First' app version is the most recent
-    recent_app_coordinator = app_versions.first().revision.user
-    if recent_app_coordinator and recent_app_coordinator != current_comment.user:
-        if recent_app_coordinator != app.partner.coordinator and not (
-            recent_app_coordinator.is_staff
-        ):
-            recent_app_coordinator = app.partner.coordinator
-        email = CommentNotificationCoordinators()
-        email.send(
-            recent_app_coordinator.email,
-            {
-                "user": recent_app_coordinator.editor.wp_username,
-                "lang": recent_app_coordinator.userprofile.lang,
-                "app": app,
-                "app_url": app_url,
-                "partner": app.partner,
-                "submit_date": current_comment.submit_date,
-                "commenter": current_comment.user.editor.wp_username,
-                "comment": current_comment.comment,
-            },
+def send_comment_notification_digests():
+    """
+    Sends each user one email collecting the comments saved for their digest,
+    once the oldest of them has waited COMMENT_NOTIFICATION_DIGEST_WINDOW
+    seconds.
+
+    Returns
+    -------
+    int
+        The number of digests sent.
+    """
+    cutoff = timezone.now() - timedelta(
+        seconds=settings.COMMENT_NOTIFICATION_DIGEST_WINDOW
+    )
+    due_user_pks = (
+        PendingCommentNotification.objects.values("user_id")
+        .annotate(oldest=Min("date_created"))
+        .filter(oldest__lte=cutoff)
+        .values_list("user_id", flat=True)
+    )
+
+    with transaction.atomic():
+        pending = list(
+            PendingCommentNotification.objects.select_for_update(skip_locked=True)
+            .filter(user_id__in=list(due_user_pks))
+            .order_by("pk")
         )
-        logger.info(
-            "Coordinator email queued for {app.editor.user.email} about app "
-            "#{app.pk}".format(app=app)
+        if not pending:
+            return 0
+        users = User.objects.select_related("editor", "userprofile").in_bulk(
+            {notification.user_id for notification in pending}
+        )
+        comments = Comment.objects.select_related("user__editor").in_bulk(
+            {notification.comment_id for notification in pending}
+        )
+        apps = Application.include_invalid.select_related("partner").in_bulk(
+            {int(comment.object_pk) for comment in comments.values()}
         )
 
-    # Send to any previous commenters on the thread, other than the editor,
-    # the person who left the comment just now, and the last coordinator.
-    all_comments = Comment.objects.filter(
-        object_pk=app.pk,
-        content_type__model="application",
-        content_type__app_label="applications",
-    )
-    users = set([comment.user for comment in all_comments])
-
-    users.remove(current_comment.user)
-    try:
-        users.remove(app.editor.user)
-    except KeyError:
-        # If the editor is not among the prior commenters, that's fine; no
-        # reason they should be.
-        pass
-    if recent_app_coordinator:
-        try:
-            users.remove(recent_app_coordinator)
-        except KeyError:
-            # Likewise, coordinator might not have commented.
-            pass
-
-    for user in users:
-        if user:
-            # Allow emails to be sent to system users with no editor object.
-            if hasattr(user, "editor"):
-                username = user.editor.wp_username
-            else:
-                username = user.username
-            email = CommentNotificationEmailOthers()
-            email.send(
-                user.email,
-                {
-                    "user": username,
-                    "lang": user.userprofile.lang,
-                    "app": app,
-                    "app_url": app_url,
-                    "partner": app.partner,
-                    "submit_date": current_comment.submit_date,
-                    "commenter": current_comment.user.editor.wp_username,
-                    "comment": current_comment.comment,
-                },
+        base_url = get_current_site(None).domain
+        # {user pk: {app pk: [comment, ...]}}
+        digests = {}
+        for notification in pending:
+            comment = comments[notification.comment_id]
+            app_pk = int(comment.object_pk)
+            # Comments outlive their applications, so skip those on
+            # applications that have since been deleted.
+            if app_pk not in apps:
+                continue
+            digests.setdefault(notification.user_id, {}).setdefault(app_pk, []).append(
+                comment
             )
-            logger.info(
-                "Email queued for {app.editor.user.email} about app "
-                "#{app.pk}".format(app=app)
+
+        recipients = []
+        for user_pk, app_comments in digests.items():
+            user = users[user_pk]
+            applications = []
+            for app_pk, app_comment_list in app_comments.items():
+                app = apps[app_pk]
+                applications.append(
+                    {
+                        "partner": app.partner,
+                        "app_url": "https://{base}{path}".format(
+                            base=base_url, path=app.get_absolute_url()
+                        ),
+                        "comments": [
+                            {
+                                "submit_date": comment.submit_date,
+                                "commenter": (
+                                    _username(comment.user)
+                                    if comment.user
+                                    else comment.user_name
+                                ),
+                                "comment": comment.comment,
+                            }
+                            for comment in sorted(
+                                app_comment_list, key=lambda c: c.submit_date
+                            )
+                        ],
+                    }
+                )
+            recipients.append(
+                (
+                    user.email,
+                    {
+                        "user": _username(user),
+                        "lang": user.userprofile.lang,
+                        "applications": applications,
+                    },
+                )
             )
 
+        PendingCommentNotification.objects.filter(
+            pk__in=[notification.pk for notification in pending]
+        ).delete()
+        emails = CommentNotificationDigest().make_email_objects(recipients)
+        get_connection().send_messages(emails)
+    return len(emails)
 
-def send_approval_notification_email(instance):
-    base_url = get_current_site(None).domain
-    path = reverse_lazy("users:my_library")
-    link = "https://{base}{path}".format(base=base_url, path=path)
-    email = ApprovalNotification()
+
+def _approval_recipient(instance, link):
+    return (
+        instance.user.email,
+        {
+            "user": instance.user.editor.wp_username,
+            "lang": instance.user.userprofile.lang,
+            "partner": instance.partner,
+            "link": link,
+            "user_instructions": instance.get_user_instructions(),
+        },
+    )
+
+
+def _should_send_approval_email(instance):
     # If, for some reason, we're trying to send an email to a user
     # who deleted their account, stop doing that.
-
-    if instance.editor:
-        # Emails for approved emails in access codes method shall be sent only when finalized
-        if instance.partner.authorization_method == Partner.CODES:
-            logger.info(
-                "Email for access codes method should be sent only once,"
-                "when the status of application is finalized."
-            )
-        else:
-            email.send(
-                instance.user.email,
-                {
-                    "user": instance.user.editor.wp_username,
-                    "lang": instance.user.userprofile.lang,
-                    "partner": instance.partner,
-                    "link": link,
-                    "user_instructions": instance.get_user_instructions(),
-                },
-            )
-    else:
+    if not instance.editor:
         logger.error(
             "Tried to send an email to an editor that doesn't "
             "exist, perhaps because their account is deleted."
         )
+        return False
+    # Emails for approved emails in access codes method shall be sent only when finalized
+    if instance.partner.authorization_method == Partner.CODES:
+        logger.info(
+            "Email for access codes method should be sent only once,"
+            "when the status of application is finalized."
+        )
+        return False
+    return True
+
+
+def send_approval_notification_email(instance):
+    base_url = get_current_site(None).domain
+    path = reverse_lazy("users:my_library")
+    link = "https://{base}{path}".format(base=base_url, path=path)
+    if _should_send_approval_email(instance):
+        ApprovalNotification().send(*_approval_recipient(instance, link))
 
 
 def send_waitlist_notification_email(instance):
@@ -431,9 +564,7 @@ def send_waitlist_notification_email(instance):
         )
 
 
-def send_rejection_notification_email(instance):
-    base_url = get_current_site(None).domain
-
+def _rejection_recipient(instance, base_url):
     if instance.pk:
         app_url = "https://{base}{path}".format(
             base=base_url, path=instance.get_absolute_url()
@@ -446,18 +577,22 @@ def send_rejection_notification_email(instance):
         # it will take them to a page *via which* they can perform the review
         # steps described in the email template.
         app_url = reverse_lazy("users:home")
+    return (
+        instance.user.email,
+        {
+            "user": instance.user.editor.wp_username,
+            "lang": instance.user.userprofile.lang,
+            "partner": instance.partner,
+            "app_url": app_url,
+        },
+    )
+
+
+def send_rejection_notification_email(instance):
+    base_url = get_current_site(None).domain
 
-    email = RejectionNotification()
     if instance.editor:
-        email.send(
-            instance.user.email,
-            {
-                "user": instance.user.editor.wp_username,
-                "lang": instance.user.userprofile.lang,
-                "partner": instance.partner,
-                "app_url": app_url,
-            },
-        )
+        RejectionNotification().send(*_rejection_recipient(instance, base_url))
     else:
         logger.error(
             "Tried to send an email to an editor that doesn't "
@@ -465,6 +600,37 @@ def send_rejection_notification_email(instance):
         )
 
 
+@receiver(ApplicationStatus.batch_updated)
+def send_batch_status_emails(sender, **kwargs):
+    """
+    Applications updated in bulk are saved without signals, so their
+    approval and rejection emails are sent here, in one batch.
+    """
+    base_url = get_current_site(None).domain
+    link = "https://{base}{path}".format(
+        base=base_url, path=reverse_lazy("users:my_library")
+    )
+    emails = ApprovalNotification().make_email_objects(
+        _approval_recipient(app, link)
+        for app in kwargs["approved"]
+        if _should_send_approval_email(app)
+    )
+    rejected = []
+    for app in kwargs["rejected"]:
+        if app.editor:
+            rejected.append(app)
+        else:
+            logger.error(
+                "Tried to send an email to an editor that doesn't "
+                "exist, perhaps because their account is deleted."
+            )
+    emails += RejectionNotification().make_email_objects(
+        _rejection_recipient(app, base_url) for app in rejected
+    )
+    if emails:
+        get_connection().send_messages(emails)
+
+
 @receiver(pre_save, sender=Application)
 def update_app_status_on_save(sender, instance, **kwargs):
     """
@@ -515,6 +681,20 @@ def update_app_status_on_save(sender, instance, **kwargs):
             pass
 
 
+def _access_code_recipient(access_code):
+    user = access_code.authorization.user
+    return (
+        user.email,
+        {
+            "editor_wp_username": user.editor.wp_username,
+            "lang": user.userprofile.lang,
+            "partner": access_code.partner,
+            "access_code": access_code.code,
+            "user_instructions": access_code.partner.user_instructions,
+        },
+    )
+
+
 @receiver(pre_save, sender=AccessCode)
 def send_authorization_emails(sender, instance, **kwargs):
     """
@@ -529,25 +709,101 @@ def send_authorization_emails(sender, instance, **kwargs):
         # have one before, we've probably just finalised an application
         # and therefore want to send an email.
         if not orig_code.authorization and instance.authorization:
-            mail_instance = MagicMailBuilder()
-            email = mail_instance.access_code_email(
-                instance.authorization.user.email,
+            AccessCodeEmail().make_email_object(
+                *_access_code_recipient(instance)
+            ).send()
+
+
+@receiver(AccessCodes.assigned)
+def send_access_code_emails(sender, **kwargs):
+    """
+    Access codes handed out in bulk are saved without signals, so their
+    emails are sent here, in one batch.
+    """
+    emails = AccessCodeEmail().make_email_objects(
+        _access_code_recipient(access_code) for access_code in kwargs["access_codes"]
+    )
+    if emails:
+        get_connection().send_messages(emails)
+
+
+def send_waitlist_notification_emails(partner_pk):
+    """
+    Notifies everyone with an open application to a partner that it has been
+    waitlisted. Recipients with several open applications only get one email,
+    and all of the emails are handed to the email backend in one batch.
+
+    Parameters
+    ----------
+    partner_pk : int
+        The primary key of the waitlisted partner.
+
+    Returns
+    -------
+    None
+    """
+    partner = Partner.objects.get(pk=partner_pk)
+    base_url = get_current_site(None).domain
+    path = reverse_lazy("users:my_library")
+    link = "https://{base}{path}".format(base=base_url, path=path)
+
+    applications = Application.objects.filter(
+        partner_id=partner_pk,
+        status__in=[Application.PENDING, Application.QUESTION],
+    )
+    deleted_count = applications.filter(editor__isnull=True).count()
+    if deleted_count:
+        logger.error(
+            "Skipped {count} applications when sending waitlist notification "
+            "emails because their editors don't exist, perhaps because their "
+            "accounts are deleted.".format(count=deleted_count)
+        )
+
+    applicants = (
+        applications.filter(editor__isnull=False)
+        .exclude(editor__user__groups=get_restricted())
+        .order_by("pk")
+        .values_list(
+            "editor__user__email",
+            "editor__wp_username",
+            "editor__user__userprofile__lang",
+        )
+    )
+
+    recipients = []
+    seen = set()
+    for email_address, wp_username, lang in applicants.iterator():
+        if not email_address or email_address.lower() in seen:
+            continue
+        seen.add(email_address.lower())
+        recipients.append(
+            (
+                email_address,
                 {
-                    "editor_wp_username": instance.authorization.user.editor.wp_username,
-                    "lang": instance.authorization.user.userprofile.lang,
-                    "partner": instance.partner,
-                    "access_code": instance.code,
-                    "user_instructions": instance.partner.user_instructions,
+                    "user": wp_username,
+                    "lang": lang,
+                    "partner": partner,
+                    "link": link,
                 },
             )
-            email.send()
+        )
+    emails = WaitlistNotification().make_email_objects(recipients)
+
+    logger.info(
+        "Sending {count} waitlist notification emails for {partner}.".format(
+            count=len(emails), partner=partner
+        )
+    )
+    if emails:
+        get_connection().send_messages(emails)
 
 
 @receiver(pre_save, sender=Partner)
 def notify_applicants_when_waitlisted(sender, instance, **kwargs):
     """
     When Partners are switched to WAITLIST status, anyone with open applications
-    should be notified.
+    should be notified. The emails go out in one batch once the save has been
+    committed, so saving a popular partner doesn't wait on them.
     """
     if instance.id:
         orig_partner = get_object_or_404(Partner, pk=instance.id)
@@ -555,19 +811,33 @@ def notify_applicants_when_waitlisted(sender, instance, **kwargs):
         if (
             orig_partner.status != instance.status
         ) and instance.status == Partner.WAITLIST:
-            for app in orig_partner.applications.filter(
-                status__in=[Application.PENDING, Application.QUESTION]
-            ):
-                send_waitlist_notification_email(app)
+            partner_pk = instance.pk
+            transaction.on_commit(lambda: send_waitlist_notification_emails(partner_pk))
+
+
+# Reports bigger than this are left on disk rather than attached to the email.
+REPORT_ATTACHMENT_MAX_SIZE = 5 * 1024 * 1024
 
 
 @receiver(UserLoginRetrieval.user_retrieve_monthly_logins)
 def send_user_login_retrieval_email(sender, **kwargs):
-    monthly_users = kwargs["monthly_users"]
-    email = UserRetrieveMonthlyLogins()
-    logger.info("Email constructed.")
-    email.send(
+    """
+    Emails the TWL team a summary of the monthly users report, with the
+    gzipped CSV report attached if it's small enough.
+    """
+    report_path = kwargs["report_path"]
+    attached = os.path.getsize(report_path) <= REPORT_ATTACHMENT_MAX_SIZE
+    email = UserRetrieveMonthlyLogins().make_email_object(
         os.environ.get("TWLIGHT_ERROR_MAILTO", "wikipedialibrary@wikimedia.org"),
-        {"monthly_users": monthly_users},
+        {
+            "summary": kwargs["summary"],
+            "report_name": os.path.basename(report_path),
+            "report_path": report_path,
+            "attached": attached,
+        },
     )
+    if attached:
+        email.attach_file(report_path, "application/gzip")
+    logger.info("Email constructed.")
+    email.send()
     logger.info("Email queued.")
@@ -1,20 +1,35 @@
+import os
 from datetime import datetime, timedelta
+from io import StringIO
+from tempfile import TemporaryDirectory
 
 from djmail.template_mail import MagicMailBuilder, InlineCSSTemplateMail
-from unittest.mock import patch
+from djmail.models import Message
+from unittest.mock import Mock, patch
 
 from django_comments import get_form_target
 from django_comments.models import Comment
 from django_comments.signals import comment_was_posted
 from django.contrib.auth import signals
+from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
 from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.template.loader import get_template
 from django.urls import reverse
 from django.utils import timezone
-from django.test import TestCase, RequestFactory
-from django.test.utils import override_settings
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext, override_settings
 
 from TWLight.applications.factories import (
     ApplicationFactory,
@@ -24,21 +39,70 @@ from TWLight.resources.factories import PartnerFactory
 from TWLight.resources.models import Partner
 from TWLight.resources.tests import EditorCraftRoom
 from TWLight.users.factories import EditorFactory, UserFactory
-from TWLight.users.groups import get_coordinators
-from TWLight.users.models import Authorization
+from TWLight.users.groups import get_coordinators, get_restricted
+from TWLight.users.models import Authorization, Editor
 
 # We need to import these in order to register the signal handlers; if we don't,
 # when we test that those handler functions have been called, we will get
 # False even when they work in real life.
+from .backends.mediawiki import EmailBackend
+from .backends.transports import (
+    RecordingTransport,
+    ReplayMissError,
+    ReplayTransport,
+    StandInTransport,
+)
+from .campaigns import create_campaign, run_campaign
+from .models import (
+    EmailCampaign,
+    EmailCampaignRecipient,
+    EmailLedger,
+    PendingCommentNotification,
+)
+from .rendering import clear_template_cache
 from .tasks import (
+    send_comment_notification_digests,
     send_comment_notification_emails,
     send_approval_notification_email,
     send_rejection_notification_email,
     send_user_renewal_notice_emails,
-    send_survey_active_user_email,
+    SURVEY_ACTIVE_USER_CAMPAIGN,
+    WaitlistNotification,
 )
 
 
+class BatchRecordingEmailBackend(LocmemEmailBackend):
+    """
+    A locmem backend that reports on each message, as the MediaWiki backend
+    does. It remembers the size of every batch it's handed, and doesn't
+    deliver to the addresses in undeliverable.
+    """
+
+    batches = []
+    undeliverable = set()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.outcomes = []
+
+    def send_messages(self, messages):
+        self.batches.append(len(messages))
+        self.outcomes = [
+            (
+                message,
+                (
+                    "not emailable"
+                    if set(message.recipients()) & self.undeliverable
+                    else None
+                ),
+            )
+            for message in messages
+        ]
+        return super().send_messages(
+            [message for message, error in self.outcomes if error is None]
+        )
+
+
 class ApplicationCommentTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -223,6 +287,95 @@ class ApplicationCommentTest(TestCase):
         comment_was_posted.send(sender=Comment, comment=comment2, request=request)
         self.assertEqual(mail.outbox[1].to, [coordinator.user.email])
 
+    def test_comment_email_queries_dont_scale_with_discussion(self):
+        """
+        Working out who to email about a comment costs the same number of
+        queries however many people have commented.
+        """
+        app, request = self._set_up_email_test_objects()
+        self._create_comment(app, self.coordinator1)
+        comment = self._create_comment(app, self.editor)
+        with CaptureQueriesContext(connection) as one_commenter:
+            send_comment_notification_emails(
+                sender=Comment, comment=comment, request=request
+            )
+        self.assertEqual(len(mail.outbox), 1)
+
+        for _ in range(4):
+            self._create_comment(app, EditorFactory().user)
+        comment = self._create_comment(app, self.editor)
+        mail.outbox = []
+        with CaptureQueriesContext(connection) as five_commenters:
+            send_comment_notification_emails(
+                sender=Comment, comment=comment, request=request
+            )
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(
+            len(five_commenters.captured_queries),
+            len(one_commenter.captured_queries),
+        )
+
+    @override_settings(COMMENT_NOTIFICATION_DIGEST_WINDOW=600)
+    def test_comment_email_digest(self):
+        """
+        With a digest window set, comments are collected into one email per
+        recipient, sent once the window has passed.
+        """
+        app, request = self._set_up_email_test_objects()
+        request.user = UserFactory()
+        comment1 = self._create_comment(app, self.coordinator1)
+        comment_was_posted.send(sender=Comment, comment=comment1, request=request)
+        comment2 = self._create_comment(app, self.coordinator2)
+        comment2.comment = "More content!"
+        comment2.save()
+        comment_was_posted.send(sender=Comment, comment=comment2, request=request)
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(send_comment_notification_digests(), 0)
+
+        PendingCommentNotification.objects.update(
+            date_created=timezone.now() - timedelta(minutes=11)
+        )
+        self.assertEqual(send_comment_notification_digests(), 2)
+        self.assertFalse(PendingCommentNotification.objects.exists())
+
+        emails = {email.to[0]: email for email in mail.outbox}
+        self.assertEqual(set(emails), {self.editor.email, self.coordinator1.email})
+        self.assertIn("Content!", emails[self.editor.email].body)
+        self.assertIn("More content!", emails[self.editor.email].body)
+        self.assertIn("More content!", emails[self.coordinator1.email].body)
+
+    @override_settings(COMMENT_NOTIFICATION_DIGEST_WINDOW=600)
+    def test_comment_email_digest_deleted_application(self):
+        """
+        Comments on applications deleted before the digest goes out are
+        dropped from it, and users with nothing else to hear about get no
+        digest.
+        """
+        app, request = self._set_up_email_test_objects()
+        deleted_app = ApplicationFactory(editor=self.editor.editor)
+        request.user = UserFactory()
+        comment1 = self._create_comment(app, self.coordinator1)
+        comment_was_posted.send(sender=Comment, comment=comment1, request=request)
+        comment2 = self._create_comment(deleted_app, self.coordinator2)
+        comment2.comment = "Deleted content!"
+        comment2.save()
+        comment_was_posted.send(sender=Comment, comment=comment2, request=request)
+        comment3 = self._create_comment(deleted_app, self.editor)
+        comment_was_posted.send(sender=Comment, comment=comment3, request=request)
+        deleted_app.delete()
+
+        PendingCommentNotification.objects.update(
+            date_created=timezone.now() - timedelta(minutes=11)
+        )
+        self.assertEqual(send_comment_notification_digests(), 1)
+        self.assertFalse(PendingCommentNotification.objects.exists())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.editor.email])
+        self.assertIn("Content!", mail.outbox[0].body)
+        self.assertNotIn("Deleted content!", mail.outbox[0].body)
+
     # We'd like to mock out send_comment_notification_emails and test that
     # it is called when comment_was_posted is fired, but we can't; the signal
     # handler is attached to the real send_comment_notification_emails, not
@@ -331,26 +484,28 @@ class ApplicationStatusTest(TestCase):
         partner.delete()
         app.delete()
 
-    @patch("TWLight.emails.tasks.send_waitlist_notification_email")
-    def test_waitlisting_partner_calls_email_function(self, mock_email):
+    def test_waitlisting_partner_calls_email_function(self):
         """
-        Switching a Partner to WAITLIST status should call the email function
-        for apps to that partner with open statuses.
+        Switching a Partner to WAITLIST status should email editors with open
+        applications to that partner, once the save has been committed.
         """
         partner = PartnerFactory(status=Partner.AVAILABLE)
         app = ApplicationFactory(status=Application.PENDING, partner=partner)
-        self.assertFalse(mock_email.called)
+        orig_outbox = len(mail.outbox)
 
-        partner.status = Partner.WAITLIST
-        partner.save()
-        self.assertTrue(mock_email.called)
-        mock_email.assert_called_with(app)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            partner.status = Partner.WAITLIST
+            partner.save()
+            self.assertEqual(len(mail.outbox), orig_outbox)
 
-    @patch("TWLight.emails.tasks.send_waitlist_notification_email")
-    def test_waitlisting_partner_does_not_call_email_function(self, mock_email):
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(len(mail.outbox), orig_outbox + 1)
+        self.assertEqual(mail.outbox[-1].to, [app.user.email])
+
+    def test_waitlisting_partner_does_not_call_email_function(self):
         """
-        Switching a Partner to WAITLIST status should NOT call the email
-        function for apps to that partner with closed statuses.
+        Switching a Partner to WAITLIST status should NOT email editors
+        whose applications to that partner have closed statuses.
         """
         partner = PartnerFactory(status=Partner.AVAILABLE)
         app = ApplicationFactory(status=Application.APPROVED, partner=partner)
@@ -358,11 +513,35 @@ class ApplicationStatusTest(TestCase):
         app = ApplicationFactory(
             status=Application.SENT, partner=partner, sent_by=self.coordinator
         )
-        self.assertFalse(mock_email.called)
+        orig_outbox = len(mail.outbox)
 
-        partner.status = Partner.WAITLIST
-        partner.save()
-        self.assertFalse(mock_email.called)
+        with self.captureOnCommitCallbacks(execute=True):
+            partner.status = Partner.WAITLIST
+            partner.save()
+        self.assertEqual(len(mail.outbox), orig_outbox)
+
+    def test_waitlisting_partner_deduplicates_and_skips_restricted(self):
+        """
+        Editors with several open applications to a waitlisted partner only
+        get one email, and restricted editors don't get any.
+        """
+        partner = PartnerFactory(status=Partner.AVAILABLE)
+        editor = EditorFactory()
+        ApplicationFactory(status=Application.PENDING, partner=partner, editor=editor)
+        ApplicationFactory(status=Application.QUESTION, partner=partner, editor=editor)
+        restricted_editor = EditorFactory()
+        get_restricted().user_set.add(restricted_editor.user)
+        ApplicationFactory(
+            status=Application.PENDING, partner=partner, editor=restricted_editor
+        )
+        orig_outbox = len(mail.outbox)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            partner.status = Partner.WAITLIST
+            partner.save()
+
+        self.assertEqual(len(mail.outbox), orig_outbox + 1)
+        self.assertEqual(mail.outbox[-1].to, [editor.user.email])
 
 
 class UserRenewalNoticeTest(TestCase):
@@ -418,6 +597,31 @@ class UserRenewalNoticeTest(TestCase):
         call_command("user_renewal_notice")
         self.assertEqual(len(mail.outbox), 1)
 
+    @patch(
+        "TWLight.users.management.commands.user_renewal_notice.RENEWAL_NOTICE_BATCH_SIZE",
+        2,
+    )
+    def test_user_renewal_notice_batches(self):
+        """
+        Notices should be sent, and flagged as sent, in batches until every
+        expiring authorization has been handled.
+        """
+        for _ in range(4):
+            authorization = Authorization(
+                user=EditorFactory().user,
+                authorizer=self.coordinator,
+                date_expires=datetime.today() + timedelta(weeks=1),
+            )
+            authorization.save()
+            authorization.partners.add(PartnerFactory())
+
+        call_command("user_renewal_notice")
+
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(
+            Authorization.objects.filter(reminder_email_sent=False).exists()
+        )
+
     def test_user_renewal_notice_past_date(self):
         """
         If the authorization expired before today, the user shouldn't
@@ -716,6 +920,38 @@ class CoordinatorReminderEmailTest(TestCase):
         self.assertIn("1 under discussion application", mail.outbox[0].body)
         self.assertIn("1 approved application", mail.outbox[0].body)
 
+    def test_coordinator_reminder_queries_dont_grow(self):
+        """
+        Working out reminders should cost the same number of queries no
+        matter how many coordinators there are.
+        """
+        ApplicationFactory(
+            partner=self.partner, status=Application.PENDING, editor=self.user.editor
+        )
+        # Warm up the current site cache.
+        call_command("send_coordinator_reminders")
+        mail.outbox = []
+        with CaptureQueriesContext(connection) as one_coordinator:
+            call_command("send_coordinator_reminders")
+        self.assertEqual(len(mail.outbox), 1)
+
+        for _ in range(3):
+            coordinator = EditorFactory().user
+            get_coordinators().user_set.add(coordinator)
+            ApplicationFactory(
+                partner=PartnerFactory(coordinator=coordinator),
+                status=Application.PENDING,
+                editor=self.user.editor,
+            )
+        mail.outbox = []
+        with CaptureQueriesContext(connection) as four_coordinators:
+            call_command("send_coordinator_reminders")
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(
+            len(four_coordinators.captured_queries),
+            len(one_coordinator.captured_queries),
+        )
+
 
 class SurveyActiveUsersEmailTest(TestCase):
     @classmethod
@@ -847,20 +1083,493 @@ class SurveyActiveUsersEmailTest(TestCase):
         DJMAIL_REAL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
     )
     def test_survey_active_users_command(self):
-        # pre-send an email to the "alreadysent" editor
-        already_sent_msg = mail.EmailMessage(
-            "The Wikipedia Library needs your help!",
-            "Body",
-            "sender@example.com",
-            ["alreadysent@example.com"],
+        # record an earlier invitation to the "alreadysent" editor
+        EmailLedger.objects.record(
+            SURVEY_ACTIVE_USER_CAMPAIGN,
+            User.objects.filter(email="alreadysent@example.com").values_list(
+                "pk", flat=True
+            ),
+            EmailLedger.SENT,
+        )
+
+        call_command(
+            "survey_active_users",
+            "000001",
+            "en",
+            backend="djmail.backends.default.EmailBackend",
+        )
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.eligible.email])
+        self.assertTrue(
+            EmailLedger.objects.contacted(SURVEY_ACTIVE_USER_CAMPAIGN)
+            .filter(user=self.eligible, status=EmailLedger.SENT)
+            .exists()
         )
-        already_sent_msg.send()
 
+        # A second run has nobody left to invite.
         call_command(
             "survey_active_users",
             "000001",
             "en",
             backend="djmail.backends.default.EmailBackend",
         )
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(
+        EMAIL_BACKEND="djmail.backends.default.EmailBackend",
+        DJMAIL_REAL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    )
+    def test_survey_active_users_command_resumes_campaign(self):
+        """
+        An unfinished run of a survey is picked up where it left off, rather
+        than snapshotting the qualifying users again.
+        """
+        email_campaign = create_campaign(
+            SURVEY_ACTIVE_USER_CAMPAIGN,
+            User.objects.filter(
+                email__in=["alreadysent@example.com", "editor@example.com"]
+            ).order_by("pk"),
+            options={"survey_id": 1, "staff_test": False},
+        )
+        # The first run was interrupted after sending to one user.
+        email_campaign.recipients.filter(user__email="alreadysent@example.com").update(
+            status=EmailCampaignRecipient.SENT
+        )
+        EmailCampaign.objects.filter(pk=email_campaign.pk).update(
+            status=EmailCampaign.IN_PROGRESS, recipients_sent=1
+        )
+
+        call_command(
+            "survey_active_users",
+            "000001",
+            "en",
+            backend="djmail.backends.default.EmailBackend",
+        )
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.eligible.email])
+        self.assertEqual(EmailCampaign.objects.count(), 1)
+        email_campaign.refresh_from_db()
+        self.assertEqual(email_campaign.status, EmailCampaign.COMPLETE)
+        self.assertEqual(email_campaign.recipients_total, 2)
+        self.assertEqual(email_campaign.recipients_sent, 2)
+        self.assertEqual(email_campaign.recipients_failed, 0)
+
+    @patch.object(BatchRecordingEmailBackend, "undeliverable", {"staff@example.com"})
+    @patch.object(BatchRecordingEmailBackend, "batches", [])
+    def test_run_campaign_counts_failures(self):
+        """
+        A chunk's emails are handed to the connection together, and what
+        happened to each one is recorded against its recipient.
+        """
+        users = User.objects.filter(
+            email__in=["editor@example.com", "blocked@example.com", "staff@example.com"]
+        ).order_by("pk")
+        email_campaign = create_campaign("test_campaign", users)
+
+        def make_email(user):
+            if user.email == "blocked@example.com":
+                raise Exception("No template")
+            return EmailMessage("Test", "Test", to=[user.email])
+
+        email_campaign = run_campaign(
+            email_campaign, make_email, get_connection=BatchRecordingEmailBackend
+        )
+
+        self.assertEqual(BatchRecordingEmailBackend.batches, [2])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(email_campaign.status, EmailCampaign.COMPLETE)
+        self.assertEqual(email_campaign.recipients_sent, 1)
+        self.assertEqual(email_campaign.recipients_failed, 2)
+        self.assertEqual(
+            email_campaign.recipients.get(status=EmailCampaignRecipient.SENT).user,
+            self.eligible,
+        )
+        self.assertEqual(
+            set(
+                EmailLedger.objects.contacted("test_campaign").values_list(
+                    "user__email", "status"
+                )
+            ),
+            {
+                ("editor@example.com", EmailLedger.SENT),
+                ("blocked@example.com", EmailLedger.FAILED),
+                ("staff@example.com", EmailLedger.FAILED),
+            },
+        )
+        self.assertEqual(
+            set(Message.objects.values_list("to_email", "status")),
+            {
+                ("editor@example.com", Message.STATUS_SENT),
+                ("staff@example.com", Message.STATUS_FAILED),
+            },
+        )
+
+
+# Workers claim chunks with SKIP LOCKED, so they can't share SQLite.
+@skipUnlessDBFeature("has_select_for_update_skip_locked")
+class SurveyActiveUsersWorkersTest(TransactionTestCase):
+    @patch.object(BatchRecordingEmailBackend, "batches", [])
+    def test_survey_active_users_command_workers(self):
+        """
+        With several workers, each still hands its chunk's invitations to
+        the connection in one call.
+        """
+        now = timezone.now()
+        for i in range(3):
+            editor = EditorFactory(
+                user__email="editor{}@example.com".format(i),
+                wp_not_blocked=True,
+                wp_registered=now - timedelta(days=182),
+                wp_enough_edits=True,
+            )
+            editor.user.last_login = now
+            editor.user.save()
+
+        call_command(
+            "survey_active_users",
+            "000001",
+            "en",
+            workers=2,
+            backend="TWLight.emails.tests.BatchRecordingEmailBackend",
+        )
+
+        self.assertEqual(BatchRecordingEmailBackend.batches, [3])
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ["editor{}@example.com".format(i) for i in range(3)],
+        )
+        self.assertEqual(
+            EmailLedger.objects.contacted(SURVEY_ACTIVE_USER_CAMPAIGN)
+            .filter(status=EmailLedger.SENT)
+            .count(),
+            3,
+        )
+        email_campaign = EmailCampaign.objects.get()
+        self.assertEqual(email_campaign.status, EmailCampaign.COMPLETE)
+        self.assertEqual(email_campaign.recipients_sent, 3)
+
+
+class MediaWikiEmailBackendTest(TestCase):
+    def test_emailable_checked_in_batches(self):
+        """
+        Recipients are checked for emailability 50 at a time, before any
+        email is sent, and unemailable recipients are skipped.
+        """
+        editors = [
+            EditorFactory(
+                wp_username="Editor {}".format(i),
+                user__email="editor{}@example.com".format(i),
+            )
+            for i in range(60)
+        ]
+        transport = StandInTransport(
+            emailable={editor.wp_username for editor in editors[1:]}
+        )
+        backend = EmailBackend(transport=transport, fail_silently=True)
+        backend.open()
+        del transport.requests[:]
+        messages = [
+            EmailMessage("Subject", "Body", to=[editor.user.email])
+            for editor in editors
+        ]
+
+        with self.assertNumQueries(1):
+            self.assertEqual(backend.send_messages(messages), 59)
+
+        actions = [data["action"] for _, data in transport.requests]
+        self.assertEqual(actions, ["query", "query"] + ["emailuser"] * 59)
+        self.assertNotIn(
+            editors[0].wp_username,
+            [data.get("target") for _, data in transport.requests],
+        )
+
+    def test_concurrent_sending_reports_outcomes(self):
+        """
+        With several workers, every message is still sent once, and what
+        happened to each message is reported.
+        """
+        editors = [
+            EditorFactory(
+                wp_username="Editor {}".format(i),
+                user__email="editor{}@example.com".format(i),
+            )
+            for i in range(10)
+        ]
+        transport = StandInTransport(
+            emailable={editor.wp_username for editor in editors[1:]}
+        )
+        backend = EmailBackend(
+            workers=4, delay=0, transport=transport, fail_silently=True
+        )
+        messages = [
+            EmailMessage("Subject", "Body", to=[editor.user.email])
+            for editor in editors
+        ]
+
+        self.assertEqual(backend.send_messages(messages), 9)
+
+        self.assertEqual([message for message, _ in backend.outcomes], messages)
+        errors = [error for _, error in backend.outcomes]
+        self.assertIn("not emailable", errors[0])
+        self.assertEqual(errors[1:], [None] * 9)
+        self.assertCountEqual(
+            [data["target"] for _, data in transport.requests if "target" in data],
+            [editor.wp_username for editor in editors[1:]],
+        )
+
+    def test_maxlag_retried_and_timed(self):
+        """
+        Requests answered with maxlag are retried after Retry-After, and the
+        time spent waiting is counted as paused.
+        """
+        editors = [
+            EditorFactory(
+                wp_username="Editor {}".format(i),
+                user__email="editor{}@example.com".format(i),
+            )
+            for i in range(5)
+        ]
+        transport = StandInTransport(maxlag_every=4, retry_after=0.01)
+        backend = EmailBackend(delay=0, transport=transport, fail_silently=True)
+        messages = [
+            EmailMessage("Subject", "Body", to=[editor.user.email])
+            for editor in editors
+        ]
+
+        self.assertEqual(backend.send_messages(messages), 5)
+
+        # Logging in, one emailability check and five emails, plus retries.
+        self.assertGreater(transport.calls, 9)
+        self.assertGreater(backend.rate_limiter.paused_time, 0)
+
+    def test_recorded_responses_replayed(self):
+        """
+        A recording of one run can stand in for the API in another, and
+        leaves out credentials, tokens and message contents.
+        """
+        editors = [
+            EditorFactory(
+                wp_username="Editor {}".format(i),
+                user__email="editor{}@example.com".format(i),
+            )
+            for i in range(5)
+        ]
+        messages = [
+            EmailMessage("Secret subject", "Secret body", to=[editor.user.email])
+            for editor in editors
+        ]
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "recording.jsonl")
+            transport = RecordingTransport(StandInTransport(), path)
+            backend = EmailBackend(transport=transport, fail_silently=True)
+            self.assertEqual(backend.send_messages(messages[:2]), 2)
+            transport.close()
+
+            with open(path) as recording:
+                recorded = recording.read()
+            self.assertNotIn("Secret", recorded)
+            self.assertNotIn("lgpassword", recorded)
+
+            backend = EmailBackend(transport=ReplayTransport(path), fail_silently=True)
+            self.assertEqual(backend.send_messages(messages), 5)
+
+    def test_replay_miss_not_a_failed_send(self):
+        """
+        Replaying a recording that has nothing for a request raises, rather
+        than passing for a message the API wouldn't send.
+        """
+        editor = EditorFactory(user__email="editor@example.com")
+        message = EmailMessage("Subject", "Body", to=[editor.user.email])
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "recording.jsonl")
+            # Only logging in is recorded.
+            transport = RecordingTransport(StandInTransport(), path)
+            EmailBackend(transport=transport, fail_silently=True).open()
+            transport.close()
+
+            backend = EmailBackend(transport=ReplayTransport(path), fail_silently=True)
+            with self.assertRaises(ReplayMissError):
+                backend.send_messages([message])
+
+            with self.assertRaisesMessage(
+                CommandError, "No recorded response for POST query users"
+            ):
+                call_command(
+                    "benchmark_email_backend",
+                    "--messages=1",
+                    "--transport=replay",
+                    "--replay-file={}".format(path),
+                    stdout=StringIO(),
+                )
+
+    def test_benchmark_command(self):
+        """
+        The benchmark reports on the messages it sent, and doesn't leave
+        its synthetic editors behind.
+        """
+        editor_count = Editor.objects.count()
+        out = StringIO()
+
+        call_command(
+            "benchmark_email_backend", "--messages=3", "--workers=2", stdout=out
+        )
+
+        self.assertIn("Sent 3 of 3 messages", out.getvalue())
+        self.assertIn("API calls per message: 1.33", out.getvalue())
+        self.assertEqual(Editor.objects.count(), editor_count)
+
+
+@override_settings(
+    EMAIL_BACKEND="TWLight.emails.backends.queued.EmailBackend",
+    DJMAIL_REAL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+)
+class EmailQueueTest(TestCase):
+    def test_emails_queued_until_worker_runs(self):
+        """
+        Sending only queues a message once the transaction commits; the
+        worker does the actual sending.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            EmailMessage("Subject", "Body", to=["editor@example.com"]).send()
+
+        message = Message.objects.get()
+        self.assertEqual(message.status, Message.STATUS_PENDING)
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command("send_queued_emails")
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, Message.STATUS_SENT)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["editor@example.com"])
+
+    @override_settings(
+        DJMAIL_REAL_BACKEND="TWLight.emails.tests.BatchRecordingEmailBackend"
+    )
+    @patch.object(BatchRecordingEmailBackend, "undeliverable", {"blocked@example.com"})
+    @patch.object(BatchRecordingEmailBackend, "batches", [])
+    def test_queued_emails_sent_in_one_batch(self):
+        """
+        A backend that reports on each message is handed the whole batch at
+        once, and each message's outcome is recorded.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            for to in [
+                "editor@example.com",
+                "blocked@example.com",
+                "other@example.com",
+            ]:
+                EmailMessage("Subject", "Body", to=[to]).send()
+
+        call_command("send_queued_emails")
+
+        self.assertEqual(BatchRecordingEmailBackend.batches, [3])
         self.assertEqual(len(mail.outbox), 2)
-        self.assertEqual(mail.outbox[1].to, [self.eligible.email])
+        self.assertEqual(
+            dict(Message.objects.values_list("to_email", "status")),
+            {
+                "editor@example.com": Message.STATUS_SENT,
+                "blocked@example.com": Message.STATUS_FAILED,
+                "other@example.com": Message.STATUS_SENT,
+            },
+        )
+        self.assertEqual(
+            Message.objects.get(to_email="blocked@example.com").exception,
+            "not emailable",
+        )
+
+    @override_settings(EMAIL_QUEUE_RETRY_BACKOFF=0, DJMAIL_MAX_RETRY_NUMBER=2)
+    def test_failing_emails_retried_then_discarded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            EmailMessage("Subject", "Body", to=["editor@example.com"]).send()
+
+        connection = Mock()
+        connection.send_messages.side_effect = Exception("SMTP is down")
+        with patch("TWLight.emails.queue.get_connection", return_value=connection):
+            # Each run tries a failing message once.
+            for _ in range(4):
+                call_command("send_queued_emails")
+
+        message = Message.objects.get()
+        self.assertEqual(connection.send_messages.call_count, 3)
+        self.assertEqual(message.retry_count, 3)
+        self.assertEqual(message.status, Message.STATUS_DISCARDED)
+        self.assertIn("SMTP is down", message.exception)
+
+    @override_settings(EMAIL_QUEUE_RETRY_BACKOFF=60)
+    def test_failing_emails_back_off_from_last_attempt(self):
+        """
+        A failed message waits out its backoff from when it was last tried,
+        however long it was queued before that.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            EmailMessage("Subject", "Body", to=["editor@example.com"]).send()
+        Message.objects.update(created_at=timezone.now() - timedelta(minutes=10))
+
+        connection = Mock()
+        connection.send_messages.side_effect = Exception("SMTP is down")
+        with patch("TWLight.emails.queue.get_connection", return_value=connection):
+            call_command("send_queued_emails")
+            self.assertEqual(connection.send_messages.call_count, 1)
+            call_command("send_queued_emails")
+            self.assertEqual(connection.send_messages.call_count, 1)
+
+            message = Message.objects.get()
+            self.assertEqual(message.status, Message.STATUS_FAILED)
+            self.assertEqual(message.retry_count, 1)
+
+            # The first retry waits twice the backoff.
+            Message.objects.update(sent_at=timezone.now() - timedelta(seconds=121))
+            call_command("send_queued_emails")
+            self.assertEqual(connection.send_messages.call_count, 2)
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, Message.STATUS_FAILED)
+        self.assertEqual(message.retry_count, 2)
+
+
+class CachedTemplateMailTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        clear_template_cache()
+        self.addCleanup(clear_template_cache)
+
+    def test_make_email_objects(self):
+        """
+        Emails built in bulk keep their recipients' order and languages, and
+        each template is only loaded once.
+        """
+        recipients = [
+            (
+                "editor{}@example.com".format(i),
+                {
+                    "user": "Editor {}".format(i),
+                    "lang": lang,
+                    "partner": "Partner",
+                    "link": "https://example.com",
+                },
+            )
+            for i, lang in enumerate(["en", "fr", "en"])
+        ]
+        with patch(
+            "TWLight.emails.rendering.loader.get_template",
+            wraps=get_template,
+        ) as mock_get_template:
+            emails = WaitlistNotification().make_email_objects(recipients)
+            WaitlistNotification().make_email_objects(recipients)
+
+        # Subject, html body and text body.
+        self.assertEqual(mock_get_template.call_count, 3)
+        self.assertEqual(
+            [email.to for email in emails],
+            [["editor0@example.com"], ["editor1@example.com"], ["editor2@example.com"]],
+        )
+        self.assertEqual(
+            emails[0].subject, "Your Wikipedia Library application has been waitlisted"
+        )
+        self.assertEqual(
+            emails[1].subject,
+            "Votre candidature à la Bibliothèque Wikipédia est en liste attente",
+        )
+        self.assertIn("Editor 1", emails[1].body)
@@ -0,0 +1,207 @@
+import codecs
+import csv
+import logging
+
+from django.utils import timezone
+
+from TWLight.resources.models import AccessCode, AccessCodeImport, Partner
+
+logger = logging.getLogger(__name__)
+
+# Codes looked up and created per round trip while importing.
+ACCESS_CODE_IMPORT_BATCH_SIZE = 1000
+# Uploads larger than this are imported in the background. This matches
+# Django's default FILE_UPLOAD_MAX_MEMORY_SIZE, the old upload limit.
+ACCESS_CODE_IMPORT_INLINE_MAX_SIZE = 2621440
+
+
+class AccessCodeCSVError(Exception):
+    """Raised when an access code CSV is malformed. Nothing is imported."""
+
+
+def _iter_access_code_rows(csv_file):
+    """
+    Reads (code, partner pk) pairs from an access code CSV, one line at a
+    time, raising AccessCodeCSVError at the first malformed line.
+    """
+    partner_pks = set(Partner.even_not_available.values_list("pk", flat=True))
+    reader = csv.reader(codecs.iterdecode(csv_file, "utf-8"))
+    for line_num, fields in enumerate(reader, start=1):
+        # Skip any blank lines. Not an error, can just be ignored.
+        if not fields:
+            continue
+        if len(fields) != 2:
+            raise AccessCodeCSVError(
+                "Line {line_num} has {num_columns} columns. "
+                "Expected 2.".format(line_num=line_num, num_columns=len(fields))
+            )
+
+        access_code = fields[0].strip()
+        if len(access_code) > 60:
+            raise AccessCodeCSVError(
+                "Access code on line {line_num} is "
+                "too long for the database field.".format(line_num=line_num)
+            )
+
+        try:
+            partner_pk = int(fields[1].strip())
+        except ValueError:
+            raise AccessCodeCSVError(
+                "Second column should only contain "
+                "numbers. Error on line {line_num}.".format(line_num=line_num)
+            )
+        if partner_pk not in partner_pks:
+            raise AccessCodeCSVError(
+                "File contains reference to invalid "
+                "partner ID on line {line_num}".format(line_num=line_num)
+            )
+
+        yield access_code, partner_pk
+
+
+def validate_access_code_csv(csv_file):
+    """
+    Checks every line of an access code CSV without touching the database
+    beyond loading partner IDs once.
+
+    Parameters
+    ----------
+    csv_file : File
+        The uploaded CSV, opened in binary mode.
+
+    Returns
+    -------
+    int
+        The number of codes in the file.
+    """
+    rows = 0
+    for _ in _iter_access_code_rows(csv_file):
+        rows += 1
+    return rows
+
+
+def _import_batch(batch):
+    """
+    Creates the codes in a batch that don't already exist for their partner.
+    Returns the number of codes created and skipped.
+    """
+    unique_rows = dict.fromkeys(batch)
+    existing_rows = set(
+        AccessCode.objects.filter(
+            code__in={code for code, _ in unique_rows},
+            partner_id__in={partner_pk for _, partner_pk in unique_rows},
+        ).values_list("code", "partner_id")
+    )
+    new_rows = [row for row in unique_rows if row not in existing_rows]
+    AccessCode.objects.bulk_create(
+        [AccessCode(code=code, partner_id=partner_pk) for code, partner_pk in new_rows]
+    )
+    return len(new_rows), len(batch) - len(new_rows)
+
+
+def import_access_codes(csv_file, progress=None):
+    """
+    Imports an access code CSV in batches. Codes that already exist for
+    their partner, including repeats within the file, are skipped, so an
+    interrupted import can safely be run again. Validate the file first;
+    rows are imported as they're read.
+
+    Parameters
+    ----------
+    csv_file : File
+        The CSV, opened in binary mode.
+    progress : callable, optional
+        Called after each batch with the rows processed, codes created and
+        codes skipped so far.
+
+    Returns
+    -------
+    tuple
+        The number of codes created and skipped.
+    """
+    rows_processed = codes_created = codes_skipped = 0
+    batch = []
+    for row in _iter_access_code_rows(csv_file):
+        batch.append(row)
+        if len(batch) < ACCESS_CODE_IMPORT_BATCH_SIZE:
+            continue
+        created, skipped = _import_batch(batch)
+        rows_processed += len(batch)
+        codes_created += created
+        codes_skipped += skipped
+        batch = []
+        if progress:
+            progress(rows_processed, codes_created, codes_skipped)
+    if batch:
+        created, skipped = _import_batch(batch)
+        rows_processed += len(batch)
+        codes_created += created
+        codes_skipped += skipped
+        if progress:
+            progress(rows_processed, codes_created, codes_skipped)
+    return codes_created, codes_skipped
+
+
+def process_access_code_import(access_code_import: AccessCodeImport):
+    """
+    Run a queued access code import, recording progress as it goes.
+
+    Parameters
+    ----------
+    access_code_import : AccessCodeImport
+        The import to process.
+
+    Returns
+    -------
+    None
+    """
+    access_code_import.status = AccessCodeImport.IN_PROGRESS
+    access_code_import.save()
+
+    def progress(rows_processed, codes_created, codes_skipped):
+        access_code_import.rows_processed = rows_processed
+        access_code_import.codes_created = codes_created
+        access_code_import.codes_skipped = codes_skipped
+        access_code_import.save(
+            update_fields=["rows_processed", "codes_created", "codes_skipped"]
+        )
+
+    try:
+        with access_code_import.csv_file.open("rb") as csv_file:
+            import_access_codes(csv_file, progress=progress)
+    except Exception as e:
+        logger.exception(
+            "Access code import {pk} failed.".format(pk=access_code_import.pk)
+        )
+        # The codes aren't kept around on disk, even if they weren't imported.
+        access_code_import.csv_file.delete(save=False)
+        access_code_import.status = AccessCodeImport.FAILED
+        access_code_import.last_error = repr(e)
+        access_code_import.save()
+        return
+
+    access_code_import.csv_file.delete(save=False)
+    access_code_import.status = AccessCodeImport.COMPLETE
+    access_code_import.date_completed = timezone.now()
+    access_code_import.last_error = ""
+    access_code_import.save()
+
+
+def process_pending_access_code_imports():
+    """
+    Process every queued access code import. Imports left in progress by an
+    interrupted run are picked up again.
+
+    Returns
+    -------
+    int
+        The number of imports processed.
+    """
+    access_code_imports = AccessCodeImport.objects.filter(
+        status__in=[AccessCodeImport.PENDING, AccessCodeImport.IN_PROGRESS]
+    )
+    count = 0
+    for access_code_import in access_code_imports.order_by("date_created"):
+        process_access_code_import(access_code_import)
+        count += 1
+    return count
@@ -2,12 +2,17 @@ from django.contrib import messages
 from django import forms
 from django.urls import path
 from django.contrib import admin
-from django.core.exceptions import ObjectDoesNotExist
 from django.http import HttpResponseRedirect
 from django.shortcuts import render
 
 from TWLight.users.groups import get_coordinators
 
+from .access_code_import import (
+    ACCESS_CODE_IMPORT_INLINE_MAX_SIZE,
+    AccessCodeCSVError,
+    import_access_codes,
+    validate_access_code_csv,
+)
 from .models import (
     Partner,
     PartnerLogo,
@@ -17,6 +22,7 @@ from .models import (
     PhabricatorTask,
     Suggestion,
     AccessCode,
+    AccessCodeImport,
 )
 
 
@@ -113,7 +119,8 @@ class AccessCodeAdmin(admin.ModelAdmin):
     def import_csv(self, request):
         """
         Staff can import a csv file containing access codes. This function processes that CSV, creating
-        AccessCode objects as required.
+        AccessCode objects as required. The whole file is checked before
+        anything is imported. Large files are imported in the background.
         """
         if request.method == "POST":
             uploaded_csv = request.FILES["access_code_csv"]
@@ -123,94 +130,27 @@ class AccessCodeAdmin(admin.ModelAdmin):
                 messages.error(request, "File must be a csv")
                 return return_url
 
-            # Check against the maximum upload size (2.5mb by default)
-            if uploaded_csv.multiple_chunks():
-                messages.error(request, "Uploaded file is too large.")
+            try:
+                rows_total = validate_access_code_csv(uploaded_csv)
+            except (AccessCodeCSVError, UnicodeDecodeError) as e:
+                messages.error(request, str(e))
                 return return_url
+            uploaded_csv.seek(0)
 
-            file_data = uploaded_csv.read().decode("utf-8")
-
-            lines = file_data.split("\n")
-
-            skipped_codes = 0
-            num_codes = 0
-
-            for line_num, line in enumerate(lines):
-                fields = line.split(",")
-                num_columns = len(fields)
-                # Skip any blank lines. Not an error, can just be ignored.
-                if line == "":
-                    continue
-                if num_columns != 2:
-                    messages.error(
-                        request,
-                        "Line {line_num} has {num_columns} columns. "
-                        "Expected 2.".format(
-                            line_num=line_num + 1, num_columns=num_columns
-                        ),
-                    )
-                    return return_url
-
-                access_code = fields[0].strip()
-
-                if len(access_code) > 60:
-                    messages.error(
-                        request,
-                        "Access code on line {line_num} is "
-                        "too long for the database field.".format(
-                            line_num=line_num + 1
-                        ),
-                    )
-                    return return_url
-
-                try:
-                    partner_pk = int(fields[1].strip())
-                except ValueError:
-                    messages.error(
-                        request,
-                        "Second column should only contain "
-                        "numbers. Error on line {line_num}.".format(
-                            line_num=line_num + 1
-                        ),
-                    )
-                    return return_url
-
-                try:
-                    Partner.even_not_available.get(pk=partner_pk)
-                except ObjectDoesNotExist:
-                    messages.error(
-                        request,
-                        "File contains reference to invalid "
-                        "partner ID on line {line_num}".format(line_num=line_num + 1),
-                    )
-                    return return_url
-
-            # Now that we've verified all access codes are valid, let's try to
-            # actually upload them.
-            for line in lines:
-                if line == "":
-                    continue
-                fields = line.split(",")
-                access_code = fields[0].strip()
-                partner_pk = int(fields[1].strip())
-
-                # Only upload this code if it doesn't already exist. If it does,
-                # increment a counter so we can report that.
-                access_code_partner_check = (
-                    AccessCode.objects.select_related("partner")
-                    .filter(code=access_code, partner=partner_pk)
-                    .count()
+            if uploaded_csv.size > ACCESS_CODE_IMPORT_INLINE_MAX_SIZE:
+                AccessCodeImport.objects.create(
+                    csv_file=uploaded_csv,
+                    uploaded_by=request.user,
+                    rows_total=rows_total,
+                )
+                messages.info(
+                    request,
+                    "{rows_total} access codes queued for import. Progress is "
+                    "shown under access code imports.".format(rows_total=rows_total),
                 )
-                if access_code_partner_check != 0:
-                    skipped_codes += 1
-                else:
-                    new_access_code = AccessCode()
-                    new_access_code.code = access_code
-                    new_access_code.partner = Partner.even_not_available.get(
-                        pk=partner_pk
-                    )
-                    new_access_code.save()
-                    num_codes += 1
+                return HttpResponseRedirect("admin")
+
+            num_codes, skipped_codes = import_access_codes(uploaded_csv)
 
             if num_codes > 0:
                 messages.info(
@@ -231,6 +171,38 @@ class AccessCodeAdmin(admin.ModelAdmin):
 admin.site.register(AccessCode, AccessCodeAdmin)
 
 
+class AccessCodeImportAdmin(admin.ModelAdmin):
+    list_display = (
+        "date_created",
+        "uploaded_by",
+        "status",
+        "rows_processed",
+        "rows_total",
+        "codes_created",
+        "codes_skipped",
+    )
+    list_filter = ("status",)
+    exclude = ("csv_file",)
+    readonly_fields = (
+        "uploaded_by",
+        "status",
+        "rows_total",
+        "rows_processed",
+        "codes_created",
+        "codes_skipped",
+        "last_error",
+        "date_created",
+        "date_completed",
+    )
+
+    # Imports are created by uploading a file on the access code page.
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(AccessCodeImport, AccessCodeImportAdmin)
+
+
 class SuggestionAdmin(admin.ModelAdmin):
     search_fields = ("suggested_company_name",)
     list_display = ("suggested_company_name", "description", "id")
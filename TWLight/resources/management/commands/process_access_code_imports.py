@@ -0,0 +1,15 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from TWLight.resources.access_code_import import process_pending_access_code_imports
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Imports access code files that were too large to import on upload."
+
+    def handle(self, *args, **options):
+        count = process_pending_access_code_imports()
+        logger.info("Processed {count} access code imports.".format(count=count))
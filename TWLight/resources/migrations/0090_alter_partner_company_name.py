@@ -0,0 +1,22 @@
+# Generated by Django 5.2.15 on 2026-10-19 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("resources", "0089_alter_language_language"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="partner",
+            name="company_name",
+            field=models.CharField(
+                db_index=True,
+                help_text="Partner's name (e.g. McFarland). Note: this will be user-visible and *not translated*.",
+                max_length=255,
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.15 on 2026-10-19 11:51
+
+import TWLight.resources.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("resources", "0091_accesscodeimport"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="accesscodeimport",
+            name="csv_file",
+            field=models.FileField(
+                blank=True,
+                storage=TWLight.resources.models.AccessCodeImportStorage(),
+                upload_to="",
+            ),
+        ),
+    ]
@@ -9,11 +9,14 @@ from jsonschema.exceptions import ValidationError as JSONSchemaValidationError
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
 from django.core.validators import MaxValueValidator
 from django.core.exceptions import ValidationError
 from django.urls import reverse_lazy, reverse
 from django.db import models
 from django_countries.fields import CountryField
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
@@ -126,6 +129,7 @@ class Partner(models.Model):
 
     company_name = models.CharField(
         max_length=255,
+        db_index=True,
         help_text="Partner's name (e.g. McFarland). Note: "
         "this will be user-visible and *not translated*.",
     )
@@ -707,3 +711,73 @@ class AccessCode(models.Model):
         blank=True,
         on_delete=models.CASCADE,
     )
+
+
+@deconstructible
+class AccessCodeImportStorage(FileSystemStorage):
+    """
+    Stores uploaded access code CSVs under ACCESS_CODE_IMPORTS_ROOT, which
+    isn't served, rather than MEDIA_ROOT, which is.
+    """
+
+    @cached_property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.ACCESS_CODE_IMPORTS_ROOT)
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == "ACCESS_CODE_IMPORTS_ROOT":
+            self.__dict__.pop("base_location", None)
+            self.__dict__.pop("location", None)
+
+
+class AccessCodeImport(models.Model):
+    """
+    Tracks a CSV of access codes being imported in the background. Files too
+    large to import during the upload request are stored and picked up by
+    a cron job (see TWLight.resources.access_code_import), which records its
+    progress here.
+    """
+
+    class Meta:
+        app_label = "resources"
+        verbose_name = "access code import"
+        verbose_name_plural = "access code imports"
+
+    PENDING = 0
+    IN_PROGRESS = 1
+    COMPLETE = 2
+    FAILED = 3
+
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (IN_PROGRESS, "In progress"),
+        (COMPLETE, "Complete"),
+        (FAILED, "Failed"),
+    )
+
+    # The file is deleted once the import finishes or fails, since it holds
+    # codes we're giving out.
+    csv_file = models.FileField(storage=AccessCodeImportStorage(), blank=True)
+    uploaded_by = models.ForeignKey(
+        User,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    status = models.IntegerField(choices=STATUS_CHOICES, default=PENDING)
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0)
+    codes_created = models.PositiveIntegerField(default=0)
+    codes_skipped = models.PositiveIntegerField(
+        default=0, help_text="Codes that were ignored as duplicates."
+    )
+    last_error = models.TextField(blank=True, default="")
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_completed = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return "{date} - {status}".format(
+            date=self.date_created, status=self.get_status_display()
+        )
@@ -5,19 +5,22 @@ import json
 from jsonschema import validate
 import os
 import random
+import tempfile
 from unittest.mock import patch
 
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser, User
 from django.core.exceptions import ValidationError, PermissionDenied
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.management import call_command
 from django.urls import reverse
 from django.db import IntegrityError
 from django.http import Http404
-from django.test import Client, TestCase, RequestFactory
+from django.test import Client, TestCase, RequestFactory, override_settings
 from django.utils.html import escape
 
 from TWLight.applications.factories import ApplicationFactory
+from TWLight.applications.helpers import get_partner_capacity
 from TWLight.applications.models import Application
 from TWLight.users.factories import EditorFactory, UserProfileFactory, UserFactory
 from TWLight.users.groups import get_coordinators, get_restricted
@@ -32,6 +35,7 @@ from .models import (
     RESOURCE_LANGUAGES,
     Partner,
     AccessCode,
+    AccessCodeImport,
     Suggestion,
 )
 from .views import (
@@ -838,6 +842,83 @@ class CSVUploadTest(TestCase):  # Migrated from staff dashboard test
         access_codes = AccessCode.objects.all()
         self.assertEqual(access_codes.count(), 2)
 
+    def test_csv_background_import(self):
+        """
+        Large files are queued and imported in batches by a cron job, with
+        duplicates skipped across batches.
+        """
+        test_file = open("accesscodes.csv", "w", newline="")
+        csv_writer = csv.writer(test_file)
+        csv_writer.writerow(("ABCD-EFGH-IJKL", str(self.partner1_pk)))
+        csv_writer.writerow(("BBCD-EFGH-IJKL", str(self.partner1_pk)))
+        csv_writer.writerow(("CBCD-EFGH-IJKL", str(self.partner2_pk)))
+        csv_writer.writerow(("ABCD-EFGH-IJKL", str(self.partner1_pk)))
+        csv_writer.writerow(("ABCD-EFGH-IJKL", str(self.partner2_pk)))
+        test_file.close()
+
+        client = Client()
+        client.login(username=self.staff_user.username, password="staff")
+
+        with tempfile.TemporaryDirectory() as media_root, tempfile.TemporaryDirectory() as imports_root, override_settings(
+            MEDIA_ROOT=media_root, ACCESS_CODE_IMPORTS_ROOT=imports_root
+        ), patch(
+            "TWLight.resources.admin.ACCESS_CODE_IMPORT_INLINE_MAX_SIZE", 0
+        ):
+            with open("accesscodes.csv", "r") as csv_file:
+                client.post(self.url, {"access_code_csv": csv_file})
+
+            self.assertEqual(AccessCode.objects.count(), 0)
+            access_code_import = AccessCodeImport.objects.get()
+            self.assertEqual(access_code_import.status, AccessCodeImport.PENDING)
+            self.assertEqual(access_code_import.rows_total, 5)
+            # MEDIA_ROOT is served publicly, so the codes mustn't go there.
+            csv_path = access_code_import.csv_file.path
+            self.assertFalse(csv_path.startswith(media_root))
+            self.assertTrue(csv_path.startswith(imports_root))
+            self.assertEqual(os.listdir(media_root), [])
+
+            with patch(
+                "TWLight.resources.access_code_import.ACCESS_CODE_IMPORT_BATCH_SIZE", 2
+            ):
+                call_command("process_access_code_imports")
+
+            access_code_import.refresh_from_db()
+            self.assertEqual(access_code_import.status, AccessCodeImport.COMPLETE)
+            self.assertEqual(access_code_import.rows_processed, 5)
+            self.assertEqual(access_code_import.codes_created, 4)
+            self.assertEqual(access_code_import.codes_skipped, 1)
+            # The codes aren't kept around on disk.
+            self.assertFalse(access_code_import.csv_file)
+            self.assertEqual(os.listdir(imports_root), [])
+        self.assertEqual(AccessCode.objects.count(), 4)
+
+    def test_failed_csv_import_deleted(self):
+        """
+        A queued import that fails doesn't leave its codes on disk.
+        """
+        with tempfile.TemporaryDirectory() as imports_root, override_settings(
+            ACCESS_CODE_IMPORTS_ROOT=imports_root
+        ):
+            access_code_import = AccessCodeImport.objects.create(
+                csv_file=SimpleUploadedFile(
+                    "accesscodes.csv",
+                    "ABCD-EFGH-IJKL,{pk}\n".format(pk=self.partner1_pk).encode(),
+                ),
+                rows_total=1,
+            )
+            self.assertEqual(os.listdir(imports_root), ["accesscodes.csv"])
+
+            with patch(
+                "TWLight.resources.access_code_import.import_access_codes",
+                side_effect=Exception("Database went away"),
+            ):
+                call_command("process_access_code_imports")
+
+            access_code_import.refresh_from_db()
+            self.assertEqual(access_code_import.status, AccessCodeImport.FAILED)
+            self.assertFalse(access_code_import.csv_file)
+            self.assertEqual(os.listdir(imports_root), [])
+
     def test_csv_formatting(self):
         """
         An incorrectly formatted csv shouldn't upload anything.
@@ -947,6 +1028,52 @@ class AutoWaitlistDisableTest(TestCase):
         self.partner1.refresh_from_db()
         self.assertEqual(self.partner1.status, Partner.WAITLIST)
 
+    def test_auto_enable_waitlist_command(self):
+        """
+        Proxy partners that have run out of accounts are waitlisted.
+        """
+        self.partner1.status = Partner.AVAILABLE
+        self.partner1.save()
+
+        capacity = get_partner_capacity()
+        self.assertEqual(capacity[self.partner.pk]["valid_authorizations"], 2)
+        self.assertEqual(capacity[self.partner.pk]["pending_applications"], 1)
+        self.assertEqual(capacity[self.partner.pk]["available_for_distribution"], 8)
+        self.assertEqual(capacity[self.partner1.pk]["available_for_distribution"], 0)
+
+        call_command("proxy_waitlist_disable")
+
+        self.partner1.refresh_from_db()
+        self.assertEqual(self.partner1.status, Partner.WAITLIST)
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_capacity_follows_partner_changes(self):
+        """
+        Raising a partner's accounts_available, or deleting the partner, is
+        reflected in partner capacity straight away, rather than once the
+        cached snapshot expires.
+        """
+        partner = PartnerFactory(
+            authorization_method=Partner.EMAIL, accounts_available=2
+        )
+        self.assertEqual(
+            get_partner_capacity()[partner.pk]["available_for_distribution"], 2
+        )
+
+        partner.accounts_available = 7
+        partner.save()
+
+        self.assertEqual(
+            get_partner_capacity()[partner.pk]["available_for_distribution"], 7
+        )
+
+        partner_pk = partner.pk
+        partner.delete()
+
+        self.assertNotIn(partner_pk, get_partner_capacity())
+
 
 class BundlePartnerTest(TestCase):
     @classmethod
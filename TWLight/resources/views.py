@@ -13,7 +13,7 @@ from django.views.generic.edit import FormView, DeleteView
 from django.shortcuts import get_object_or_404, redirect
 
 from TWLight.applications.models import Application
-from TWLight.users.groups import get_coordinators
+from TWLight.users.groups import get_user_groups
 from TWLight.users.models import Authorization, User
 from TWLight.view_mixins import (
     CoordinatorsOnly,
@@ -514,10 +514,9 @@ class PartnerSuggestionView(FormView):
         # Not using the coordinators_only template filter because of performance
         # issues
         user = self.request.user
-        coordinators = get_coordinators()
 
         # We allow coordinators to take certain additional actions on this page.
-        if coordinators in user.groups.all() or user.is_superuser:
+        if get_user_groups(user).is_coordinator or user.is_superuser:
             context["user_is_coordinator"] = True
         else:
             context["user_is_coordinator"] = False
@@ -163,6 +163,10 @@ CRON_CLASSES = [
     "TWLight.crons.BackupCronJob",
     "TWLight.crons.SendCoordinatorRemindersCronJob",
     "TWLight.crons.UserRenewalNoticeCronJob",
+    "TWLight.crons.AccountErasureCronJob",
+    "TWLight.crons.AccessCodeImportCronJob",
+    "TWLight.crons.SendQueuedEmailsCronJob",
+    "TWLight.crons.CommentDigestCronJob",
     "TWLight.crons.ProxyWaitlistDisableCronJob",
     "TWLight.crons.UserUpdateEligibilityCronJob",
     "TWLight.crons.ClearSessions",
@@ -383,6 +387,19 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 MEDIA_ROOT = os.path.join(os.path.dirname(BASE_DIR), "media")
 MEDIA_URL = "/media/"
 
+# Reports written by management commands, such as retrieve_monthly_users. They
+# hold user data, so they're kept out of MEDIA_ROOT, which is served publicly.
+REPORTS_ROOT = os.environ.get(
+    "TWLIGHT_REPORTS_DIR", os.path.join(os.path.dirname(BASE_DIR), "reports")
+)
+
+# Uploaded access code CSVs waiting to be imported. They hold codes we're
+# giving out, so like reports they're kept out of MEDIA_ROOT.
+ACCESS_CODE_IMPORTS_ROOT = os.environ.get(
+    "TWLIGHT_ACCESS_CODE_IMPORTS_DIR",
+    os.path.join(os.path.dirname(BASE_DIR), "access_code_imports"),
+)
+
 
 # ------------------------------------------------------------------------------
 # -----------------> third-party and TWLight configurations <-------------------
@@ -421,6 +438,9 @@ MW_API_URL = os.environ.get("MW_API_URL", None)
 MW_API_REQUEST_TIMEOUT = os.environ.get("MW_API_REQUEST_TIMEOUT", 60)
 MW_API_REQUEST_DELAY = os.environ.get("MW_API_REQUEST_DELAY", 0)
 MW_API_REQUEST_RETRY_DELAY = os.environ.get("MW_API_REQUEST_RETRY_DELAY", 5)
+# Concurrent senders in the MediaWiki email backend. MW_API_REQUEST_DELAY is
+# the minimum interval between their requests.
+MW_API_EMAIL_WORKERS = os.environ.get("MW_API_EMAIL_WORKERS", 1)
 MW_API_MAXLAG = os.environ.get("MW_API_MAXLAG", 5)
 MW_API_EMAIL_USER = os.environ.get("MW_API_EMAIL_USER", None)
 MW_API_EMAIL_PASSWORD = os.environ.get("MW_API_EMAIL_PASSWORD", None)
@@ -448,7 +468,17 @@ DKIM_DOMAIN = os.environ.get("DKIM_DOMAIN", None)
 DJMAIL_REAL_BACKEND = os.environ.get(
     "DJANGO_EMAIL_BACKEND", "django_dkim.backends.console.EmailBackend"
 )
-EMAIL_BACKEND = "djmail.backends.async.EmailBackend"
+# Emails are queued on djmail's Message table and sent by the
+# send_queued_emails worker, see TWLight/emails/queue.py.
+EMAIL_BACKEND = "TWLight.emails.backends.queued.EmailBackend"
+# Seconds before a failed email is retried, doubled with every attempt.
+EMAIL_QUEUE_RETRY_BACKOFF = int(os.environ.get("EMAIL_QUEUE_RETRY_BACKOFF", 60))
+# Seconds to collect comment notifications into a single digest per recipient,
+# see TWLight.emails.tasks.send_comment_notification_digests. 0 sends them
+# straight away.
+COMMENT_NOTIFICATION_DIGEST_WINDOW = int(
+    os.environ.get("COMMENT_NOTIFICATION_DIGEST_WINDOW", 0)
+)
 EMAIL_HOST = os.environ.get("DJANGO_EMAIL_HOST", "localhost")
 EMAIL_PORT = 25
 EMAIL_SMTP_MAIL_FROM = os.environ.get("EMAIL_SMTP_MAIL_FROM", None)
@@ -1,3 +1,4 @@
+import json
 import random
 from unittest.mock import patch
 from datetime import date, timedelta
@@ -11,7 +12,7 @@ from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.management import call_command
 from django.urls import reverse
 from django.http import HttpResponseRedirect
-from django.test import TestCase, RequestFactory, Client
+from django.test import TestCase, RequestFactory, Client, override_settings
 from django.utils import timezone
 from django.utils.html import escape
 
@@ -26,6 +27,7 @@ from TWLight.users.helpers.authorizations import get_all_bundle_authorizations
 from TWLight.users.factories import UserFactory, EditorFactory
 from TWLight.users.groups import get_coordinators
 from TWLight.users.models import Authorization
+from TWLight.users.templatetags.twlight_perms import coordinators_only
 import TWLight.users.views
 
 from . import views as base_views
@@ -38,6 +40,7 @@ from .view_mixins import (
     SelfOnly,
     ToURequired,
     EmailRequired,
+    test_func_coordinators_only,
 )
 
 
@@ -228,6 +231,31 @@ class ViewMixinTests(TestCase):
         with self.assertRaises(PermissionDenied):
             test.dispatch(req)
 
+    def test_coordinators_only_4(self):
+        """
+        Group membership should be loaded once per user object, and reloaded
+        after the user's groups change.
+        """
+        user = UserFactory(is_superuser=False)
+
+        req = RequestFactory()
+        req.user = user
+
+        test = TestCoordinatorsOnly()
+
+        with self.assertRaises(PermissionDenied):
+            test.dispatch(req)
+        with self.assertNumQueries(0):
+            self.assertFalse(coordinators_only(user))
+            self.assertFalse(test_func_coordinators_only(user))
+
+        get_coordinators().user_set.add(user)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(coordinators_only(user))
+            self.assertTrue(test_func_coordinators_only(user))
+        test.dispatch(req)
+
     def test_editors_only_1(self):
         """
         EditorsOnly allows editors.
@@ -885,10 +913,12 @@ class AuthorizationTestCase(AuthorizationBaseTestCase):
         )
         request.user = self.editor4.user
 
-        # Mark as sent
-        response = TWLight.applications.views.SendReadyApplicationsView.as_view()(
-            request, pk=self.app9.partner.pk
-        )
+        # Mark as sent. The access code email goes out once the transaction
+        # commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            response = TWLight.applications.views.SendReadyApplicationsView.as_view()(
+                request, pk=self.app9.partner.pk
+            )
         # verify that was successful
         self.assertEqual(response.status_code, 302)
 
@@ -1110,6 +1140,109 @@ class AuthorizedUsersAPITestCase(AuthorizationBaseTestCase):
 
         self.assertEqual(response.data, expected_json)
 
+    def test_authorized_users_api_paginated(self):
+        """
+        Passing page_size should return keyset-paginated results with a cursor
+        to the next page.
+        """
+        factory = APIRequestFactory()
+        request = factory.get(
+            "/api/v0/users/authorizations/partner/1", {"page_size": 2}
+        )
+        force_authenticate(request, user=self.editor1.user)
+
+        response = TWLight.users.views.AuthorizedUsers.as_view()(
+            request, self.partner1.pk, 0
+        )
+
+        self.assertEqual(
+            response.data["results"],
+            [
+                {"wp_username": self.editor1.wp_username},
+                {"wp_username": self.editor2.wp_username},
+            ],
+        )
+        self.assertIsNotNone(response.data["next"])
+
+        request = factory.get(response.data["next"])
+        force_authenticate(request, user=self.editor1.user)
+
+        response = TWLight.users.views.AuthorizedUsers.as_view()(
+            request, self.partner1.pk, 0
+        )
+
+        self.assertEqual(
+            response.data["results"], [{"wp_username": self.editor3.wp_username}]
+        )
+        self.assertIsNone(response.data["next"])
+
+    def test_authorized_users_api_stream(self):
+        """
+        Passing stream=true should stream the same list the API otherwise returns.
+        """
+        factory = APIRequestFactory()
+        request = factory.get(
+            "/api/v0/users/authorizations/partner/1", {"stream": "true"}
+        )
+        force_authenticate(request, user=self.editor1.user)
+
+        response = TWLight.users.views.AuthorizedUsers.as_view()(
+            request, self.partner1.pk, 0
+        )
+
+        self.assertTrue(response.streaming)
+        expected_json = [
+            {"wp_username": self.editor1.wp_username},
+            {"wp_username": self.editor2.wp_username},
+            {"wp_username": self.editor3.wp_username},
+        ]
+        self.assertEqual(
+            json.loads(b"".join(response.streaming_content)), expected_json
+        )
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_authorized_users_api_etag(self):
+        """
+        The ETag should hold until an authorization for the partner changes.
+        """
+        factory = APIRequestFactory()
+        request = factory.get("/api/v0/users/authorizations/partner/1")
+        force_authenticate(request, user=self.editor1.user)
+        response = TWLight.users.views.AuthorizedUsers.as_view()(
+            request, self.partner1.pk, 0
+        )
+        etag = response["ETag"]
+
+        request = factory.get(
+            "/api/v0/users/authorizations/partner/1", HTTP_IF_NONE_MATCH=etag
+        )
+        force_authenticate(request, user=self.editor1.user)
+        response = TWLight.users.views.AuthorizedUsers.as_view()(
+            request, self.partner1.pk, 0
+        )
+        self.assertEqual(response.status_code, 304)
+
+        self.auth_app3.date_expires = date.today() - timedelta(days=1)
+        self.auth_app3.save()
+
+        request = factory.get(
+            "/api/v0/users/authorizations/partner/1", HTTP_IF_NONE_MATCH=etag
+        )
+        force_authenticate(request, user=self.editor1.user)
+        response = TWLight.users.views.AuthorizedUsers.as_view()(
+            request, self.partner1.pk, 0
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data,
+            [
+                {"wp_username": self.editor1.wp_username},
+                {"wp_username": self.editor2.wp_username},
+            ],
+        )
+
 
 class TestBaseViews(TestCase):
     @classmethod
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import Group
+from django.utils.functional import cached_property
 
 # Woo yeah named constant!
 COORDINATOR_GROUP_NAME = "Coordinators"
@@ -14,6 +15,23 @@ RESTRICTED_GROUP_NAME = "Restricted"
 # guaranteed to exist at runtime.
 
 
+# Group objects are looked up on nearly every page, and the groups themselves
+# never change, so we keep them for the lifetime of the process.
+_groups = {}
+
+# Bumped whenever any user's group membership changes in this process, so
+# that UserGroups loaded earlier know to reload.
+_membership_generation = 0
+
+
+def _get_group(name):
+    group = _groups.get(name)
+    if group is None:
+        group = Group.objects.get(name=name)
+        _groups[name] = group
+    return group
+
+
 def get_coordinators():
     """
     Retrieve all users who are in the Coordinator user group.
@@ -24,7 +42,7 @@ def get_coordinators():
         A queryset of user objects
     """
     try:
-        return Group.objects.get(name=COORDINATOR_GROUP_NAME)
+        return _get_group(COORDINATOR_GROUP_NAME)
     except:
         pass
 
@@ -39,6 +57,75 @@ def get_restricted():
         A queryset of user objects
     """
     try:
-        return Group.objects.get(name=RESTRICTED_GROUP_NAME)
+        return _get_group(RESTRICTED_GROUP_NAME)
     except:
         pass
+
+
+def clear_group_cache():
+    """
+    Forget cached Group objects and mark any loaded group membership as stale.
+
+    Returns
+    -------
+    None
+    """
+    global _membership_generation
+    _groups.clear()
+    _membership_generation += 1
+
+
+class UserGroups(object):
+    """
+    A user's group membership, loaded with a single query the first time it's
+    needed and then reused. Permission checks should go through
+    get_user_groups() rather than querying user.groups directly.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._generation = _membership_generation
+
+    @cached_property
+    def names(self):
+        if not self.user or not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(self.user.groups.values_list("name", flat=True))
+
+    def _fresh_names(self):
+        if self._generation != _membership_generation:
+            self.__dict__.pop("names", None)
+            self._generation = _membership_generation
+        return self.names
+
+    @property
+    def is_coordinator(self):
+        return COORDINATOR_GROUP_NAME in self._fresh_names()
+
+    @property
+    def is_restricted(self):
+        return RESTRICTED_GROUP_NAME in self._fresh_names()
+
+
+def get_user_groups(user):
+    """
+    Get the group membership for a user, reusing the one already loaded for
+    this user object if there is one. The authentication middleware gives
+    each request its own user object, so this is loaded at most once per
+    request.
+
+    Parameters
+    ----------
+    user : User
+        The user whose groups we want.
+
+    Returns
+    -------
+    UserGroups
+    """
+    try:
+        return user._user_groups
+    except AttributeError:
+        user_groups = UserGroups(user)
+        user._user_groups = user_groups
+        return user_groups
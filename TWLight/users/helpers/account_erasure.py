@@ -0,0 +1,207 @@
+import logging
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+from django_comments.models import Comment
+from reversion.models import Version
+
+from TWLight.applications.helpers import invalidate_partner_capacity
+from TWLight.applications.models import Application
+from TWLight.resources.models import Partner
+from TWLight.users.helpers.authorizations import bump_partner_authorizations_version
+from TWLight.users.models import AccountErasure, Authorization
+
+logger = logging.getLogger(__name__)
+
+# Rows touched per transaction. Keeps lock times short for coordinators
+# with thousands of authorizations.
+ERASURE_CHUNK_SIZE = 1000
+# Give up on an erasure after this many failed runs, so it gets looked at.
+ERASURE_MAX_ATTEMPTS = 5
+
+DELETED = "[deleted]"
+
+
+def _chunked_update(queryset, **values):
+    """
+    Apply an update to a queryset one chunk at a time. The queryset must stop
+    matching rows once they've been updated, or this won't terminate.
+
+    Returns a list of the updated primary keys.
+    """
+    updated_pks = []
+    while True:
+        with transaction.atomic():
+            pks = list(queryset.values_list("pk", flat=True)[:ERASURE_CHUNK_SIZE])
+            if not pks:
+                return updated_pks
+            queryset.model._default_manager.filter(pk__in=pks).update(**values)
+        updated_pks += pks
+
+
+def _blank_applications(user: User):
+    _chunked_update(
+        Application.include_invalid.filter(editor__user=user).exclude(
+            rationale=DELETED, account_email=DELETED, comments=DELETED
+        ),
+        rationale=DELETED,
+        account_email=DELETED,
+        comments=DELETED,
+    )
+
+
+def _delete_application_versions(user: User):
+    content_type = ContentType.objects.get_for_model(Application)
+    applications = Application.include_invalid.filter(editor__user=user).order_by("pk")
+    last_pk = 0
+    while True:
+        pks = list(
+            applications.filter(pk__gt=last_pk).values_list("pk", flat=True)[
+                :ERASURE_CHUNK_SIZE
+            ]
+        )
+        if not pks:
+            return
+        with transaction.atomic():
+            Version.objects.filter(
+                content_type=content_type, object_id__in=[str(pk) for pk in pks]
+            ).delete()
+        last_pk = pks[-1]
+
+
+def _blank_comments(user: User):
+    # Usernames and emails are duplicated in the comment object.
+    _chunked_update(
+        Comment.objects.filter(user=user).exclude(
+            user_name="", user_email="", comment=DELETED
+        ),
+        user_name="",
+        user_email="",
+        comment=DELETED,
+    )
+
+
+def _expire_authorizations(user: User):
+    # Expire any expiry date authorizations, but keep the object.
+    expired_pks = _chunked_update(
+        Authorization.objects.filter(user=user, date_expires__gte=date.today()),
+        date_expires=date.today() - timedelta(days=1),
+    )
+    # Bulk updates skip signals, so let partner caches know about it here.
+    bump_partner_authorizations_version(
+        Authorization.partners.through.objects.filter(authorization_id__in=expired_pks)
+        .values_list("partner_id", flat=True)
+        .distinct()
+    )
+    invalidate_partner_capacity()
+
+
+def _delete_bundle_authorizations(user: User):
+    Authorization.objects.filter(
+        pk__in=list(
+            Authorization.objects.filter(
+                user=user, partners__authorization_method=Partner.BUNDLE
+            ).values_list("pk", flat=True)
+        )
+    ).delete()
+
+
+def _reassign_authorizer(user: User):
+    # Authorizations granted by this user must stay valid, so we shift the
+    # authorizer to TWL Team.
+    twl_team = User.objects.get(username="TWL Team")
+    _chunked_update(Authorization.objects.filter(authorizer=user), authorizer=twl_team)
+
+
+def _delete_user(user: User):
+    user.delete()
+
+
+# Stages run in this order. The user is deleted last, because the other
+# stages look up data through it; the authorizer must be reassigned before
+# that, or deleting the user would null it out and invalidate authorizations.
+ERASURE_STAGES = [
+    ("applications", _blank_applications),
+    ("application_versions", _delete_application_versions),
+    ("comments", _blank_comments),
+    ("authorizations", _expire_authorizations),
+    ("bundle_authorizations", _delete_bundle_authorizations),
+    ("authorizer", _reassign_authorizer),
+    ("user", _delete_user),
+]
+
+
+def process_account_erasure(erasure: AccountErasure):
+    """
+    Run, or resume, an account erasure. Stages completed by a previous run
+    are skipped.
+
+    Parameters
+    ----------
+    erasure : AccountErasure
+        The erasure to process.
+
+    Returns
+    -------
+    None
+    """
+    stage_names = [name for name, _ in ERASURE_STAGES]
+    if erasure.stage in stage_names:
+        remaining_stages = ERASURE_STAGES[stage_names.index(erasure.stage) + 1 :]
+    else:
+        remaining_stages = ERASURE_STAGES
+
+    erasure.status = AccountErasure.IN_PROGRESS
+    erasure.attempts += 1
+    erasure.save()
+
+    try:
+        for name, stage in remaining_stages:
+            # The user may have been deleted in an earlier run, after the
+            # stage was done but before we recorded it.
+            if erasure.user is not None:
+                stage(erasure.user)
+            if stage is _delete_user:
+                erasure.user = None
+            erasure.stage = name
+            erasure.save(update_fields=["user", "stage"])
+    except Exception as e:
+        logger.exception(
+            "Account erasure {token} failed in stage '{stage}'.".format(
+                token=erasure.token, stage=name
+            )
+        )
+        erasure.last_error = repr(e)
+        if erasure.attempts >= ERASURE_MAX_ATTEMPTS:
+            erasure.status = AccountErasure.FAILED
+        else:
+            erasure.status = AccountErasure.PENDING
+        erasure.save()
+        return
+
+    erasure.status = AccountErasure.COMPLETE
+    erasure.date_completed = timezone.now()
+    erasure.last_error = ""
+    erasure.save()
+
+
+def process_pending_account_erasures():
+    """
+    Process every account erasure that hasn't completed or failed for good.
+
+    Returns
+    -------
+    int
+        The number of erasures processed.
+    """
+    erasures = AccountErasure.objects.select_related("user").filter(
+        status__in=[AccountErasure.PENDING, AccountErasure.IN_PROGRESS]
+    )
+    count = 0
+    for erasure in erasures.order_by("date_requested"):
+        process_account_erasure(erasure)
+        count += 1
+    return count
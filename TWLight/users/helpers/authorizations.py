@@ -1,4 +1,8 @@
-from django.db.models import QuerySet
+import time
+from datetime import date
+
+from django.core.cache import cache
+from django.db.models import Q, QuerySet
 
 from TWLight.resources.models import Partner
 from TWLight.users.models import Authorization
@@ -22,6 +26,28 @@ def get_all_bundle_authorizations():
     )
 
 
+def get_valid_bundle_authorizations():
+    """
+    Returns all currently valid Bundle authorizations. The filter must be kept
+    in sync with TWLight.users.models.Authorization.is_valid, as with
+    TWLight.resources.models.Partner.get_valid_authorizations.
+
+    Returns
+    -------
+    QuerySet
+    """
+    today = date.today()
+    return Authorization.objects.filter(
+        Q(date_expires__isnull=False, date_expires__gte=today)
+        | Q(date_expires__isnull=True),
+        authorizer__isnull=False,
+        user__isnull=False,
+        date_authorized__isnull=False,
+        date_authorized__lte=today,
+        partners__authorization_method=Partner.BUNDLE,
+    )
+
+
 def create_resource_dict(authorization: Authorization, partner: Partner):
     """
     For a given authorization and associated partner, fetch some additional
@@ -108,3 +134,54 @@ def sort_authorizations_into_resource_list(authorizations: QuerySet):
         return resource_list
     else:
         return None
+
+
+def _partner_authorizations_version_key(partner_pk: int):
+    return "partner_authorizations_version_{pk}".format(pk=partner_pk)
+
+
+def get_partner_authorizations_version(partner_pk: int):
+    """
+    Returns the current authorization change counter for a partner. The
+    counter is bumped whenever an Authorization for the partner is saved,
+    deleted, or has its partners changed, so it can be used to key caches
+    and ETags for data derived from the partner's authorizations.
+
+    Parameters
+    ----------
+    partner_pk: int
+        Primary key of a Partner object.
+    Returns
+    -------
+    int
+    """
+    key = _partner_authorizations_version_key(partner_pk)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so that a counter lost to a cache clear can't
+        # come back around to a value that a client already has.
+        version = time.time_ns()
+        cache.add(key, version, timeout=None)
+        version = cache.get(key, version)
+    return version
+
+
+def bump_partner_authorizations_version(partner_pks):
+    """
+    Increments the authorization change counter for each of the given
+    partners.
+
+    Parameters
+    ----------
+    partner_pks: iterable
+        Primary keys of Partner objects.
+    Returns
+    -------
+    None
+    """
+    for partner_pk in partner_pks:
+        try:
+            cache.incr(_partner_authorizations_version_key(partner_pk))
+        except ValueError:
+            # No counter yet; the next read seeds a fresh one.
+            pass
@@ -0,0 +1,192 @@
+import zipfile
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django_comments.models import Comment
+
+from TWLight.applications.models import Application
+from TWLight.users.models import Authorization, Editor, EditorLog
+
+# Rows fetched from the database per round trip while exporting.
+EXPORT_CHUNK_SIZE = 500
+
+EDITOR_EXPORT_FIELDS = [
+    "wp_username",
+    "contributions",
+    "real_name",
+    "country_of_residence",
+    "affiliation",
+]
+
+APPLICATION_EXPORT_FIELDS = [
+    "partner__company_name",
+    "status",
+    "date_created",
+    "date_closed",
+    "rationale",
+    "specific_title",
+    "comments",
+    "account_email",
+    "requested_access_duration",
+]
+
+_encoder = DjangoJSONEncoder()
+
+
+def _dumps(obj):
+    return _encoder.encode(obj)
+
+
+def _without_blanks(row: dict):
+    """We only export data the user actually gave us."""
+    return {key: value for key, value in row.items() if value not in (None, "")}
+
+
+def _iter_json_object(pairs):
+    """Encode an iterable of (key, value) pairs as a JSON object, incrementally."""
+    yield "{"
+    for i, (key, value) in enumerate(pairs):
+        yield "{sep}\n{key}: {value}".format(
+            sep="," if i else "", key=_dumps(str(key)), value=_dumps(value)
+        )
+    yield "\n}"
+
+
+def _iter_json_array(items):
+    """Encode an iterable as a JSON array, incrementally."""
+    yield "["
+    for i, item in enumerate(items):
+        yield "{sep}\n{item}".format(sep="," if i else "", item=_dumps(item))
+    yield "\n]"
+
+
+def _iter_applications(editor: Editor):
+    applications = (
+        Application.include_invalid.filter(editor=editor)
+        .order_by("pk")
+        .values("pk", *APPLICATION_EXPORT_FIELDS)
+    )
+    for application in applications.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        pk = application.pop("pk")
+        application["partner"] = application.pop("partner__company_name")
+        yield pk, _without_blanks(application)
+
+
+def _iter_comments(editor: Editor):
+    comments = (
+        Comment.objects.filter(user_id=editor.user_id)
+        .order_by("pk")
+        .values("comment", "submit_date")
+    )
+    yield from comments.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _iter_authorizations(editor: Editor):
+    authorizations = (
+        Authorization.objects.filter(user_id=editor.user_id)
+        .prefetch_related("partners")
+        .order_by("pk")
+    )
+    for authorization in authorizations.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield _without_blanks(
+            {
+                "partners": [
+                    partner.company_name for partner in authorization.partners.all()
+                ],
+                "date_authorized": authorization.date_authorized,
+                "date_expires": authorization.date_expires,
+            }
+        )
+
+
+def _iter_editor_logs(editor: Editor):
+    editor_logs = (
+        EditorLog.objects.filter(editor=editor)
+        .order_by("timestamp")
+        .values("timestamp", "editcount")
+    )
+    yield from editor_logs.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def iter_user_data_json(editor: Editor):
+    """
+    Generates a JSON document holding the personal data an editor has
+    submitted to, or that we have collected on, the platform. Related rows
+    are read in chunks and encoded as they arrive, so memory use doesn't grow
+    with the user's history.
+
+    Parameters
+    ----------
+    editor : Editor
+        The editor whose data is being exported.
+
+    Returns
+    -------
+    generator
+        Yields str chunks that together form the JSON document.
+    """
+    user_data = _without_blanks(
+        {field: getattr(editor, field) for field in EDITOR_EXPORT_FIELDS}
+    )
+    sections = [
+        ("user_data", lambda: iter([_dumps(user_data)])),
+        ("applications", lambda: _iter_json_object(_iter_applications(editor))),
+        ("comments", lambda: _iter_json_array(_iter_comments(editor))),
+        ("authorizations", lambda: _iter_json_array(_iter_authorizations(editor))),
+        ("editor_logs", lambda: _iter_json_array(_iter_editor_logs(editor))),
+    ]
+
+    yield "{"
+    for i, (name, section) in enumerate(sections):
+        yield "{sep}\n{name}: ".format(sep="," if i else "", name=_dumps(name))
+        yield from section()
+    yield "\n}\n"
+
+
+class _StreamBuffer:
+    """
+    A write-only file object that hands written bytes back to a generator.
+    ZipFile supports unseekable output, writing data descriptors after each
+    member instead of seeking back to fill in the header.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_user_data_zip(editor: Editor, filename: str = "user_data.json"):
+    """
+    Generates a zip archive containing the output of iter_user_data_json().
+
+    Parameters
+    ----------
+    editor : Editor
+        The editor whose data is being exported.
+    filename : str
+        Name of the JSON file within the archive.
+
+    Returns
+    -------
+    generator
+        Yields bytes chunks that together form the zip archive.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(filename, mode="w") as member:
+            for chunk in iter_user_data_json(editor):
+                member.write(chunk.encode("utf-8"))
+                data = buffer.pop()
+                if data:
+                    yield data
+    yield buffer.pop()
@@ -0,0 +1,141 @@
+import csv
+import gzip
+import os
+from datetime import date, datetime, time
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from TWLight.applications.models import Application
+from TWLight.users.models import Authorization, Editor
+
+# Editors read from the database per query while writing the report.
+MONTHLY_USERS_CHUNK_SIZE = 2000
+
+MONTHLY_USERS_HEADER = ["wp_username", "has_approved_apps", "has_current_auths"]
+
+
+def monthly_users_queryset(first_day: date, last_day: date):
+    """
+    Editors who logged in between two dates, inclusive, flagged by whether
+    they have approved applications and current authorizations. Each flag is
+    an EXISTS subquery on an indexed foreign key, rather than a GROUP BY over
+    every application and authorization the editors have.
+
+    Parameters
+    ----------
+    first_day : date
+        The first day of the period.
+    last_day : date
+        The last day of the period.
+
+    Returns
+    -------
+    QuerySet
+        Editors, annotated with has_approved_apps and has_current_auths.
+    """
+    tz = timezone.get_current_timezone()
+    start = datetime.combine(first_day, time.min, tzinfo=tz)
+    end = datetime.combine(last_day + relativedelta(days=1), time.min, tzinfo=tz)
+    a_year_ago = date.today() - relativedelta(years=1)
+
+    approved_apps = Application.include_invalid.filter(
+        editor=OuterRef("pk"),
+        status__in=[Application.APPROVED, Application.SENT],
+    )
+    current_auths = Authorization.objects.filter(
+        # created no more than a year ago or
+        Q(date_authorized__gte=a_year_ago)
+        # expired no more than a year ago or
+        | Q(date_expires__gte=a_year_ago)
+        # are currently active (eg. have currently associated partners)
+        | Q(partners__isnull=False),
+        user=OuterRef("user_id"),
+    )
+    return Editor.objects.filter(
+        user__last_login__gte=start, user__last_login__lt=end
+    ).annotate(
+        has_approved_apps=Exists(approved_apps),
+        has_current_auths=Exists(current_auths),
+    )
+
+
+def _iter_monthly_users(queryset):
+    """
+    Reads the report a page at a time, keyed on the primary key, so neither
+    the database driver nor we hold more than one page of rows.
+    """
+    last_pk = 0
+    while True:
+        rows = list(
+            queryset.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", *MONTHLY_USERS_HEADER)[:MONTHLY_USERS_CHUNK_SIZE]
+        )
+        if not rows:
+            return
+        for row in rows:
+            yield row[1:]
+        last_pk = rows[-1][0]
+
+
+def write_monthly_users_report(first_day: date, last_day: date, path=None):
+    """
+    Writes the monthly users report for a period to a gzipped CSV file.
+
+    Parameters
+    ----------
+    first_day : date
+        The first day of the period.
+    last_day : date
+        The last day of the period.
+    path : str
+        Where to write the report. Defaults to a file named after the period
+        in REPORTS_ROOT.
+
+    Returns
+    -------
+    tuple
+        The path of the report, and a dict summarizing it.
+    """
+    if path is None:
+        path = os.path.join(
+            settings.REPORTS_ROOT,
+            "monthly_users_{first_day}_{last_day}.csv.gz".format(
+                first_day=first_day, last_day=last_day
+            ),
+        )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    summary = {
+        "first_day": first_day,
+        "last_day": last_day,
+        "total": 0,
+        "with_approved_apps": 0,
+        "with_current_auths": 0,
+        "with_both": 0,
+    }
+    # Written under a temporary name, so an interrupted run doesn't leave
+    # behind a report that looks complete.
+    partial_path = path + ".partial"
+    with gzip.open(partial_path, "wt", newline="") as report:
+        writer = csv.writer(report)
+        writer.writerow(MONTHLY_USERS_HEADER)
+        for wp_username, has_approved_apps, has_current_auths in _iter_monthly_users(
+            monthly_users_queryset(first_day, last_day)
+        ):
+            writer.writerow(
+                [
+                    wp_username,
+                    "true" if has_approved_apps else "false",
+                    "true" if has_current_auths else "false",
+                ]
+            )
+            summary["total"] += 1
+            summary["with_approved_apps"] += bool(has_approved_apps)
+            summary["with_current_auths"] += bool(has_current_auths)
+            summary["with_both"] += bool(has_approved_apps and has_current_auths)
+    os.replace(partial_path, path)
+    return path, summary
@@ -0,0 +1,15 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from TWLight.users.helpers.account_erasure import process_pending_account_erasures
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Deletes the data of users who asked for their accounts to be removed."
+
+    def handle(self, *args, **options):
+        count = process_pending_account_erasures()
+        logger.info("Processed {count} account erasures.".format(count=count))
@@ -7,10 +7,14 @@ from django.core.management.base import BaseCommand, CommandError
 from django.db.models import DurationField, ExpressionWrapper, F, Q
 from django.db.models.functions import TruncDate
 from django.utils.timezone import timedelta
-from django.utils.translation import gettext_lazy as _
 
-from TWLight.emails.models import Message
-from TWLight.emails.tasks import email_connection, send_survey_active_user_email
+from TWLight.emails.campaigns import create_campaign, run_campaign
+from TWLight.emails.models import EmailCampaign, EmailLedger
+from TWLight.emails.tasks import (
+    SURVEY_ACTIVE_USER_CAMPAIGN,
+    email_connection,
+    make_survey_active_user_email,
+)
 from TWLight.users.groups import get_restricted
 
 logger = logging.getLogger(__name__)
@@ -41,6 +45,12 @@ class Command(BaseCommand):
             required=False,
             help="number of emails to send; default is 1000",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            required=False,
+            help="number of emails to send at once; default is 1",
+        )
         parser.add_argument(
             "--backend",
             type=str,
@@ -112,42 +122,71 @@ class Command(BaseCommand):
                 is_active=True,
             )
         )
-        logger.info("{} users qualify".format(users.count()))
-        previously_sent_user_pks = Message.twl.user_pks_with_subject_list(
-            # Translators: email subject line
-            subject=_("The Wikipedia Library needs your help!"),
-            users=users,
-        )
-        logger.info(
-            "{} users previously sent message will be skipped".format(
-                len(previously_sent_user_pks)
+        # Resume the last run of this survey if it didn't finish; otherwise
+        # snapshot the users who qualify and haven't been invited yet.
+        email_campaign = (
+            EmailCampaign.objects.filter(
+                campaign=SURVEY_ACTIVE_USER_CAMPAIGN,
+                options__survey_id=options["survey_id"],
+                options__staff_test=options["staff_test"],
+                status__in=[EmailCampaign.PENDING, EmailCampaign.IN_PROGRESS],
             )
+            .order_by("-date_created")
+            .first()
         )
-        users = (
-            users.exclude(pk__in=previously_sent_user_pks)
-            .distinct()
-            .order_by("last_login")
-        )
-        logger.info("{} remaining users qualify".format(users.count()))
-        users = users[:batch_size]
-        logger.info("attempting to send to {} users".format(users.count()))
-
-        # Use a single connection to send all emails
-        connection = email_connection(backend=backend)
-        connection.open()
-
-        # send the emails
-        for user in users:
-            try:
-                send_survey_active_user_email(
-                    sender=self.__class__,
-                    connection=connection,  # passing in the connection lets us handle these in bulk
-                    user_email=user.email,
-                    user_lang=user.userprofile.lang,
-                    survey_id=options["survey_id"],
-                    survey_langs=survey_langs,
+        if email_campaign:
+            logger.info(
+                "resuming campaign {}: {} of {} users remaining".format(
+                    email_campaign.pk,
+                    email_campaign.recipients_total
+                    - email_campaign.recipients_processed,
+                    email_campaign.recipients_total,
+                )
+            )
+        else:
+            users = (
+                EmailLedger.objects.exclude_contacted(
+                    SURVEY_ACTIVE_USER_CAMPAIGN, users
                 )
-            except Exception as e:
-                logger.error(e)
+                .distinct()
+                .order_by("last_login")
+            )
+            email_campaign = create_campaign(
+                SURVEY_ACTIVE_USER_CAMPAIGN,
+                users,
+                options={
+                    "survey_id": options["survey_id"],
+                    "staff_test": options["staff_test"],
+                },
+                limit=batch_size,
+            )
+            logger.info(
+                "campaign {}: attempting to send to {} users".format(
+                    email_campaign.pk, email_campaign.recipients_total
+                )
+            )
+
+        def make_email(user):
+            return make_survey_active_user_email(
+                user_email=user.email,
+                user_lang=user.userprofile.lang,
+                survey_id=options["survey_id"],
+                survey_langs=survey_langs,
+            )
 
-        connection.close()
+        email_campaign = run_campaign(
+            email_campaign,
+            make_email,
+            # Each worker uses a single connection, and hands it each chunk's
+            # emails together
+            get_connection=lambda: email_connection(backend=backend),
+            workers=options["workers"] or 1,
+        )
+        logger.info(
+            "campaign {}: {} sent, {} failed, {} remaining".format(
+                email_campaign.pk,
+                email_campaign.recipients_sent,
+                email_campaign.recipients_failed,
+                email_campaign.recipients_total - email_campaign.recipients_processed,
+            )
+        )
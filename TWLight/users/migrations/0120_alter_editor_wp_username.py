@@ -0,0 +1,18 @@
+# Generated by Django 5.2.15 on 2026-10-19 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0119_accounterasure"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="editor",
+            name="wp_username",
+            field=models.CharField(db_index=True, help_text="Username", max_length=235),
+        ),
+    ]
@@ -38,6 +38,7 @@ from datetime import datetime, date, timedelta
 import json
 import logging
 import urllib.request, urllib.error, urllib.parse
+import uuid
 from annoying.functions import get_object_or_None
 from rest_framework import serializers
 from django.conf import settings
@@ -276,7 +277,9 @@ class Editor(models.Model):
     # Uses same field names as OAuth, but with wp_ prefixed.
     # Data are current as of the time of last TWLight login or eligibility
     # cron run, but may get out of sync at other times.
-    wp_username = models.CharField(max_length=235, help_text="Username")
+    # Indexed for the username prefix searches done by autocomplete. MySQL's
+    # default collation is case-insensitive, so istartswith can use it.
+    wp_username = models.CharField(max_length=235, db_index=True, help_text="Username")
     wp_registered = models.DateField(
         help_text="Date registered at Wikipedia", blank=True, null=True
     )
@@ -1209,3 +1212,58 @@ class Authorization(models.Model):
         # only verify this on object creation.
         else:
             validate_authorizer(self.authorizer)
+
+
+class AccountErasure(models.Model):
+    """
+    Tracks the erasure of a user's account, as requested through
+    DeleteDataView. The erasure itself runs in the background, in stages
+    (see TWLight.users.helpers.account_erasure). Every stage is safe to run
+    again, so an interrupted erasure picks up where it left off.
+    """
+
+    class Meta:
+        app_label = "users"
+        verbose_name = "account erasure"
+        verbose_name_plural = "account erasures"
+
+    PENDING = 0
+    IN_PROGRESS = 1
+    COMPLETE = 2
+    FAILED = 3
+
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (IN_PROGRESS, "In progress"),
+        (COMPLETE, "Complete"),
+        (FAILED, "Failed"),
+    )
+
+    # The status page is looked up by token, because the user it belongs to
+    # is logged out (and eventually deleted) as soon as the erasure starts.
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    # Set to null once the user has been deleted.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        help_text="The user whose account is being erased.",
+    )
+    status = models.IntegerField(choices=STATUS_CHOICES, default=PENDING)
+    stage = models.CharField(
+        max_length=32,
+        blank=True,
+        default="",
+        help_text="The last erasure stage that was completed.",
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    date_requested = models.DateTimeField(auto_now_add=True)
+    date_completed = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return "{token} - {status}".format(
+            token=self.token, status=self.get_status_display()
+        )
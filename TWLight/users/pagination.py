@@ -0,0 +1,21 @@
+from rest_framework.pagination import CursorPagination
+
+
+class AuthorizedUsersPagination(CursorPagination):
+    """
+    Keyset pagination over user primary keys. Every page is a single indexed
+    range scan, so deep pages cost the same as the first one.
+
+    Pagination is opt-in, so clients that expect the full list keep getting it.
+    """
+
+    ordering = "pk"
+    page_size = 500
+    page_size_query_param = "page_size"
+    max_page_size = 5000
+
+    def is_requested(self, request):
+        return (
+            self.cursor_query_param in request.query_params
+            or self.page_size_query_param in request.query_params
+        )
@@ -51,3 +51,41 @@ class ElegibilitySerializer(serializers.ModelSerializer):
     class Meta:
         model = Editor
         fields = ["wp_sub", "wp_username", "wp_bundle_authorized"]
+
+
+class BatchEligibilityRequestSerializer(serializers.Serializer):
+    wp_usernames = serializers.ListField(
+        child=serializers.CharField(max_length=235), required=False, default=list
+    )
+    wp_subs = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list
+    )
+
+    def validate(self, data):
+        max_lookups = self.context.get("max_lookups")
+        lookup_count = len(data["wp_usernames"]) + len(data["wp_subs"])
+        if not lookup_count:
+            raise serializers.ValidationError(
+                "Provide at least one of wp_usernames or wp_subs."
+            )
+        if max_lookups and lookup_count > max_lookups:
+            raise serializers.ValidationError(
+                "Too many users requested; the limit is {max_lookups}.".format(
+                    max_lookups=max_lookups
+                )
+            )
+        return data
+
+
+class BatchEligibilitySerializer(serializers.ModelSerializer):
+    wp_sub = serializers.IntegerField()
+    wp_username = serializers.CharField()
+    # Read from a queryset annotation rather than the Editor property, which
+    # would run further queries for each editor.
+    wp_bundle_authorized = serializers.BooleanField(
+        source="has_valid_bundle_authorization"
+    )
+
+    class Meta:
+        model = Editor
+        fields = ["wp_sub", "wp_username", "wp_bundle_authorized"]
@@ -3,26 +3,36 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.dispatch import receiver, Signal
 from django.db import transaction
-from django.db.models.signals import pre_save, post_save
-from TWLight.users.helpers.authorizations import get_all_bundle_authorizations
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from TWLight.users.groups import clear_group_cache
+from TWLight.users.helpers.authorizations import (
+    bump_partner_authorizations_version,
+    get_all_bundle_authorizations,
+)
 from TWLight.users.models import Authorization, UserProfile, Session
 from TWLight.resources.models import Partner
 
 """
 The providing_args argument was deprecated, so it will be in comment form
 for documentation purposes
-providing_args=[
+providing_args=["notices"]
+Each notice is a dict with the keys:
     "user_wp_username",
     "user_email",
     "user_lang",
     "partner_name",
     "partner_link",
-]
 """
 
 
 class Notice(object):
-    user_renewal_notice = Signal()
+    user_renewal_notices = Signal()
 
 
 class UserLoginRetrieval(object):
@@ -38,12 +48,59 @@ def clear_inactive_user_sessions(sender, instance, **kwargs):
     sessions.delete()
 
 
+@receiver(m2m_changed, sender=User.groups.through)
+def clear_group_cache_on_membership_change(sender, action, **kwargs):
+    """Cached group membership is stale once anyone's groups change."""
+    if action in ("post_add", "post_remove", "post_clear"):
+        clear_group_cache()
+
+
 @receiver(post_save, sender=Authorization)
 def delete_my_library_cache(sender, instance, **kwargs):
     """Authorizations directly impact resources in my_library, so delete my_library page cache after saving."""
     instance.user.userprofile.delete_my_library_cache()
 
 
+@receiver(post_save, sender=Authorization)
+def bump_authorizations_version_on_save(sender, instance, **kwargs):
+    """Saving an authorization can change who is authorized for its partners."""
+    bump_partner_authorizations_version(instance.partners.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Authorization)
+def stash_partners_before_authorization_delete(sender, instance, **kwargs):
+    """The partner relationships are gone by post_delete, so look them up now."""
+    instance._deleted_partner_pks = list(instance.partners.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Authorization)
+def bump_authorizations_version_on_delete(sender, instance, **kwargs):
+    bump_partner_authorizations_version(getattr(instance, "_deleted_partner_pks", []))
+
+
+@receiver(m2m_changed, sender=Authorization.partners.through)
+def bump_authorizations_version_on_partners_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """Adding or removing partners on an authorization changes who they cover."""
+    if action == "pre_clear":
+        if reverse:
+            instance._cleared_partner_pks = [instance.pk]
+        else:
+            instance._cleared_partner_pks = list(
+                instance.partners.values_list("pk", flat=True)
+            )
+    elif action == "post_clear":
+        bump_partner_authorizations_version(
+            getattr(instance, "_cleared_partner_pks", [])
+        )
+    elif action in ("post_add", "post_remove"):
+        if reverse:
+            bump_partner_authorizations_version([instance.pk])
+        else:
+            bump_partner_authorizations_version(pk_set or [])
+
+
 @receiver(pre_save, sender=Authorization)
 def validate_authorization(sender, instance, **kwargs):
     """Authorizations are generated by app code instead of ModelForm, so full_clean() before saving."""
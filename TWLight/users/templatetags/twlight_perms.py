@@ -1,6 +1,6 @@
 from django import template
 
-from TWLight.users.groups import get_coordinators, get_restricted
+from TWLight.users.groups import get_user_groups
 from TWLight.users.helpers.editor_data import editor_bundle_eligible
 from TWLight.users.models import Editor, User
 
@@ -26,8 +26,7 @@ def coordinators_only(user):
     """Return True if user is in coordinator group (or superuser), else False"""
     is_coordinator = False
     if user:
-        coordinators = get_coordinators()
-        is_coordinator = coordinators in user.groups.all() or user.is_superuser
+        is_coordinator = get_user_groups(user).is_coordinator or user.is_superuser
     return is_coordinator
 
 
@@ -36,6 +35,5 @@ def restricted(user):
     """Return True if user is in the restricted group, else False"""
     is_restricted = False
     if user:
-        restricted = get_restricted()
-        is_restricted = restricted in user.groups.all()
+        is_restricted = get_user_groups(user).is_restricted
     return is_restricted
@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
 import copy
+import csv
+import gzip
+import io
 from datetime import datetime, date, timedelta
 import json
+import os
 import re
+import tempfile
+import zipfile
 from rest_framework import exceptions as rest_exceptions
 from rest_framework.test import APIRequestFactory
 from unittest.mock import patch, Mock
@@ -36,7 +42,7 @@ from .helpers.validation import validate_partners
 from .helpers.authorizations import get_all_bundle_authorizations
 from .factories import EditorFactory, UserFactory
 from .groups import get_coordinators, get_restricted
-from .models import UserProfile, Editor, Authorization
+from .models import AccountErasure, UserProfile, Editor, Authorization, Session
 from .views import MyLibraryView, UserEligibility
 
 from TWLight.users.helpers.editor_data import (
@@ -565,6 +571,7 @@ class ViewsTestCase(TestCase):
         self.client.login(username=self.username1, password="editor")
 
         submit = self.client.post(delete_url)
+        call_command("process_account_erasures")
 
         assert not User.objects.filter(username=self.username1).exists()
         # Check that the associated Editor also got deleted.
@@ -595,6 +602,7 @@ class ViewsTestCase(TestCase):
         user_auth.partners.add(partner)
 
         submit = self.client.post(delete_url)
+        call_command("process_account_erasures")
 
         user_auth.refresh_from_db()
         self.assertEqual(user_auth.date_expires, date.today() - timedelta(days=1))
@@ -630,6 +638,7 @@ class ViewsTestCase(TestCase):
         bundle_auth_id = bundle_auth.pk
 
         submit = self.client.post(delete_url)
+        call_command("process_account_erasures")
 
         editor_count = Editor.objects.filter(pk=self.editor1.pk).count()
         self.assertEqual(editor_count, 0)
@@ -660,9 +669,92 @@ class ViewsTestCase(TestCase):
         self.client.login(username=self.username1, password="editor")
 
         submit = self.client.post(delete_url)
+        call_command("process_account_erasures")
 
         assert not User.objects.filter(username=self.username1).exists()
 
+    def test_user_delete_status(self):
+        """
+        Verify that requesting deletion deactivates the user and sends them
+        to a status page, leaving the deletion itself to the erasure job.
+        """
+        delete_url = reverse("users:delete_data", kwargs={"pk": self.user_editor.pk})
+
+        # Need a password so we can login
+        self.user_editor.set_password("editor")
+        self.user_editor.save()
+
+        self.client = Client()
+        self.client.login(username=self.username1, password="editor")
+
+        submit = self.client.post(delete_url)
+
+        erasure = AccountErasure.objects.get(user=self.user_editor)
+        status_url = reverse(
+            "users:delete_data_status", kwargs={"token": erasure.token}
+        )
+        self.assertRedirects(submit, status_url, fetch_redirect_response=False)
+        self.user_editor.refresh_from_db()
+        self.assertFalse(self.user_editor.is_active)
+        self.assertEqual(erasure.status, AccountErasure.PENDING)
+
+        call_command("process_account_erasures")
+
+        erasure.refresh_from_db()
+        self.assertEqual(erasure.status, AccountErasure.COMPLETE)
+        self.assertIsNone(erasure.user)
+        self.assertFalse(User.objects.filter(username=self.username1).exists())
+        response = self.client.get(status_url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_delete_ends_sessions(self):
+        """
+        Verify that requesting deletion logs the user out of every session,
+        including ones held through OAuthBackend, which doesn't check
+        is_active.
+        """
+        delete_url = reverse("users:delete_data", kwargs={"pk": self.user_editor.pk})
+        other_client = Client()
+        other_client.force_login(
+            self.user_editor, backend="TWLight.users.oauth.OAuthBackend"
+        )
+        self.client = Client()
+        self.client.force_login(
+            self.user_editor, backend="TWLight.users.oauth.OAuthBackend"
+        )
+
+        self.client.post(delete_url)
+
+        for client in (self.client, other_client):
+            response = client.get(reverse("users:home"))
+            self.assertFalse(response.wsgi_request.user.is_authenticated)
+        self.assertFalse(
+            Session.objects.filter(account_id=self.user_editor.pk).exists()
+        )
+
+    def test_user_delete_resumes_from_stage(self):
+        """
+        Verify that an erasure interrupted part way through picks up after the
+        last stage it completed.
+        """
+        partner = PartnerFactory()
+        application = ApplicationFactory(
+            editor=self.editor1, partner=partner, rationale="Because"
+        )
+        erasure = AccountErasure.objects.create(
+            user=self.user_editor, stage="application_versions"
+        )
+
+        call_command("process_account_erasures")
+
+        # The applications stage was recorded as done, so it wasn't rerun.
+        application.refresh_from_db()
+        self.assertEqual(application.rationale, "Because")
+        erasure.refresh_from_db()
+        self.assertEqual(erasure.status, AccountErasure.COMPLETE)
+        self.assertEqual(erasure.attempts, 1)
+        self.assertFalse(User.objects.filter(username=self.username1).exists())
+
     def test_user_data_download(self):
         """
         Verify that if users try to download their personal data they
@@ -682,6 +774,47 @@ class ViewsTestCase(TestCase):
             response.get("Content-Disposition"), "attachment; filename=user_data.json"
         )
 
+    def test_user_data_download_contents(self):
+        """
+        Verify that the streamed personal data export covers the user's
+        applications, comments, authorizations and edit count history.
+        """
+        self.user_editor2.set_password("editor")
+        self.user_editor2.save()
+        partner = PartnerFactory()
+        app = ApplicationFactory(
+            editor=self.editor2, partner=partner, rationale="For science"
+        )
+        Authorization.objects.create(
+            user=self.user_editor2, authorizer=self.user_coordinator
+        ).partners.add(partner)
+
+        self.client = Client()
+        self.client.login(username=self.username2, password="editor")
+
+        response = self.client.post(self.url2, {"download": "Download"})
+        self.assertTrue(response.streaming)
+        user_data = json.loads(b"".join(response.streaming_content))
+
+        self.assertEqual(
+            user_data["user_data"]["wp_username"], self.editor2.wp_username
+        )
+        self.assertEqual(
+            user_data["applications"][str(app.pk)]["rationale"], "For science"
+        )
+        self.assertEqual(
+            user_data["authorizations"][0]["partners"], [partner.company_name]
+        )
+        self.assertEqual(user_data["editor_logs"][0]["editcount"], 42)
+        self.assertEqual(user_data["comments"], [])
+
+        response = self.client.post(self.url2, {"download_zip": "Download as zip"})
+        self.assertEqual(
+            response.get("Content-Disposition"), "attachment; filename=user_data.zip"
+        )
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as z:
+            self.assertEqual(json.loads(z.read("user_data.json")), user_data)
+
     def test_terms_of_use_on_editor_detail_page_show(self):
         """Editor who agreed term of use, can see checkbox to disagree"""
         user_agreed_TOU = UserFactory()
@@ -2124,6 +2257,46 @@ class ManagementCommandsTestCase(TestCase):
 
         self.assertFalse(self.editor.wp_bundle_eligible)
 
+    def test_retrieve_monthly_users_command(self):
+        """
+        retrieve_monthly_users writes a gzipped CSV of last month's users and
+        emails a summary with the report attached.
+        """
+        last_month = now().replace(day=1, hour=12) - timedelta(days=10)
+        coordinator = EditorFactory().user
+        get_coordinators().user_set.add(coordinator)
+
+        approved = EditorFactory()
+        approved.user.last_login = last_month
+        approved.user.save()
+        ApplicationFactory(
+            status=Application.SENT, editor=approved, sent_by=coordinator
+        )
+        inactive = EditorFactory()
+        inactive.user.last_login = last_month
+        inactive.user.save()
+
+        with tempfile.TemporaryDirectory() as reports_root:
+            with override_settings(REPORTS_ROOT=reports_root):
+                call_command("retrieve_monthly_users")
+            (report_name,) = os.listdir(reports_root)
+            with gzip.open(os.path.join(reports_root, report_name), "rt") as report:
+                rows = list(csv.reader(report))
+
+        self.assertEqual(
+            rows[0], ["wp_username", "has_approved_apps", "has_current_auths"]
+        )
+        self.assertCountEqual(
+            rows[1:],
+            [
+                [approved.wp_username, "true", "true"],
+                [inactive.wp_username, "false", "false"],
+            ],
+        )
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("Users: 2", mail.outbox[0].body)
+        self.assertEqual(mail.outbox[0].attachments[0][0], report_name)
+
 
 class MyLibraryViewsTest(TestCase):
     @classmethod
@@ -2964,3 +3137,73 @@ class UserEligibilityAPITest(TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data, expected_json)
+
+    def test_batch_user_eligibility(self):
+        """
+        Test that the batch API endpoint resolves usernames and wp_subs together
+        in a single query, leaving out unknown users.
+        """
+        PartnerFactory(authorization_method=Partner.BUNDLE)
+        eligible_editor = EditorFactory(wp_username="Mr. Frankenstein")
+        eligible_editor.wp_bundle_eligible = True
+        eligible_editor.save()
+        eligible_editor.update_bundle_authorization()
+        ineligible_editor = EditorFactory(wp_username="Mr. Hyde")
+
+        factory = APIRequestFactory()
+        request = factory.post(
+            "/api/v0/users/eligibility/",
+            {
+                "wp_usernames": ["Mr. Frankenstein", "Dr. Nobody"],
+                "wp_subs": [ineligible_editor.wp_sub],
+            },
+            format="json",
+        )
+
+        with self.assertNumQueries(1):
+            response = views.BatchUserEligibility.as_view()(request, 0)
+
+        expected_json = sorted(
+            [
+                {
+                    "wp_sub": eligible_editor.wp_sub,
+                    "wp_username": eligible_editor.wp_username,
+                    "wp_bundle_authorized": True,
+                },
+                {
+                    "wp_sub": ineligible_editor.wp_sub,
+                    "wp_username": ineligible_editor.wp_username,
+                    "wp_bundle_authorized": False,
+                },
+            ],
+            key=lambda e: e["wp_sub"],
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, expected_json)
+
+        # GET with the same users should return the same ETag, and honor it.
+        request = factory.get(
+            "/api/v0/users/eligibility/",
+            {"wp_username": "Mr. Frankenstein", "wp_sub": ineligible_editor.wp_sub},
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        response = views.BatchUserEligibility.as_view()(request, 0)
+        self.assertEqual(response.status_code, 304)
+
+    def test_batch_user_eligibility_limit(self):
+        """
+        Test that the batch API endpoint rejects empty and oversized requests.
+        """
+        factory = APIRequestFactory()
+        request = factory.post("/api/v0/users/eligibility/", {}, format="json")
+        response = views.BatchUserEligibility.as_view()(request, 0)
+        self.assertEqual(response.status_code, 400)
+
+        request = factory.post(
+            "/api/v0/users/eligibility/",
+            {"wp_subs": list(range(views.BatchUserEligibility.max_lookups + 1))},
+            format="json",
+        )
+        response = views.BatchUserEligibility.as_view()(request, 0)
+        self.assertEqual(response.status_code, 400)
@@ -31,6 +31,11 @@ urlpatterns = [
         login_required(views.DeleteDataView.as_view()),
         name="delete_data",
     ),
+    re_path(
+        r"^delete_data/status/(?P<token>[0-9a-f-]+)/$",
+        views.AccountErasureStatusView.as_view(),
+        name="delete_data_status",
+    ),
     path(
         "my_library/",
         login_required(views.MyLibraryView.as_view()),
@@ -1,33 +1,41 @@
 import bleach
 import datetime
+import hashlib
 import json
 import logging
+import time
 from datetime import date, timedelta
 
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit
 
-from django.db.models import Q
-from django.contrib.auth import REDIRECT_FIELD_NAME
+from django.db.models import Exists, OuterRef, Q
+from django.contrib.auth import REDIRECT_FIELD_NAME, logout
 from django.contrib import messages
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.models import User
 from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.urls import reverse_lazy, resolve, Resolver404, reverse
-from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
 from django.views.decorators.vary import vary_on_headers
 from django.views.decorators.cache import cache_page
 from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import condition
 from django.views.generic.base import TemplateView, View, RedirectView
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import UpdateView, FormView, DeleteView
 from django.views.generic.list import ListView
-from django.utils.cache import learn_cache_key
+from django.utils.cache import get_conditional_response, learn_cache_key
 from django.utils.decorators import classonlymethod, method_decorator
-from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils.http import quote_etag, url_has_allowed_host_and_scheme
 from django.utils.translation import gettext_lazy as _
-from django_comments.models import Comment
 from django.utils import timezone
 from django.utils.translation import get_language
 
@@ -40,6 +48,11 @@ from TWLight.view_mixins import (
     test_func_coordinators_only,
 )
 from TWLight.users.groups import get_coordinators, get_restricted
+from TWLight.users.helpers.authorizations import (
+    get_partner_authorizations_version,
+    get_valid_bundle_authorizations,
+)
+from TWLight.users.helpers.data_export import iter_user_data_json, iter_user_data_zip
 from TWLight.users.helpers.editor_data import editor_bundle_eligible
 
 from rest_framework import status
@@ -47,7 +60,6 @@ from rest_framework.authentication import SessionAuthentication, TokenAuthentica
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from reversion.models import Version
 
 from .forms import (
     EditorUpdateForm,
@@ -58,8 +70,11 @@ from .forms import (
     UserEmailForm,
     CoordinatorEmailForm,
 )
-from .models import Editor, UserProfile, Authorization
+from .models import AccountErasure, Editor, Session, UserProfile, Authorization
+from .pagination import AuthorizedUsersPagination
 from .serializers import (
+    BatchEligibilityRequestSerializer,
+    BatchEligibilitySerializer,
     FavoriteCollectionSerializer,
     UserSerializer,
     ElegibilitySerializer,
@@ -68,6 +83,10 @@ from TWLight.applications.models import Application
 
 logger = logging.getLogger(__name__)
 
+# How long AuthorizedUsers responses are cached server-side. The cache key
+# changes along with the data, so this mostly bounds Bundle staleness.
+AUTHORIZED_USERS_CACHE_TIMEOUT = 60 * 60
+
 # Build an empty response object
 vary_response = HttpResponse()
 # Add the same vary header used in the `vary_on_headers` decorator
@@ -202,44 +221,21 @@ class EditorDetailView(PartnerCoordinatorOrSelf, DetailView):
 
     def post(self, request, *args, **kwargs):
         editor = self.get_object()
-        if "download" in request.POST:
+        if "download" in request.POST or "download_zip" in request.POST:
             # When users click the Download button in the Data section of
             # their user page, provide a json with any personal information
-            # they submitted to the site.
-
-            user_json = {}
-            editor_data = Editor.objects.get(pk=editor.pk)
-
-            user_json["user_data"] = {}
-            user_field_list = [
-                "wp_username",
-                "contributions",
-                "real_name",
-                "country_of_residence",
-                "affiliation",
-            ]
-            for field in user_field_list:
-                field_data = getattr(editor_data, field)
-                if field_data:
-                    user_json["user_data"][field] = field_data
-
-            user_apps = Application.objects.filter(editor=editor)
-            user_json["applications"] = {}
-            for app in user_apps:
-                user_json["applications"][app.id] = {}
-                for field in ["rationale", "comments", "account_email"]:
-                    field_data = getattr(app, field)
-                    if field_data:
-                        user_json["applications"][app.id][field] = field_data
-
-            user_comments = Comment.objects.filter(user_id=editor.user.id)
-            user_json["comments"] = []
-            for comment in user_comments:
-                user_json["comments"].append(comment.comment)
-
-            json_data = json.dumps(user_json, indent=2)
-            response = HttpResponse(json_data, content_type="application/json")
-            response["Content-Disposition"] = "attachment; filename=user_data.json"
+            # they submitted to the site. It's streamed as it's read from the
+            # database, since long-time users can have a lot of history.
+            if "download_zip" in request.POST:
+                response = StreamingHttpResponse(
+                    iter_user_data_zip(editor), content_type="application/zip"
+                )
+                response["Content-Disposition"] = "attachment; filename=user_data.zip"
+            else:
+                response = StreamingHttpResponse(
+                    iter_user_data_json(editor), content_type="application/json"
+                )
+                response["Content-Disposition"] = "attachment; filename=user_data.json"
             return response
 
         if "update_email_settings" in request.POST:
@@ -573,58 +569,43 @@ class DeleteDataView(SelfOnly, DeleteView):
     def get_object(self, queryset=None):
         return User.objects.get(pk=self.kwargs["pk"])
 
-    # We want to blank applications too, not just delete the user
-    # object, so we need to overwrite delete()
+    # Deleting everything a long-standing user has touched can take a while,
+    # so we hand it off to the account erasure job and point the user at a
+    # status page instead.
     def form_valid(self, form):
         user = self.get_object()
 
-        user_applications = user.editor.applications.all()
-        for user_app in user_applications:
-            # Blank any user data from this app
-            user_app.rationale = "[deleted]"
-            user_app.account_email = "[deleted]"
-            user_app.comments = "[deleted]"
+        erasure = (
+            AccountErasure.objects.filter(user=user)
+            .exclude(status=AccountErasure.FAILED)
+            .first()
+        )
+        if erasure is None:
+            erasure = AccountErasure.objects.create(user=user)
+
+        # OAuthBackend doesn't check is_active, so deactivating the user
+        # isn't enough to keep them out until the erasure job deletes the
+        # account; their sessions have to go too.
+        user.is_active = False
+        user.save()
+        logout(self.request)
+        Session.objects.filter(account_id=user.pk).delete()
+
+        return HttpResponseRedirect(
+            reverse("users:delete_data_status", kwargs={"token": erasure.token})
+        )
 
-            user_app.save()
 
-            # Delete the app's version history
-            app_versions = Version.objects.get_for_object_reference(
-                Application, user_app.pk
-            )
-            for app_version in app_versions:
-                app_version.delete()
-
-        # Also blank any comments left by this user, including their
-        # username and email, which is duplicated in the comment object.
-        for user_comment in Comment.objects.filter(user=user):
-            user_comment.user_name = ""
-            user_comment.user_email = ""
-            user_comment.comment = "[deleted]"
-            user_comment.save()
-
-        # Expire any expiry date authorizations, but keep the object.
-        for user_authorization in Authorization.objects.filter(
-            user=user, date_expires__isnull=False
-        ):
-            user_authorization.date_expires = date.today() - timedelta(days=1)
-            user_authorization.save()
-
-        # Delete any bundle authorizations.
-        bundle_auths = user.editor.get_bundle_authorization
-        if bundle_auths:
-            bundle_auths.delete()
-
-        # Did the user authorize any authorizations?
-        # If so, we need to retain their validity by shifting
-        # the authorizer to TWL Team
-        twl_team = User.objects.get(username="TWL Team")
-        for authorization in Authorization.objects.filter(authorizer=user):
-            authorization.authorizer = twl_team
-            authorization.save()
-
-        user.delete()
-
-        return super().form_valid(form)
+class AccountErasureStatusView(DetailView):
+    """
+    Lets a user check on the progress of their account deletion. This is
+    looked up by an unguessable token, since the user has been logged out.
+    """
+
+    model = AccountErasure
+    template_name = "users/account_erasure_status.html"
+    slug_field = "token"
+    slug_url_kwarg = "token"
 
 
 class TermsView(UpdateView):
@@ -713,6 +694,42 @@ class TermsView(UpdateView):
             return reverse_lazy("users:my_library")
 
 
+def _authorized_users_cache_key(partner):
+    """
+    Builds a key that changes whenever the AuthorizedUsers output for a partner
+    might change: on authorization changes, at midnight (when authorizations
+    expire), and, for Bundle partners, every cache window (because the output
+    depends on recent logins).
+    """
+    key = "authorized_users_{pk}_{version}_{today}".format(
+        pk=partner.pk,
+        version=get_partner_authorizations_version(partner.pk),
+        today=date.today().isoformat(),
+    )
+    if partner.authorization_method == Partner.BUNDLE:
+        key += "_{window}".format(
+            window=int(time.time() // AUTHORIZED_USERS_CACHE_TIMEOUT)
+        )
+    return key
+
+
+def _authorized_users_etag(request, pk, version, format=None):
+    try:
+        partner = Partner.even_not_available.only("pk", "authorization_method").get(
+            pk=pk
+        )
+    except Partner.DoesNotExist:
+        return None
+
+    # Pages and the full list are different representations of the same data.
+    query = request.META.get("QUERY_STRING", "")
+    return hashlib.md5(
+        "{key}?{query}".format(
+            key=_authorized_users_cache_key(partner), query=query
+        ).encode("utf-8")
+    ).hexdigest()
+
+
 class AuthorizedUsers(APIView):
     """
     API endpoint returning the list of users authorized to access a specific
@@ -720,12 +737,47 @@ class AuthorizedUsers(APIView):
     uses the full list of sent applications.
     This is used for the Wikilink tool, which needs to know who has access
     to what to track data about their citation habits.
+
+    By default the full list is returned, and cached per partner. Clients
+    can instead pass `page_size` (and then follow the `next` cursor) for
+    keyset-paginated results, or `stream=true` to have the full list streamed
+    as it is read from the database. Responses carry an ETag, so polling
+    clients can send If-None-Match and get a 304 until authorizations change.
     """
 
     authentication_classes = (TokenAuthentication,)
     # TODO: We might want to set up more granular permissions for future APIs.
     permission_classes = (IsAuthenticated,)
 
+    @staticmethod
+    def get_authorized_users(partner):
+        valid_partner_auths = partner.get_valid_authorizations
+
+        # For Bundle partners, get auths for users who logged in within the last 2 weeks.
+        if partner.authorization_method == partner.BUNDLE:
+            valid_partner_auths = valid_partner_auths.filter(
+                user__last_login__gt=timezone.now() - timedelta(weeks=2)
+            )
+
+        # A subquery on user_id keeps each user to a single row without
+        # needing distinct() over the join.
+        return (
+            User.objects.filter(pk__in=valid_partner_auths.values("user_id"))
+            .select_related("editor")
+            .order_by("pk")
+        )
+
+    @staticmethod
+    def stream_authorized_users(users):
+        yield "["
+        wp_usernames = users.values_list("editor__wp_username", flat=True)
+        for i, wp_username in enumerate(wp_usernames.iterator(chunk_size=2000)):
+            if i:
+                yield ","
+            yield json.dumps({"wp_username": wp_username})
+        yield "]"
+
+    @method_decorator(condition(etag_func=_authorized_users_etag))
     def get(self, request, pk, version, format=None):
         try:
             partner = Partner.even_not_available.get(pk=pk)
@@ -733,18 +785,26 @@ class AuthorizedUsers(APIView):
             message = "Couldn't find a partner with this ID."
             return Response(message, status=status.HTTP_404_NOT_FOUND)
 
-        valid_partner_auths = partner.get_valid_authorizations
+        users = self.get_authorized_users(partner)
 
-        # For Bundle partners, get auths for users who logged in within the last 2 weeks.
-        if partner.authorization_method == partner.BUNDLE:
-            valid_partner_auths = valid_partner_auths.filter(
-                user__last_login__gt=timezone.now() - timedelta(weeks=2)
+        paginator = AuthorizedUsersPagination()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(users, request, view=self)
+            serializer = UserSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
+        if request.query_params.get("stream") == "true":
+            return StreamingHttpResponse(
+                self.stream_authorized_users(users), content_type="application/json"
             )
 
-        users = User.objects.filter(authorizations__in=valid_partner_auths).distinct()
+        cache_key = _authorized_users_cache_key(partner)
+        data = cache.get(cache_key)
+        if data is None:
+            data = list(UserSerializer(users, many=True).data)
+            cache.set(cache_key, data, AUTHORIZED_USERS_CACHE_TIMEOUT)
 
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        return Response(data)
 
 
 class ListApplicationsUserView(SelfOnly, ListView):
@@ -769,6 +829,7 @@ class ListApplicationsUserView(SelfOnly, ListView):
         context["object_list"] = (
             editor.applications.model.include_invalid.filter(editor=editor)
             .exclude(partner__authorization_method=Partner.BUNDLE)
+            .for_coordinator_list()
             .order_by("status", "-date_closed")
         )
         return context
@@ -1293,3 +1354,66 @@ class UserEligibility(APIView):
             return Response(serializer.data)
         else:
             return Response(message, status=status.HTTP_400)
+
+
+class BatchUserEligibility(APIView):
+    """
+    API endpoint returning whether each of a list of users is eligible to use
+    The Wikipedia Library, so that tools checking many users don't need one
+    request per user.
+
+    POST a JSON body of {"wp_usernames": [...], "wp_subs": [...]}, or GET with
+    repeated wp_username and wp_sub query parameters. Users we don't know
+    about are left out of the response. Responses carry an ETag; GET requests
+    sending a matching If-None-Match get a 304.
+    """
+
+    max_lookups = 100
+
+    def get(self, request, version, format=None):
+        return self.eligibility_response(
+            request,
+            {
+                "wp_usernames": request.query_params.getlist("wp_username"),
+                "wp_subs": request.query_params.getlist("wp_sub"),
+            },
+        )
+
+    def post(self, request, version, format=None):
+        return self.eligibility_response(request, request.data)
+
+    def eligibility_response(self, request, data):
+        request_serializer = BatchEligibilityRequestSerializer(
+            data=data, context={"max_lookups": self.max_lookups}
+        )
+        if not request_serializer.is_valid():
+            return Response(
+                request_serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # A single query, with the bundle authorization check folded in.
+        editors = (
+            Editor.objects.filter(
+                Q(wp_username__in=request_serializer.validated_data["wp_usernames"])
+                | Q(wp_sub__in=request_serializer.validated_data["wp_subs"])
+            )
+            .annotate(
+                has_valid_bundle_authorization=Exists(
+                    get_valid_bundle_authorizations().filter(user=OuterRef("user"))
+                )
+            )
+            .order_by("wp_sub")
+        )
+        data = BatchEligibilitySerializer(editors, many=True).data
+
+        etag = quote_etag(
+            hashlib.md5(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+        )
+        if request.method in ("GET", "HEAD"):
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified:
+                return not_modified
+
+        response = Response(data)
+        response["ETag"] = etag
+        return response
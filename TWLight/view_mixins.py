@@ -23,7 +23,7 @@ from TWLight.applications.models import Application
 from TWLight.resources.models import Partner
 from TWLight.users.models import Editor
 from TWLight.users.helpers.editor_data import editor_bundle_eligible
-from TWLight.users.groups import COORDINATOR_GROUP_NAME, RESTRICTED_GROUP_NAME
+from TWLight.users.groups import get_user_groups
 
 import logging
 
@@ -45,7 +45,7 @@ class BaseObj(object):
 def test_func_coordinators_only(user):
     obj_coordinator_test = user.is_superuser  # Skip subsequent test if superuser.
     if not obj_coordinator_test:
-        obj_coordinator_test = user.groups.filter(name=COORDINATOR_GROUP_NAME).exists()
+        obj_coordinator_test = get_user_groups(user).is_coordinator
     return obj_coordinator_test
 
 
@@ -88,7 +88,7 @@ def test_func_partner_coordinator(obj, user):
     )  # Skip subsequent test if superuser.
     if not obj_partner_coordinator_test:
         # If the user is a coordinator run more tests
-        if obj and user.groups.filter(name=COORDINATOR_GROUP_NAME).exists():
+        if obj and get_user_groups(user).is_coordinator:
             # Return true if the object is an editor and has
             # at least one application to a partner for whom
             # the user is a designated coordinator.
@@ -329,7 +329,7 @@ class EmailRequired(object):
 
 
 def test_func_data_processing_required(user):
-    return user.groups.filter(name=RESTRICTED_GROUP_NAME).exists()
+    return get_user_groups(user).is_restricted
 
 
 class DataProcessingRequired(object):